@@ -4,30 +4,90 @@ AI Agent with free text input and command support.
 
 This version supports both free text conversation and command invocation using
 backslash commands like \\s, \\lt, etc. It renders markdown in real-time as responses stream.
+
+When stdout is not a terminal (or --cmd/--headless is given) it runs headless:
+input is read from stdin and tokens are written to stdout as they arrive, e.g.
+
+    git diff | capture.py --cmd cr > review.md
+
+`capture.py index <repo>` embeds a repository's code so that code commands
+get the most relevant parts of it as context.
 """
 
 from models.model_manager import ModelManager
+from models.model_router import ModelRouter
+from models.token_budget import model_family
 from service.live_markdown_processor import LiveMarkdownProcessor
+from service.headless_processor import HeadlessProcessor
+from service.map_reduce_summarizer import build_summarizer
+from service.code_index import build_code_index
+from service.conversation_compactor import ConversationCompactor
+from service.session_store import SessionStore
+from service.exchange_retriever import ExchangeRetriever
 from service.utils.clipboard_utils import ClipboardUtils
 from rich.console import Console
 from rich import print as rprint
 from configuration.config import config
+from contextlib import nullcontext, redirect_stdout
+import argparse
+import os
 import re
+import sys
 import time
 
 
+FOLLOW_UP_INSTRUCTIONS = (
+    "Please answer the user's follow-up question considering the previous conversation. "
+    "Reference relevant parts of our previous discussion when helpful."
+)
+
+
 class ChatAIAgent:
     """AI Agent with free text input and command support"""
     
-    def __init__(self, config, model_manager):
+    def __init__(self, config, model_manager, headless=False):
         self.config = config
         self.model_manager = model_manager
-        self.text_processor = LiveMarkdownProcessor(model_manager)
+        if headless:
+            self.text_processor = HeadlessProcessor(model_manager)
+        else:
+            self.text_processor = LiveMarkdownProcessor(model_manager)
+        # Commands always raced across the configured racing models
+        self.text_processor.race_commands = set(config.get("racing", {}).get("commands", []))
+        # Cheap tasks go to fast models; only heavy ones pay for the big one
+        self.text_processor.router = ModelRouter(config.get("routing", {}).get("rules", []))
+        # Large documents are summarized part by part, in parallel
+        self.text_processor.summarizer = build_summarizer(config, model_manager)
+        # Code commands get relevant code from repositories indexed with `capture.py index`
+        if not headless:
+            code_index = build_code_index(config)
+            # Nothing to load until something has been indexed
+            if code_index is not None and len(code_index):
+                self.text_processor.code_index = code_index.start()
         self.console = Console()
         
-        # Conversation context for follow-up questions
-        self.conversation_history = []
-        self.max_history_length = 10  # Keep last 10 exchanges
+        # Turn log for follow-up questions, compacted into a rolling summary
+        # on a cheap model once it outgrows its token budget
+        conversation_config = config.get("conversation", {})
+        self.conversation = ConversationCompactor(
+            model_manager,
+            max_history_tokens=conversation_config.get("max_history_tokens", 8000),
+            keep_recent_tokens=conversation_config.get("keep_recent_tokens", 4000),
+            summary_model=conversation_config.get("summary_model"),
+            max_fold_tokens=conversation_config.get("max_fold_tokens"),
+        )
+        # Every exchange is also saved to disk so sessions can be searched and resumed
+        session_config = config.get("session_store", {})
+        self.session_store = None
+        if session_config.get("enabled") and not headless:
+            self.session_store = SessionStore(session_config.get("path", "~/.cache/my-dev-agent/sessions.sqlite3"))
+        self.session_id = SessionStore.new_session_id()
+        # Follow-ups also get the most relevant older exchanges, found by
+        # embedding similarity, instead of the whole saved history
+        retrieval_config = config.get("retrieval", {})
+        self.retriever = None
+        if retrieval_config.get("enabled") and self.session_store is not None:
+            self.retriever = self._load_retriever(retrieval_config)
         
         self.command_map = {
             "\\s": ("summarize", self.text_processor.summarize_text),
@@ -49,54 +109,164 @@ class ChatAIAgent:
             "🔧 Utils": ["\\n"]
         }
 
-    def add_to_conversation_history(self, user_input, ai_response):
-        """Add exchange to conversation history"""
-        self.conversation_history.append({
-            "user": user_input,
-            "assistant": ai_response,
-            "timestamp": time.time()
-        })
-        
-        # Keep only the last N exchanges to prevent memory bloat
-        if len(self.conversation_history) > self.max_history_length:
-            self.conversation_history = self.conversation_history[-self.max_history_length:]
+    def _load_retriever(self, retrieval_config):
+        model_name = retrieval_config.get("model", "all-MiniLM-L6-v2")
+
+        def load_embedder():
+            from models.embeddings import SentenceEmbedder
+            return SentenceEmbedder.load(model_name)
+
+        return ExchangeRetriever(
+            self.session_store,
+            load_embedder,
+            index_path=retrieval_config.get("path"),
+            top_k=retrieval_config.get("top_k", 4),
+            max_tokens=retrieval_config.get("max_tokens", 2000),
+            min_similarity=retrieval_config.get("min_similarity", 0.35),
+        ).start()
+
+    def add_to_conversation_history(self, user_input, ai_response, command=None):
+        """Add an exchange to the turn log and the session store"""
+        self.conversation.add(user_input, ai_response, command)
+        if self.session_store is not None:
+            self.session_store.append(self.session_id, user_input, ai_response, command)
+    
+    def show_sessions(self):
+        """List the most recent saved sessions"""
+        from rich.table import Table
+        
+        if self.session_store is None:
+            rprint("[yellow]⚠️  The session store is disabled in the configuration[/yellow]")
+            return
+        sessions = self.session_store.sessions()
+        if not sessions:
+            rprint("[dim]🗂️  No saved sessions yet[/dim]")
+            return
+        table = Table(title="🗂️  Recent sessions", border_style="dim")
+        table.add_column("Id", style="cyan")
+        table.add_column("Last used")
+        table.add_column("Exchanges", justify="right")
+        table.add_column("Started with")
+        for session in sessions:
+            current = " (current)" if session["id"] == self.session_id else ""
+            table.add_row(
+                session["id"] + current,
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(session["updated_at"])),
+                str(session["exchanges"]),
+                session["title"],
+            )
+        rprint(table)
+        rprint("[dim]Use \\resume <id> to continue a session[/dim]")
     
-    def get_conversation_context(self):
-        """Get formatted conversation context for follow-up questions"""
-        if not self.conversation_history:
-            return ""
-        
-        context_parts = ["Previous conversation context:"]
-        for i, exchange in enumerate(self.conversation_history[-3:], 1):  # Last 3 exchanges
-            context_parts.append(f"\nExchange {i}:")
-            context_parts.append(f"User: {exchange['user'][:200]}{'...' if len(exchange['user']) > 200 else ''}")
-            context_parts.append(f"Assistant: {exchange['assistant'][:300]}{'...' if len(exchange['assistant']) > 300 else ''}")
-        
-        return "\n".join(context_parts)
+    def resume_session(self, session_id):
+        """Replace the conversation with a saved session and keep appending to it"""
+        if self.session_store is None:
+            rprint("[yellow]⚠️  The session store is disabled in the configuration[/yellow]")
+            return
+        # Exchanges of the current session may still be queued for writing
+        self.session_store.flush()
+        full_id = self.session_store.resolve(session_id)
+        if full_id is None:
+            rprint(f"[red]❌ No single session matches '{session_id}'[/red]")
+            return
+        exchanges = self.session_store.exchanges(full_id)
+        # Only the recent tail is reloaded; replaying everything would re-summarize the session
+        self.conversation.load(exchanges)
+        self.session_id = full_id
+        rprint(f"[green]✅ Resumed session {full_id} ({len(exchanges)} exchanges) • Use \\f to follow up[/green]")
+    
+    def search_sessions(self, text):
+        """Find saved exchanges containing every word of ``text``"""
+        if self.session_store is None:
+            rprint("[yellow]⚠️  The session store is disabled in the configuration[/yellow]")
+            return
+        self.session_store.flush()
+        results = self.session_store.search(text)
+        if not results:
+            rprint(f"[dim]🔍 Nothing found for '{text}'[/dim]")
+            return
+        for result in results:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(result["timestamp"]))
+            preview = " ".join(result["user"].split())[:80]
+            rprint(f"[cyan]{result['session_id']}[/cyan] [dim]{when} #{result['position'] + 1}[/dim] {preview}")
     
     def handle_followup_question(self, question):
         """Handle follow-up questions with conversation context"""
-        if not self.conversation_history:
+        if not self.conversation.turns and not self.conversation.summary:
             rprint("[yellow]⚠️  No previous conversation to follow up on. Starting fresh conversation...[/yellow]")
             return self.text_processor.generate_response(question)
         
-        # Build context-aware prompt
-        context = self.get_conversation_context()
-        contextual_prompt = f"""{context}
-
-Current follow-up question: {question}
-
-Please answer the follow-up question considering the previous conversation context. Reference relevant parts of our previous discussion when helpful."""
-        
-        return self.text_processor._stream_with_live_markdown(contextual_prompt, "🔄 Follow-up Response")
+        # Recent turns are sent verbatim as messages and older ones as a summary
+        # in the instructions; both only change when new turns are added or
+        # compacted, so the provider can serve them from its prompt cache
+        messages = self.conversation.messages()
+        context = None
+        if self.retriever is not None:
+            sent = {message["content"] for message in messages if message["role"] == "user"}
+            family = model_family(self.model_manager.default_model)
+            context = ExchangeRetriever.format_context(self.retriever.retrieve(question, exclude=sent, family=family))
+        return self.text_processor._stream_with_live_markdown(
+            question,
+            "🔄 Follow-up Response",
+            command="follow_up",
+            system=self.conversation.system_prompt(FOLLOW_UP_INSTRUCTIONS),
+            context=context,
+            messages=messages,
+        )
     
     def show_conversation_status(self):
         """Show current conversation status"""
-        if self.conversation_history:
-            rprint(f"[dim]💭 Conversation history: {len(self.conversation_history)} exchanges • Use \\f for follow-up questions[/dim]")
+        # Compaction runs in the background, so its errors are shown here
+        compaction_error = self.conversation.pop_error()
+        if compaction_error:
+            rprint(f"[yellow]⚠️  {compaction_error}[/yellow]")
+        if self.conversation.turns or self.conversation.summary:
+            summarized = " + summary" if self.conversation.summary else ""
+            rprint(f"[dim]💭 Conversation history: {len(self.conversation)} exchanges{summarized} • Use \\f for follow-up questions[/dim]")
         else:
             rprint(f"[dim]💭 New conversation • All responses will be saved for follow-up context[/dim]")
 
+    def show_stats(self):
+        """Show latency and throughput percentiles per model and per command"""
+        from rich.table import Table
+        
+        def fmt(value, unit="s"):
+            if value is None:
+                return "-"
+            return f"{value:.2f}{unit}" if unit == "s" else f"{value:.0f}"
+        
+        for group_by in ("model", "command"):
+            summary = self.model_manager.metrics.summary(group_by=group_by)
+            if not summary:
+                rprint("[dim]📊 No requests recorded yet[/dim]")
+                return
+            
+            table = Table(title=f"📊 Request stats per {group_by}", border_style="dim")
+            table.add_column(group_by.capitalize(), style="cyan")
+            table.add_column("Requests", justify="right")
+            table.add_column("Errors", justify="right")
+            table.add_column("Cached", justify="right")
+            table.add_column("Prompt cache read/write", justify="right")
+            table.add_column("TTFT p50/p95/p99", justify="right")
+            table.add_column("Total p50/p95/p99", justify="right")
+            table.add_column("Tokens/s p50/p95/p99", justify="right")
+            
+            for key, stats in sorted(summary.items()):
+                ttft = stats["time_to_first_token"]
+                total = stats["total_latency"]
+                tps = stats["tokens_per_second"]
+                table.add_row(
+                    key,
+                    str(stats["count"]),
+                    str(stats["errors"]),
+                    str(stats["cache_hits"]),
+                    f"{stats['prompt_cache_read_tokens']:,} / {stats['prompt_cache_write_tokens']:,}",
+                    " / ".join(fmt(ttft[p]) for p in ("p50", "p95", "p99")),
+                    " / ".join(fmt(total[p]) for p in ("p50", "p95", "p99")),
+                    " / ".join(fmt(tps[p], unit="") for p in ("p50", "p95", "p99")),
+                )
+            rprint(table)
+
     def show_smart_help(self):
         """Smart contextual help display with progressive disclosure"""
         from rich.panel import Panel
@@ -118,6 +288,9 @@ Please answer the follow-up question considering the previous conversation conte
         help_content.append("[dim]  • Type naturally for conversation[/dim]")
         help_content.append("[dim]  • Use \\<cmd> for specific functions[/dim]")
         help_content.append("[dim]  • Type 'help' for all commands[/dim]")
+        help_content.append("[dim]  • Type 'stats' for latency and throughput stats[/dim]")
+        help_content.append("[dim]  • Prefix with 'race' (e.g. race \\cr) to race providers for the fastest answer[/dim]")
+        help_content.append("[dim]  • Type \\sessions, \\resume <id> or \\search <text> for saved sessions[/dim]")
         
         panel = Panel(
             "\n".join(help_content),
@@ -323,6 +496,28 @@ Please answer the follow-up question considering the previous conversation conte
             rprint(f"[yellow]⚠️  Streaming not supported for {default_model}[/yellow]")
             rprint("[dim]Using traditional response mode with final markdown rendering[/dim]")
 
+    def parse_race_prefix(self, user_input):
+        """Split off a leading 'race' before a command, e.g. 'race \\cr'; returns (race, rest of input)"""
+        rest = user_input[len("race "):].strip()
+        if user_input.lower().startswith("race ") and rest.startswith("\\"):
+            return True, rest
+        return False, user_input
+
+    def run_headless(self, command, text, race=False):
+        """Process a single input without the interactive UI, streaming tokens to stdout"""
+        command_func = self.text_processor.generate_response
+        if command:
+            command = command if command.startswith("\\") else f"\\{command}"
+            if command not in self.command_map:
+                print(f"Unknown command: {command}", file=sys.stderr)
+                return None
+            _, command_func = self.command_map[command]
+        
+        # Diagnostics from the model layer go to stderr so stdout only carries the response
+        racing = self.text_processor.racing() if race else nullcontext()
+        with redirect_stdout(sys.stderr), racing:
+            return command_func(text)
+
     def run(self):
         """Main interaction loop with smart UI"""
         self.show_streaming_info()
@@ -336,15 +531,36 @@ Please answer the follow-up question considering the previous conversation conte
             
             if user_input.lower() == "q":
                 rprint("[bold red]👋 Exiting...[/bold red]")
+                if self.session_store is not None:
+                    self.session_store.close()
                 break
             
+            # Backslash forms, so prompts starting with "search" or "resume" still reach the model
+            if user_input.lower() == "\\sessions":
+                self.show_sessions()
+                continue
+            
+            if user_input.lower().startswith("\\resume "):
+                self.resume_session(user_input[len("\\resume "):].strip())
+                continue
+            
+            if user_input.lower().startswith("\\search "):
+                self.search_sessions(user_input[len("\\search "):].strip())
+                continue
+            
             if user_input.lower() == "help":
                 rprint("\n[bold blue]📖 Complete Command Reference:[/bold blue]")
                 self.show_full_command_reference()
                 continue
                 
+            if user_input.lower() == "stats":
+                self.show_stats()
+                continue
+                
             if user_input.lower() == "clear":
-                self.conversation_history = []
+                self.conversation.clear()
+                # The cleared conversation stays saved; new exchanges start a new session
+                self.session_id = SessionStore.new_session_id()
                 rprint("[green]✅ Conversation history cleared[/green]")
                 continue
             
@@ -363,16 +579,20 @@ Please answer the follow-up question considering the previous conversation conte
                 self.show_autocomplete_preview(user_input)
                 
             try:
+                race, user_input = self.parse_race_prefix(user_input)
                 command, remaining_text = self.parse_input(user_input)
                 ai_response = None
+                asked = remaining_text
+                racing = self.text_processor.racing() if race else nullcontext()
                 
                 if command:
                     # Process command
-                    text_to_process = self.get_text_for_processing(command, remaining_text)
+                    text_to_process = asked = self.get_text_for_processing(command, remaining_text)
                     if text_to_process:
-                        rprint(f"\n[dim]🔧 Processing with command: {command}[/dim]")
+                        rprint(f"\n[dim]🔧 Processing with command: {command}{' (racing)' if race else ''}[/dim]")
                         _, command_func = self.command_map[command]
-                        ai_response = command_func(text_to_process)
+                        with racing:
+                            ai_response = command_func(text_to_process)
                 else:
                     # Free text conversation - show contextual suggestions if helpful
                     if len(remaining_text) > 10:  # Only for substantial input
@@ -383,7 +603,7 @@ Please answer the follow-up question considering the previous conversation conte
                 
                 # Save to conversation history if we got a response
                 if ai_response:
-                    self.add_to_conversation_history(user_input, ai_response)
+                    self.add_to_conversation_history(asked, ai_response, command)
                     
             except KeyboardInterrupt:
                 rprint("\n[yellow]⏸️  Interrupted. Continue or type 'q' to quit.[/yellow]")
@@ -392,8 +612,64 @@ Please answer the follow-up question considering the previous conversation conte
                 # Don't raise in interactive mode, just continue
 
 
-def main():
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="AI Agent with free text input and command support")
+    parser.add_argument("--cmd", help="command to run headless, e.g. 'cr' or 's' (free response if omitted)")
+    parser.add_argument("--headless", action="store_true", help="stream raw tokens to stdout instead of the live UI")
+    parser.add_argument("--race", action="store_true", help="race the configured providers and stream the fastest")
+    parser.add_argument("text", nargs="*", help="input text (read from stdin when omitted)")
+    return parser.parse_args(argv)
+
+
+def main_headless(args):
+    """Run a single command headless, reading input from the arguments or stdin"""
+    text = " ".join(args.text) if args.text else ""
+    if not text and not sys.stdin.isatty():
+        text = sys.stdin.read()
+    if not text.strip():
+        print("No input provided on stdin or the command line", file=sys.stderr)
+        return 1
+    
+    model_manager = ModelManager(config)
+    agent = ChatAIAgent(config, model_manager=model_manager, headless=True)
+    response = agent.run_headless(args.cmd, text, race=args.race)
+    return 0 if response else 1
+
+
+def main_index(argv):
+    """Index or re-index the code of a repository for code commands"""
+    parser = argparse.ArgumentParser(prog="capture.py index", description="Index a repository for code commands")
+    parser.add_argument("repo", nargs="?", default=".", help="repository to index (default: current directory)")
+    args = parser.parse_args(argv)
+    
+    # Indexing was asked for explicitly, even if code context is switched off
+    code_index = build_code_index(dict(config, code_index=dict(config.get("code_index", {}), enabled=True)))
+    rprint(f"[dim]Indexing {os.path.realpath(args.repo)}...[/dim]")
+    try:
+        counts = code_index.update(args.repo, on_progress=lambda path: rprint(f"[dim]  {path}[/dim]"))
+        chunks = len(code_index)
+    except Exception as e:
+        rprint(f"[bold red]❌ Indexing failed: {e}[/bold red]")
+        return 1
+    finally:
+        code_index.close()
+    rprint(
+        f"[green]✅ {counts['indexed']} files indexed, {counts['unchanged']} unchanged, "
+        f"{counts['removed']} removed ({chunks} chunks in the index)[/green]"
+    )
+    return 0
+
+
+def main(argv=None):
     """Main function to run the AI agent with free text and command support"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["index"]:
+        return main_index(argv[1:])
+    args = parse_args(argv)
+    if args.headless or args.cmd or not sys.stdout.isatty():
+        return main_headless(args)
+    
     try:
         # Initialize model manager
         model_manager = ModelManager(config)
@@ -416,4 +692,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import threading
+import time
+from urllib.parse import unquote
+
+
+THROTTLING_ERROR_CODES = ("ThrottlingException", "TooManyRequestsException")
+
+
+class BedrockClientPool:
+    """
+    Thread-safe bedrock-runtime clients, one per region.
+
+    botocore clients are safe to share between threads, so every request to
+    a region reuses the same client and its urllib3 connection pool.
+    ``max_pool_connections`` bounds how many sockets concurrent requests can
+    hold open and TCP keep-alive stops idle sockets from being dropped.
+
+    ``prewarm`` resolves credentials and opens a TLS connection in the
+    background so the first prompt doesn't pay for DNS, TLS and the
+    credential chain; with ``rewarm_after_idle`` it is repeated whenever the
+    pool has been unused that long. Callers holding on to a client report
+    each request with ``mark_used``.
+
+    ``on_throttle(model_id)`` is called for every throttled attempt, including
+    the ones botocore retries on its own.
+    """
+
+    def __init__(self, region, profile=None, max_pool_connections=10, tcp_keepalive=True,
+                 max_attempts=6, rewarm_after_idle=0):
+        self.region = region
+        self.profile = profile
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self.max_attempts = max_attempts
+        self.rewarm_after_idle = rewarm_after_idle
+        self.last_used = time.monotonic()
+        self._session = None
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._keep_warm_thread = None
+        self._stopped = threading.Event()
+        self.on_throttle = None
+
+    def _create_session(self):
+        import boto3
+        from dotenv import load_dotenv
+
+        # AWS credentials may live in .env alongside the OpenAI key
+        load_dotenv()
+
+        # Create boto3 session with the specified AWS profile (if provided)
+        if self.profile:
+            return boto3.Session(profile_name=self.profile)
+        return boto3.Session()  # Use default profile/credentials
+
+    def _create_client(self, region):
+        from botocore.config import Config
+
+        # Sessions are not thread-safe, so clients are only created under the lock
+        if self._session is None:
+            self._session = self._create_session()
+        boto3_config = Config(
+            retries={
+                'max_attempts': self.max_attempts,
+                'mode': 'standard'
+            },
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=self.tcp_keepalive,
+        )
+        client = self._session.client("bedrock-runtime", config=boto3_config, region_name=region)
+        client.meta.events.register("needs-retry.bedrock-runtime", self._check_throttled)
+        return client
+
+    def _check_throttled(self, response=None, request_dict=None, **kwargs):
+        """botocore needs-retry hook; only observes, never changes the retry decision"""
+        if self.on_throttle is None or not response:
+            return None
+        error_code = response[1].get("Error", {}).get("Code")
+        if error_code in THROTTLING_ERROR_CODES:
+            # The model id is the second segment of /model/{modelId}/converse...
+            parts = unquote((request_dict or {}).get("url_path", "")).split("/")
+            self.on_throttle(parts[2] if len(parts) > 2 else None)
+        return None
+
+    def client(self, region=None):
+        """The shared client for ``region`` (the default region if omitted)"""
+        self.mark_used()
+        return self._get_client(region or self.region)
+
+    def mark_used(self):
+        """A request is being sent, so the pool's connections are not idle"""
+        self.last_used = time.monotonic()
+
+    def _get_client(self, region):
+        client = self._clients.get(region)
+        if client is not None:
+            return client
+        with self._lock:
+            if region not in self._clients:
+                self._clients[region] = self._create_client(region)
+            return self._clients[region]
+
+    def warm(self, region=None):
+        """Resolve credentials and open a connection; failures are ignored"""
+        try:
+            client = self._get_client(region or self.region)
+            with self._lock:
+                credentials = self._session.get_credentials()
+            if credentials is not None:
+                credentials.get_frozen_credentials()
+            # Any response, even an access error, leaves a live TLS connection in the pool
+            client.list_async_invokes(maxResults=1)
+        except Exception:
+            pass
+
+    def prewarm(self, region=None):
+        """Warm the pool on a background thread"""
+        thread = threading.Thread(target=self.warm, args=(region,), name="bedrock-prewarm", daemon=True)
+        thread.start()
+        if self.rewarm_after_idle and self._keep_warm_thread is None:
+            self._keep_warm_thread = threading.Thread(
+                target=self._keep_warm, args=(region,), name="bedrock-keep-warm", daemon=True
+            )
+            self._keep_warm_thread.start()
+        return thread
+
+    def _keep_warm(self, region):
+        while not self._stopped.wait(self.rewarm_after_idle):
+            self._rewarm_if_idle(region)
+
+    def _rewarm_if_idle(self, region=None):
+        """Warm the pool if no request was sent for ``rewarm_after_idle`` seconds"""
+        if time.monotonic() - self.last_used < self.rewarm_after_idle:
+            return False
+        self.warm(region)
+        return True
+
+    def stop(self):
+        """Stop re-warming after idle periods"""
+        self._stopped.set()
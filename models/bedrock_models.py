@@ -2,9 +2,14 @@ import json
 from models.model_invoker import ModelInvoker
 from botocore.exceptions import ClientError
 from configuration.config import config
+from models.token_budget import estimate_tokens
 
 
 class ClaudeInvoker(ModelInvoker):
+    NO_RESPONSE = "Error processing response"
+    # The Converse API lets Claude continue from a partial assistant turn
+    supports_prefill = True
+
     def __init__(self, bedrock_client):
         model_config = config['claude']
         super().__init__(model_config["modelId"])
@@ -14,24 +19,80 @@ class ClaudeInvoker(ModelInvoker):
         self.temperature = model_config["temperature"]
         self.top_p = model_config["top_p"]
         self.stop_sequences = model_config["stop_sequences"]
+        # Stable prefixes (system instructions, prior context) are marked with
+        # cache points; Bedrock only caches prefixes above a minimum size
+        self.prompt_caching = model_config.get("prompt_caching", True)
+        self.min_cache_tokens = model_config.get("min_cache_tokens", 1024)
+
+    def _cache_point(self, *prefix):
+        """A cachePoint block if the text before it is long enough to be cached"""
+        if not self.prompt_caching:
+            return []
+        if estimate_tokens("".join(text for text in prefix if text), "claude") < self.min_cache_tokens:
+            return []
+        return [{"cachePoint": {"type": "default"}}]
+
+    def _system(self, payload):
+        """Converse system blocks for the payload's instructions, if any"""
+        system = (payload or {}).get("system")
+        if not system:
+            return {}
+        return {"system": [{"text": system}] + self._cache_point(system)}
+
+    def _build_messages(self, prompt, payload):
+        """
+        Build the Converse messages: the payload's earlier ``messages`` (turns
+        of {"role", "content"}) ending in a cache point, then the payload's
+        ``context``, the variable prompt, and an assistant prefill if one is
+        given. The context is retrieved per request, so it comes after the
+        last cache point rather than paying for a cache write every time.
+        """
+        payload = payload or {}
+        prefix = [payload.get("system")]
+        messages = []
+        for message in payload.get("messages") or []:
+            messages.append({
+                "role": message["role"],
+                "content": [{"text": message["content"]}]
+            })
+            prefix.append(message["content"])
+        if messages:
+            messages[-1]["content"].extend(self._cache_point(*prefix))
+        content = []
+        context = payload.get("context")
+        if context:
+            content.append({"text": context})
+        content.append({"text": prompt})
+        messages.append({
+            "role": "user",
+            "content": content
+        })
+        prefill = payload.get("prefill")
+        if prefill:
+            messages.append({
+                "role": "assistant",
+                "content": [{"text": prefill}]
+            })
+        return messages
+
+    def _inference_config(self, payload):
+        """Inference settings from the model config, overridden per request by the payload"""
+        payload = payload or {}
+        return {
+            "maxTokens": payload.get("max_tokens", self.max_tokens),
+            "temperature": payload.get("temperature", self.temperature),
+            "topP": self.top_p,
+            "stopSequences": self.stop_sequences
+        }
 
     def invoke(self, prompt, payload=None):
         try:
             # Use Bedrock Converse API for Claude 3 models
             response = self.bedrock_client.converse(
                 modelId=self.model_id,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [{"text": prompt}]
-                    }
-                ],
-                inferenceConfig={
-                    "maxTokens": self.max_tokens,
-                    "temperature": self.temperature,
-                    "topP": self.top_p,
-                    "stopSequences": self.stop_sequences
-                }
+                messages=self._build_messages(prompt, payload),
+                inferenceConfig=self._inference_config(payload),
+                **self._system(payload)
             )
             return response
         except ClientError as e:
@@ -44,50 +105,114 @@ class ClaudeInvoker(ModelInvoker):
             # Use Bedrock Converse Stream API for Claude 3 models
             response = self.bedrock_client.converse_stream(
                 modelId=self.model_id,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [{"text": prompt}]
-                    }
-                ],
-                inferenceConfig={
-                    "maxTokens": self.max_tokens,
-                    "temperature": self.temperature,
-                    "topP": self.top_p,
-                    "stopSequences": self.stop_sequences
-                }
+                messages=self._build_messages(prompt, payload),
+                inferenceConfig=self._inference_config(payload),
+                **self._system(payload)
             )
             return response
         except ClientError as e:
             print(f"Error: {e}")
             return None
 
-    def process_stream_response(self, stream_response):
-        """Process streaming response from Bedrock Converse Stream API"""
+    def process_stream_response(self, stream_response, on_metadata=None):
+        """
+        Process streaming response from Bedrock Converse Stream API.
+
+        The trailing ``metadata`` event (usage and latency) arrives after
+        ``messageStop`` and is passed to ``on_metadata`` when given. Errors
+        while reading the stream propagate so the caller can resume it.
+        """
         if not stream_response:
             return
             
-        try:
-            for event in stream_response['stream']:
-                if 'contentBlockDelta' in event:
-                    delta = event['contentBlockDelta']['delta']
-                    if 'text' in delta:
-                        yield delta['text']
-                elif 'messageStop' in event:
-                    break
-        except Exception as e:
-            print(f"Error processing stream: {e}")
-            return
+        for event in stream_response['stream']:
+            if 'contentBlockDelta' in event:
+                delta = event['contentBlockDelta']['delta']
+                if 'text' in delta:
+                    yield delta['text']
+            elif 'metadata' in event:
+                if on_metadata:
+                    on_metadata(event['metadata'])
+
+    def close_stream(self, stream_response):
+        """Abort the HTTP response under the event stream"""
+        if stream_response:
+            self._abort_http_response(getattr(stream_response['stream'], '_raw_stream', None))
 
     def process_response(self, response):
         if response and 'output' in response and 'message' in response['output']:
             content = response['output']['message']['content']
             if content and len(content) > 0:
                 return content[0]['text'].strip()
-        return "Error processing response"
+        return self.NO_RESPONSE
 
+    def extract_usage(self, response):
+        """Usage from a Converse response or a ConverseStream metadata event"""
+        if not response:
+            return None
+        usage = response.get('usage', {})
+        return {
+            "input_tokens": usage.get('inputTokens'),
+            "output_tokens": usage.get('outputTokens'),
+            "latency_ms": response.get('metrics', {}).get('latencyMs'),
+            "cache_read_tokens": usage.get('cacheReadInputTokens'),
+            "cache_write_tokens": usage.get('cacheWriteInputTokens'),
+        }
+
+
+class _InvokeModelStreamMixin:
+    """
+    Streaming over Bedrock's InvokeModelWithResponseStream for models that
+    use provider-native request bodies. Subclasses build the body with
+    ``_request_body`` and pick the text out of each chunk with ``_chunk_text``.
+    """
 
-class LlamaInvoker(ModelInvoker):
+    def invoke_stream(self, prompt, payload=None):
+        try:
+            return self.bedrock_client.invoke_model_with_response_stream(
+                modelId=self.model_id,
+                body=self._request_body(prompt, payload),
+            )
+        except ClientError as e:
+            print(f"Error: {e}")
+            return None
+
+    def process_stream_response(self, stream_response, on_metadata=None):
+        """
+        Yield text from each chunk. The last chunk carries Bedrock's invocation
+        metrics, which are passed to ``on_metadata`` when given.
+        """
+        if not stream_response:
+            return
+
+        for event in stream_response['body']:
+            if 'chunk' not in event:
+                continue
+            chunk = json.loads(event['chunk']['bytes'])
+            text = self._chunk_text(chunk)
+            if text:
+                yield text
+            if on_metadata and 'amazon-bedrock-invocationMetrics' in chunk:
+                on_metadata(chunk)
+
+    def close_stream(self, stream_response):
+        if stream_response:
+            self._abort_http_response(getattr(stream_response['body'], '_raw_stream', None))
+
+    @staticmethod
+    def _invocation_usage(response):
+        """Usage from the invocation metrics of a final stream chunk, or None"""
+        metrics = response.get('amazon-bedrock-invocationMetrics')
+        if not metrics:
+            return None
+        return {
+            "input_tokens": metrics.get("inputTokenCount"),
+            "output_tokens": metrics.get("outputTokenCount"),
+            "latency_ms": metrics.get("invocationLatency"),
+        }
+
+
+class LlamaInvoker(_InvokeModelStreamMixin, ModelInvoker):
     def __init__(self, bedrock_client):
         model_config = config['llama']
         super().__init__(model_config["modelId"])
@@ -97,18 +222,24 @@ class LlamaInvoker(ModelInvoker):
         self.temperature = model_config["temperature"]
         self.top_p = model_config["top_p"]
 
+    def _request_body(self, prompt, payload):
+        return json.dumps(
+            {
+                "prompt": self.prompt_format.format(prompt=self._full_prompt(prompt, payload)),
+                "max_gen_len": (payload or {}).get("max_tokens", self.max_tokens),
+                "temperature": (payload or {}).get("temperature", self.temperature),
+                "top_p": self.top_p,
+            }
+        )
+
+    def _chunk_text(self, chunk):
+        return chunk.get("generation")
+
     def invoke(self, prompt, payload=None):
         try:
             response = self.bedrock_client.invoke_model(
                 modelId=self.model_id,
-                body=json.dumps(
-                    {
-                        "prompt": self.prompt_format.format(prompt=prompt),
-                        "max_gen_len": self.max_tokens,
-                        "temperature": self.temperature,
-                        "top_p": self.top_p,
-                    }
-                ),
+                body=self._request_body(prompt, payload),
             )
             response_body = json.loads(response["body"].read())
             return response_body
@@ -121,8 +252,18 @@ class LlamaInvoker(ModelInvoker):
             response["generation"].replace("[INST]", "").replace("[/INST]", "").strip()
         )
 
+    def extract_usage(self, response):
+        if not response:
+            return None
+        if 'amazon-bedrock-invocationMetrics' in response:
+            return self._invocation_usage(response)
+        return {
+            "input_tokens": response.get("prompt_token_count"),
+            "output_tokens": response.get("generation_token_count"),
+        }
 
-class TitanInvoker(ModelInvoker):
+
+class TitanInvoker(_InvokeModelStreamMixin, ModelInvoker):
     def __init__(self, bedrock_client):
         model_config = config['titan']
         super().__init__(model_config["modelId"])
@@ -132,20 +273,26 @@ class TitanInvoker(ModelInvoker):
         self.temperature = model_config["temperature"]
         self.top_p = model_config["top_p"]
 
+    def _request_body(self, prompt, payload):
+        return json.dumps(
+            {
+                "inputText": self.prompt_format.format(prompt=self._full_prompt(prompt, payload)),
+                "textGenerationConfig": {
+                    "maxTokenCount": (payload or {}).get("max_tokens", self.max_tokens),
+                    "temperature": (payload or {}).get("temperature", self.temperature),
+                    "topP": self.top_p,
+                },
+            }
+        )
+
+    def _chunk_text(self, chunk):
+        return chunk.get("outputText")
+
     def invoke(self, prompt, payload=None):
         try:
             response = self.bedrock_client.invoke_model(
                 modelId=self.model_id,
-                body=json.dumps(
-                    {
-                        "inputText": self.prompt_format.format(prompt=prompt),
-                        "textGenerationConfig": {
-                            "maxTokenCount": self.max_tokens,
-                            "temperature": self.temperature,
-                            "topP": self.top_p,
-                        },
-                    }
-                ),
+                body=self._request_body(prompt, payload),
             )
             response_body = json.loads(response["body"].read())
             return response_body
@@ -156,3 +303,14 @@ class TitanInvoker(ModelInvoker):
     def process_response(self, response):
 
         return response["results"][0]["outputText"].strip()
+
+    def extract_usage(self, response):
+        if not response:
+            return None
+        if 'amazon-bedrock-invocationMetrics' in response:
+            return self._invocation_usage(response)
+        results = response.get("results") or [{}]
+        return {
+            "input_tokens": response.get("inputTextTokenCount"),
+            "output_tokens": results[0].get("tokenCount"),
+        }
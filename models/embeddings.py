@@ -0,0 +1,63 @@
+import threading
+
+import numpy as np
+
+from models.token_budget import estimate_tokens
+
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# all-MiniLM-L6-v2 ignores everything after 256 word pieces; token estimates
+# are approximate, so parts stay well below that
+PART_TOKENS = 200
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+class SentenceEmbedder:
+    """
+    Local sentence-transformers embedder returning L2-normalized float32 rows.
+
+    The model is loaded on first use; sentence-transformers is an optional
+    dependency and ``load`` returns None when it is not installed.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    @classmethod
+    def load(cls, model_name=DEFAULT_EMBEDDING_MODEL):
+        with _models_lock:
+            if model_name not in _models:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError:
+                    print("sentence-transformers is not installed; embeddings are disabled")
+                    return None
+                _models[model_name] = SentenceTransformer(model_name)
+            return cls(_models[model_name])
+
+    def __call__(self, texts):
+        vectors = self.model.encode(list(texts), convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def split_for_embedding(text, max_tokens=PART_TOKENS):
+    """Split ``text`` at line breaks into parts short enough to be embedded in full"""
+    parts, current, tokens = [], [], 0
+    for line in text.splitlines(keepends=True):
+        line_tokens = estimate_tokens(line)
+        pieces = [line]
+        if line_tokens > max_tokens:
+            size = max(1, len(line) * max_tokens // line_tokens)
+            pieces = [line[i:i + size] for i in range(0, len(line), size)]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current and tokens + piece_tokens > max_tokens:
+                parts.append("".join(current))
+                current, tokens = [], 0
+            current.append(piece)
+            tokens += piece_tokens
+    if current:
+        parts.append("".join(current))
+    return [part for part in parts if part.strip()]
@@ -1,36 +1,140 @@
 from models.model_invoker import ModelInvoker
 import openai
 import os
+import threading
+import requests
 from configuration.config import config
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# The HTTP response of the last request made on each thread; openai
+# doesn't expose it, but a stream can only be aborted through it
+_last_response = threading.local()
+
+
+def _remember_response(response, **kwargs):
+    _last_response.value = response
+
+
+def _session():
+    """HTTP session for the openai client, set up like its default one"""
+    session = requests.Session()
+    if openai.proxy:
+        proxy = openai.proxy
+        session.proxies = proxy if isinstance(proxy, dict) else {"http": proxy, "https": proxy}
+    session.mount("https://", requests.adapters.HTTPAdapter(max_retries=2))
+    session.hooks["response"].append(_remember_response)
+    return session
+
+
+class _ChatStream:
+    """Chunks of a streamed chat completion and the HTTP response they are read from"""
+
+    def __init__(self, chunks, response):
+        self.chunks = chunks
+        self.response = response
+
+    def __iter__(self):
+        return iter(self.chunks)
+
 
 class ChatGPTModelInvoker(ModelInvoker):
+    NO_RESPONSE = "No valid response received."
+
     def __init__(self):
         model_config = config["openai"]
         self.model_id = model_config["modelId"]
         self.max_tokens = model_config["max_tokens"]
+        self.temperature = model_config.get("temperature")
+        # Any OpenAI-compatible server (vLLM, llama.cpp, Ollama...) can stand in
+        self.api_base = model_config.get("api_base")
+        # Ask for a final usage chunk when streaming; not every compatible server supports it
+        self.stream_usage = model_config.get("stream_usage", not self.api_base)
+        # The OpenAI key is never sent to a custom endpoint unless named here
+        self.api_key_env = model_config.get("api_key_env")
         super().__init__(model_id=self.model_id)
         openai.api_key = os.getenv("OPENAI_API_KEY")
+        if openai.requestssession is None:
+            openai.requestssession = _session
+
+    def _create(self, prompt, payload, **kwargs):
+        payload = payload or {}
+        if self.api_base:
+            kwargs["api_base"] = self.api_base
+            # Local servers usually ignore the key, but the client insists on one
+            kwargs["api_key"] = (os.getenv(self.api_key_env) if self.api_key_env else None) or "not-needed"
+        temperature = payload.get("temperature", self.temperature)
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        # Instructions go first so OpenAI's automatic prefix caching can reuse them
+        messages = []
+        if payload.get("system"):
+            messages.append({"role": "system", "content": payload["system"]})
+        messages.extend(
+            {"role": message["role"], "content": message["content"]} for message in payload.get("messages") or []
+        )
+        user_content = "\n\n".join(part for part in (payload.get("context"), prompt) if part)
+        messages.append({"role": "user", "content": user_content})
+        return openai.ChatCompletion.create(
+            model=self.model_id,
+            messages=messages,
+            max_tokens=payload.get("max_tokens", self.max_tokens),
+            **kwargs,
+        )
 
     def invoke(self, prompt, payload=None):
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model_id,
-                messages=[
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=self.max_tokens,
-            )
+            response = self._create(prompt, payload)
             return response
         except Exception as e:
             print(f"Error invoking OpenAI model {self.model_id}: {e}")
             return None
 
+    def invoke_stream(self, prompt, payload=None):
+        """Start a streamed chat completion; the request is sent before this returns"""
+        try:
+            kwargs = {"stream": True}
+            if self.stream_usage:
+                kwargs["stream_options"] = {"include_usage": True}
+            _last_response.value = None
+            chunks = self._create(prompt, payload, **kwargs)
+            return _ChatStream(chunks, _last_response.value)
+        except Exception as e:
+            print(f"Error invoking OpenAI model {self.model_id}: {e}")
+            return None
+
+    def process_stream_response(self, stream_response, on_metadata=None):
+        """
+        Yield content deltas as they arrive. A chunk carrying ``usage`` (sent
+        last when stream usage is enabled) is passed to ``on_metadata``.
+        """
+        if not stream_response:
+            return
+
+        for chunk in stream_response:
+            for choice in chunk.get("choices") or []:
+                content = choice.get("delta", {}).get("content")
+                if content:
+                    yield content
+            if on_metadata and chunk.get("usage"):
+                on_metadata(chunk)
+
+    def close_stream(self, stream_response):
+        if stream_response and stream_response.response is not None:
+            self._abort_http_response(stream_response.response.raw)
+
     def process_response(self, response):
         if response and "choices" in response:
             return response["choices"][0]["message"]["content"].strip()
-        return "No valid response received."
+        return self.NO_RESPONSE
+
+    def extract_usage(self, response):
+        if not response or not response.get("usage"):
+            return None
+        usage = response["usage"]
+        return {
+            "input_tokens": usage.get("prompt_tokens"),
+            "output_tokens": usage.get("completion_tokens"),
+        }
@@ -1,8 +1,22 @@
+import socket
 from abc import ABC, abstractmethod
 
 
 
 class ModelInvoker(ABC):
+    # Whether the model can continue a partial answer sent as an assistant
+    # prefill (payload["prefill"]), which lets interrupted streams resume
+    supports_prefill = False
+    # What process_response returns when a response holds no answer; it is never cached
+    NO_RESPONSE = None
+    # The NO_RESPONSE of every invoker class loaded so far
+    no_responses = set()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.NO_RESPONSE:
+            ModelInvoker.no_responses.add(cls.NO_RESPONSE)
+
     def __init__(self, model_id):
         self.model_id = model_id
 
@@ -15,3 +29,52 @@ class ModelInvoker(ABC):
     def process_response(self, response):
         """Process the response returned by the model."""
         pass
+
+    @staticmethod
+    def _full_prompt(prompt, payload):
+        """
+        The prompt preceded by the payload's ``system`` instructions, earlier
+        ``messages`` and ``context``, for models that only take one text
+        """
+        payload = payload or {}
+        turns = [
+            f"{message['role'].capitalize()}: {message['content']}" for message in payload.get("messages") or []
+        ]
+        parts = [payload.get("system"), *turns, payload.get("context"), prompt]
+        return "\n\n".join(part for part in parts if part)
+
+    def extract_usage(self, response):
+        """
+        Return provider-reported usage for a response as a dict with
+        ``input_tokens``, ``output_tokens`` and ``latency_ms`` (and, for
+        models with prompt caching, ``cache_read_tokens`` and
+        ``cache_write_tokens``), or None.
+        """
+        return None
+
+    def close_stream(self, stream_response):
+        """
+        Abort a stream returned by invoke_stream, e.g. when it lost a race.
+        This is called from another thread than the one reading the stream,
+        so invokers close its HTTP response with ``_abort_http_response``;
+        a generator can't be closed while its thread runs it.
+        """
+
+    @staticmethod
+    def _abort_http_response(response):
+        """
+        Close a urllib3 response another thread may be reading. Closing
+        alone waits for that read to return, which may take as long as the
+        model takes to send its next token; shutting the socket down first
+        ends the read at once.
+        """
+        if response is None:
+            return
+        connection = getattr(response, "connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        response.close()
@@ -1,35 +1,104 @@
-import boto3
-from botocore.config import Config
-from models.bedrock_models import ClaudeInvoker, LlamaInvoker, TitanInvoker
-from models.gpt_models import ChatGPTModelInvoker
+import sqlite3
+import threading
+import time
+
+from models.bedrock_client_pool import BedrockClientPool
+from models.circuit_breaker import CircuitBreaker
+from models.model_invoker import ModelInvoker
+from models.provider_registry import ProviderRegistry
+from models.rate_limiter import RateLimiter
+from models.request_metrics import MetricsRecorder, RequestMetrics
+from models.response_cache import ResponseCache
+from models.stream_race import StreamRace
+from models.token_budget import BudgetCheck, TokenBudgetExceeded, estimate_tokens, model_family, trim_to_budget
+
+
+def _build_claude(manager, region=None):
+    from models.bedrock_models import ClaudeInvoker
+    return ClaudeInvoker(manager.bedrock_pool.client(region))
+
+
+def _build_llama(manager, region=None):
+    from models.bedrock_models import LlamaInvoker
+    return LlamaInvoker(manager.bedrock_pool.client(region))
+
+
+def _build_titan(manager, region=None):
+    from models.bedrock_models import TitanInvoker
+    return TitanInvoker(manager.bedrock_pool.client(region))
+
+
+def _build_openai(manager, region=None):
+    from models.gpt_models import ChatGPTModelInvoker
+    return ChatGPTModelInvoker()
+
+
+INVOKE_ERROR = "Error while invoking the model"
+
+
+def is_error_response(text):
+    """Whether ``text`` is an error or placeholder returned in place of an answer"""
+    return not text or text == INVOKE_ERROR or text in ModelInvoker.no_responses
+
+
+BEDROCK_MODELS = ("claude", "llama", "titan")
+
+# Provider SDKs (boto3, openai) are imported inside these factories so that
+# startup only pays for the providers that are actually used. A model name
+# like "claude@us-west-2" builds the provider against another region
+PROVIDER_FACTORIES = {
+    "claude": _build_claude,
+    "llama": _build_llama,
+    "titan": _build_titan,
+    "openai": _build_openai,
+}
+
+
+def _load_embedder(model_name):
+    from models.embeddings import SentenceEmbedder
+    return SentenceEmbedder.load(model_name)
+
+
+class _StreamFailure:
+    """Carries an exception from a stream worker thread to the event loop"""
+
+    def __init__(self, error):
+        self.error = error
+
 
 class ModelManager:
     def __init__(self, config):
-        # Configure retries for throttling
-        boto3_config = Config(
-            retries={
-                'max_attempts': 6,
-                'mode': 'standard'
-            }
+        self.config = config
+
+        # Clients are created on first use and shared by every request thread
+        pool_config = config.get("bedrock_pool", {})
+        self.bedrock_pool = BedrockClientPool(
+            config["region"],
+            profile=config.get("profile"),
+            max_pool_connections=pool_config.get("max_pool_connections", 10),
+            tcp_keepalive=pool_config.get("tcp_keepalive", True),
+            rewarm_after_idle=pool_config.get("rewarm_after_idle_seconds", 0),
         )
-        
-        # Create boto3 session with the specified AWS profile (if provided)
-        profile_name = config.get("profile")
-        if profile_name:
-            session = boto3.Session(profile_name=profile_name)
-        else:
-            session = boto3.Session()  # Use default profile/credentials
-        
-        # Create bedrock-runtime client with retry config and profile
-        self.bedrock_runtime = session.client("bedrock-runtime", config=boto3_config, region_name=config["region"])
-
-        self.models = {
-            "claude": ClaudeInvoker(self.bedrock_runtime),
-            "llama": LlamaInvoker(self.bedrock_runtime),
-            "titan": TitanInvoker(self.bedrock_runtime),
-            "openai": ChatGPTModelInvoker(),
+
+        # Client-side RPM/TPM budgets per model, tightened when Bedrock throttles
+        self.rate_limiters = {
+            name: RateLimiter(
+                requests_per_minute=limits.get("requests_per_minute"),
+                tokens_per_minute=limits.get("tokens_per_minute"),
+                burst_seconds=limits.get("burst_seconds", 10),
+            )
+            for name, limits in config.get("rate_limits", {}).items()
         }
+        self.bedrock_pool.on_throttle = self._on_throttle
+
+        # Invokers and the Bedrock client are only built when a model is first used
+        self.models = ProviderRegistry()
+        for name, factory in PROVIDER_FACTORIES.items():
+            self.models.register(name, lambda factory=factory: factory(self))
+
         self.default_model = config["default_model"]
+        if pool_config.get("prewarm") and self.default_model in BEDROCK_MODELS:
+            self.bedrock_pool.prewarm()
         
         # Get model configuration, fallback to claude if not found
         if self.default_model in config:
@@ -41,53 +110,603 @@ class ModelManager:
         self.max_tokens = model_md.get("max_tokens", 1000)
         self.temperature = model_md.get("temperature", 0.7)
 
+        # Timing and usage of every request, summarized by the REPL 'stats' command
+        self.metrics = MetricsRecorder()
+        self.last_metrics = None
+
+        # Identical requests are answered from a cache shared by every terminal
+        cache_config = config.get("response_cache", {})
+        self.response_cache = None
+        if cache_config.get("enabled"):
+            try:
+                self.response_cache = ResponseCache(
+                    cache_config.get("path", "~/.cache/my-dev-agent/responses.sqlite3"),
+                    ttl_seconds=cache_config.get("ttl_seconds", 7 * 24 * 3600),
+                    max_entries=cache_config.get("max_entries", 2000),
+                    max_bytes=cache_config.get("max_bytes", 50 * 1024 * 1024),
+                )
+            except (OSError, sqlite3.Error) as e:
+                print(f"Response cache disabled: {e}")
+
+        # Near-duplicate inputs to the same command reuse an earlier answer.
+        # NumPy, the index and the embedding model load in the background, so
+        # the cache stays None (and misses) until they are ready
+        semantic_config = config.get("semantic_cache", {})
+        self.semantic_cache = None
+        self.semantic_cache_mode = semantic_config.get("mode", "offer")
+        self._semantic_cache_loader = None
+        if semantic_config.get("enabled"):
+            self._semantic_cache_loader = threading.Thread(
+                target=self._load_semantic_cache, args=(semantic_config,), name="semantic-cache", daemon=True
+            )
+            self._semantic_cache_loader.start()
+
+        # Backends that keep failing are skipped in favour of their fallbacks,
+        # e.g. {"claude": ["claude@us-west-2", "openai"]}
+        self.failover = config.get("failover", {})
+        for name in [name for chain in self.failover.values() for name in chain]:
+            self._resolve_name(name)
+        breaker_config = config.get("circuit_breaker", {})
+        self._breaker_settings = {
+            "failure_threshold": breaker_config.get("failure_threshold", 3),
+            "latency_threshold": breaker_config.get("latency_threshold_seconds"),
+            "reset_timeout": breaker_config.get("reset_timeout_seconds", 30),
+        }
+        self.circuit_breakers = {}
+        self._breakers_lock = threading.Lock()
+
+        # What to do with prompts that don't fit the model's context window:
+        # "reject" them, "trim" their middle, or raise for the caller to "chunk"
+        self.budget_policy = config.get("token_budget", {}).get("policy", "chunk")
+
+        # Providers raced against each other when racing is requested
+        self.racing_models = config.get("racing", {}).get("models", [])
+
+        # Async requests run on a bounded pool; requests beyond the limit queue
+        self.max_concurrency = config.get("max_concurrency", 8)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def bedrock_runtime(self):
+        """The shared bedrock-runtime client of the default region, created on first use"""
+        return self.bedrock_pool.client()
+
     def is_streaming_supported(self, model_name):
         """Check if streaming is supported for the given model"""
-        # Claude 3 models and OpenAI models support streaming
-        streaming_models = ["claude", "openai"]
-        return model_name in streaming_models
+        _, model = self._resolve_model(model_name)
+        return hasattr(model, 'invoke_stream') and hasattr(model, 'process_stream_response')
+
+    def _resolve_name(self, model_name=None):
+        """Name of the model to use, falling back to llama for unknown models"""
+        name = model_name or self.default_model
+        if name not in self.models and "@" in name:
+            provider, region = name.split("@", 1)
+            if provider in PROVIDER_FACTORIES:
+                factory = PROVIDER_FACTORIES[provider]
+                self.models.register(name, lambda: factory(self, region))
+        return name if name in self.models else "llama"
+
+    def _resolve_model(self, model_name=None):
+        """Return the (name, invoker) to use, falling back to llama for unknown models"""
+        name = self._resolve_name(model_name)
+        return name, self.models[name]
+
+    def _failover_chain(self, model_name=None):
+        """The model followed by its configured fallbacks"""
+        name = self._resolve_name(model_name)
+        chain = [name]
+        for fallback in self.failover.get(name, []):
+            fallback = self._resolve_name(fallback)
+            if fallback not in chain:
+                chain.append(fallback)
+        return chain
+
+    def circuit_breaker(self, name):
+        """The CircuitBreaker tracking the health of a model backend"""
+        with self._breakers_lock:
+            if name not in self.circuit_breakers:
+                self.circuit_breakers[name] = CircuitBreaker(**self._breaker_settings)
+            return self.circuit_breakers[name]
+
+    def _record_health(self, metrics):
+        """Feed the outcome of a request to its backend's circuit breaker"""
+        if metrics.cache_hit:
+            return
+        breaker = self.circuit_breaker(metrics.model)
+        if metrics.cancelled:
+            # A request aborted on purpose (e.g. a lost race) says nothing
+            # about the backend, but may have been its half-open probe
+            breaker.release_probe()
+        elif metrics.error is None:
+            # Only stream first-token latency is a health signal; queue and
+            # rate-limiter waits and full generation times are not
+            breaker.record_success(metrics.first_token_latency)
+        else:
+            breaker.record_failure()
+
+    def _build_payload(self, prompt, model_name=None, params=None):
+        """Build the request payload from the model's defaults and per-request params"""
+        if model_name and model_name != self.default_model:
+            # Regional variants ("claude@us-west-2") share the provider's settings
+            model_md = self.config.get(model_name.split("@")[0], {})
+            max_tokens = model_md.get("max_tokens", self.max_tokens)
+            temperature = model_md.get("temperature", self.temperature)
+        else:
+            max_tokens = self.max_tokens
+            temperature = self.temperature
+        payload = {
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+        payload.update(params or {})
+        return payload
+
+    def _start_metrics(self, model_name, command, streaming, queued_at=None):
+        metrics = RequestMetrics(model_name, command=command, streaming=streaming)
+        if queued_at is not None:
+            metrics.created_at = queued_at
+        self.last_metrics = metrics
+        return metrics
+
+    def _on_throttle(self, model_id):
+        for name, limiter in self.rate_limiters.items():
+            if self.config.get(name, {}).get("modelId") == model_id:
+                limiter.on_throttle()
+
+    @staticmethod
+    def _input_text(prompt, params):
+        """Everything sent as input: system instructions, earlier messages, context and prompt"""
+        turns = [message["content"] for message in params.get("messages") or []]
+        parts = [params.get("system"), *turns, params.get("context"), prompt]
+        return "\n\n".join(part for part in parts if part)
 
-    def invoke_model_stream(self, prompt):
-        """Invoke model with streaming response using Bedrock Converse API"""
-        model = self.models.get(self.default_model, self.models["llama"])
+    def preflight(self, prompt, model_name=None, max_tokens=None, system=None, context=None, messages=None):
+        """
+        Estimate a request before sending it: returns a BudgetCheck with the
+        input size, the model's context window and the estimated cost.
+        """
+        name = self._resolve_name(model_name)
+        family = model_family(name)
+        model_md = self.config.get(family, {})
+        if max_tokens is None:
+            max_tokens = self._build_payload("", name)["max_tokens"]
+        return BudgetCheck(
+            name,
+            estimate_tokens(self._input_text(prompt, {"system": system, "context": context, "messages": messages}), family),
+            max_tokens,
+            context_window=model_md.get("context_window"),
+            input_price_per_1k=model_md.get("input_price_per_1k"),
+            output_price_per_1k=model_md.get("output_price_per_1k"),
+        )
+
+    def _enforce_budget(self, prompt, model_name, params):
+        """Return the prompt to send, trimmed under the "trim" policy, or raise TokenBudgetExceeded"""
+        check = self.preflight(
+            prompt, model_name, params.get("max_tokens"),
+            params.get("system"), params.get("context"), params.get("messages"),
+        )
+        if check.fits:
+            return prompt
+        if self.budget_policy == "trim":
+            # Only the variable prompt is trimmed; the instructions are kept whole
+            family = model_family(check.model)
+            prefix_tokens = estimate_tokens(self._input_text("", params), family)
+            print(f"Trimming prompt: {check.describe()}")
+            return trim_to_budget(prompt, max(0, check.available_input_tokens - prefix_tokens), family)
+        raise TokenBudgetExceeded(check, self.budget_policy)
+
+    def _admit(self, name, prompt, params):
+        """Wait for the model's rate limiter; returns the input tokens reserved"""
+        limiter = self.rate_limiters.get(name)
+        if limiter is None:
+            return None
+        tokens = estimate_tokens(self._input_text(prompt, params), model_family(name))
+        limiter.acquire(tokens)
+        return tokens
+
+    async def _aadmit(self, name, prompt, params):
+        limiter = self.rate_limiters.get(name)
+        if limiter is None:
+            return None
+        tokens = estimate_tokens(self._input_text(prompt, params), model_family(name))
+        await limiter.aacquire(tokens)
+        return tokens
+
+    def _settle_rate_limit(self, metrics):
+        """Charge the tokens actually used and let the limiter recover"""
+        limiter = self.rate_limiters.get(metrics.model)
+        if limiter is None or metrics.cache_hit or metrics.started_at is None:
+            return
+        if metrics.error is None:
+            limiter.on_success()
+        reserved = metrics.reserved_tokens or 0
+        used = (metrics.input_tokens or reserved) + (metrics.output_tokens or 0)
+        limiter.charge(used - reserved)
+
+    def _finish_metrics(self, metrics, error=None):
+        metrics.mark_finished(error)
+        self._settle_rate_limit(metrics)
+        self._record_health(metrics)
+        self.metrics.record(metrics)
+
+    def _measure_stream(self, chunks, metrics):
+        """Pass chunks through while recording time-to-first-token and gaps"""
+        error = None
+        try:
+            for chunk in chunks:
+                metrics.mark_token()
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish_metrics(metrics, error)
+
+    def _cache_key(self, model, payload):
+        """Cache key for a request, or None when it must not be cached"""
+        # Resumed streams only produce a continuation, not a full answer
+        if self.response_cache is None or payload.get("prefill"):
+            return None
+        inference_config = {key: value for key, value in payload.items() if key != "prompt"}
+        return ResponseCache.make_key(model.model_id, inference_config, payload["prompt"])
+
+    def _cache_stream(self, chunks, cache_key):
+        """Pass chunks through and cache the full text once the stream completes"""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        if parts:
+            self.response_cache.put(cache_key, "".join(parts))
+
+    @staticmethod
+    def _replay(text):
+        """Replay a cached answer line by line through the streaming path"""
+        yield from text.splitlines(keepends=True)
+
+    def _load_semantic_cache(self, semantic_config):
+        from models.semantic_cache import SemanticCache
+
+        model_name = semantic_config.get("model", "all-MiniLM-L6-v2")
+        cache = SemanticCache(
+            lambda: _load_embedder(model_name),
+            path=semantic_config.get("path"),
+            threshold=semantic_config.get("threshold", 0.92),
+            max_entries=semantic_config.get("max_entries", 500),
+            max_parts=semantic_config.get("max_parts", 32),
+        )
+        cache.start()
+        self.semantic_cache = cache
+
+    def find_similar_answer(self, command, text):
+        """Return (answer, similarity) for a near-duplicate of ``text``, or None"""
+        if self.semantic_cache is None or command is None:
+            return None
+        return self.semantic_cache.lookup(command, text)
+
+    def remember_answer(self, command, text, answer):
+        """Add a completed answer to the semantic cache"""
+        if self.semantic_cache is None or command is None or is_error_response(answer):
+            return
+        self.semantic_cache.add(command, text, answer)
+
+    def supports_resume(self, model_name=None):
+        """Whether an interrupted stream of the model can be continued"""
+        return bool(self._resume_chain(model_name))
+
+    def _resume_chain(self, model_name=None):
+        """The failover chain without backends that would ignore a prefill and answer from scratch"""
+        return [
+            name for name in self._failover_chain(model_name)
+            if getattr(self.models[name], "supports_prefill", False)
+        ]
+
+    def resume_model_stream(self, prompt, partial_text, command=None, model_name=None, **params):
+        """
+        Continue an interrupted stream instead of regenerating it.
+
+        The text produced so far is sent back as an assistant prefill and the
+        returned iterator yields only the continuation. Returns None when the
+        model cannot continue from a prefill or no backend accepted the request.
+        """
+        chain = self._resume_chain(model_name)
+        if not chain:
+            return None
+        # Converse rejects an assistant turn that ends in whitespace, so the
+        # trailing whitespace is reconciled with the continuation instead
+        prefill = partial_text.rstrip()
+        trailing = partial_text[len(prefill):]
+        chunks = self._start_stream(prompt, command, model_name, dict(params, prefill=prefill), chain=chain)
+        if chunks is None:
+            return None
+        return self._stitch_continuation(trailing, chunks)
+
+    @staticmethod
+    def _stitch_continuation(trailing, chunks):
+        """Drop leading whitespace of a continuation that was already emitted"""
+        leading = ""
+        chunks = iter(chunks)
+        for chunk in chunks:
+            stripped = chunk.lstrip()
+            leading += chunk[:len(chunk) - len(stripped)]
+            if stripped:
+                if leading.startswith(trailing):
+                    yield leading[len(trailing):] + stripped
+                elif trailing.startswith(leading):
+                    yield stripped
+                else:
+                    yield leading + stripped
+                break
+        yield from chunks
+
+    def invoke_model_stream(self, prompt, command=None, model_name=None, **params):
+        """
+        Invoke model with streaming response using Bedrock Converse API.
+
+        ``model_name`` selects a model other than the default; any other
+        keyword (max_tokens, temperature, prefill, system, context, messages)
+        overrides the payload. ``system`` instructions, earlier ``messages``
+        ({"role", "content"} turns) and ``context`` are sent ahead of the
+        prompt as a prefix the provider can cache.
+        """
+        return self._invoke_stream(prompt, command, model_name, params)
+
+    def invoke_model(self, prompt, command=None, model_name=None, **params):
+        """Invoke a model and return the processed response text"""
+        return self._invoke(prompt, command, model_name, params)
+
+    def race_model_stream(self, prompt, command=None, model_names=None, **params):
+        """
+        Send the prompt to several providers at once and stream whichever
+        produces a first token first; the other requests are aborted.
+
+        ``model_names`` defaults to the configured racing models. With fewer
+        than two usable models this is a plain invoke_model_stream.
+        """
+        names = self._racers(model_names)
+        if len(names) < 2:
+            return self.invoke_model_stream(prompt, command=command, model_name=names[0] if names else None, **params)
+        # The same prompt goes to every racer, so it has to fit the smallest window
+        prompt = self._enforce_budget(prompt, self.race_budget_model(prompt, model_names, **params), params)
+        
+        # Each racer streams from exactly one backend; failover would only
+        # duplicate the other racers
+        starters = {
+            name: lambda on_start, name=name: self._invoke_stream_once(
+                prompt, command, name, params, None, on_start, False
+            ) or iter([])
+            for name in names
+        }
+        return StreamRace(starters, lambda name, cancel: cancel()).start()
+
+    def _racers(self, model_names=None):
+        return [
+            name for name in dict.fromkeys(model_names or self.racing_models)
+            if name in self.models and self.is_streaming_supported(name)
+        ]
+
+    def race_budget_model(self, prompt, model_names=None, **params):
+        """The racer with the least room for input, whose budget a raced request has to meet"""
+        names = self._racers(model_names) or [None]
+
+        def room(name):
+            check = self.preflight(
+                prompt, name, params.get("max_tokens"),
+                params.get("system"), params.get("context"), params.get("messages"),
+            )
+            available = check.available_input_tokens
+            return float("inf") if available is None else available - check.input_tokens
+
+        return min(names, key=room)
+
+    def _invoke_stream(self, prompt, command, model_name, params, queued_at=None, on_start=None,
+                       reserved_tokens=False):
+        chunks = self._start_stream(prompt, command, model_name, params, queued_at, on_start, reserved_tokens)
+        return iter([]) if chunks is None else chunks  # Return empty iterator if no backend responded
+
+    def _start_stream(self, prompt, command, model_name, params, queued_at=None, on_start=None,
+                      reserved_tokens=False, chain=None):
+        """Start a stream on the first backend of the failover chain that accepts it; None if none does"""
+        prompt = self._enforce_budget(prompt, model_name, params)
+        for name in chain or self._failover_chain(model_name):
+            chunks = self._invoke_stream_once(prompt, command, name, params, queued_at, on_start, reserved_tokens)
+            if chunks is not None:
+                return chunks
+            # A fallback model has its own rate limit to pass
+            reserved_tokens = False
+        return None
+
+    def _invoke_stream_once(self, prompt, command, name, params, queued_at, on_start, reserved_tokens):
+        """Start a stream on one backend; None if it is unavailable or fails to start"""
+        model = self.models[name]
         
         # Check if the model supports streaming
         if hasattr(model, 'invoke_stream'):
-            payload = {
-                "prompt": prompt,
-                "max_tokens": self.max_tokens,
-                "temperature": self.temperature,
-            }
-            print("invoke model stream")
+            payload = self._build_payload(prompt, name, params)
+            cache_key = self._cache_key(model, payload)
+            if cache_key:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    metrics = self._start_metrics(name, command, streaming=True, queued_at=queued_at)
+                    metrics.cache_hit = True
+                    return self._measure_stream(self._replay(cached), metrics)
+            if not self.circuit_breaker(name).allow_request():
+                print(f"Skipping {name}: too many recent failures")
+                return None
+            metrics = self._start_metrics(name, command, streaming=True, queued_at=queued_at)
             try:
+                # reserved_tokens is False until the request has passed the rate limiter
+                if reserved_tokens is False:
+                    reserved_tokens = self._admit(name, prompt, params)
+                metrics.reserved_tokens = reserved_tokens
+                self._mark_pool_used(name)
+                metrics.mark_started()
                 stream_response = model.invoke_stream(prompt, payload)
+                if stream_response and on_start:
+                    on_start(lambda: self._cancel_stream(model, stream_response, metrics))
                 if stream_response and hasattr(model, 'process_stream_response'):
-                    return model.process_stream_response(stream_response)
+                    chunks = model.process_stream_response(
+                        stream_response,
+                        on_metadata=lambda metadata: metrics.record_usage(model.extract_usage(metadata)),
+                    )
+                    if cache_key:
+                        chunks = self._cache_stream(chunks, cache_key)
+                    return self._measure_stream(chunks, metrics)
                 else:
-                    return iter([])  # Return empty iterator if no response
+                    self._finish_metrics(metrics, "no stream response")
+                    return None
             except Exception as e:
                 print(f"Streaming error: {e}")
-                return iter([])  # Return empty iterator on error
+                self._finish_metrics(metrics, e)
+                return None
         else:
             # Fallback to regular invoke if streaming not supported
             print("streaming not supported, falling back to regular invoke")
             try:
-                response = self.invoke_model(prompt)
-                return iter([response])  # Return single response as iterator
+                response = self._invoke_once(prompt, command, name, params, queued_at, reserved_tokens)
+                return None if response is None else iter([response])  # Return single response as iterator
             except Exception as e:
                 print(f"Fallback error: {e}")
-                return iter([])  # Return empty iterator on error
+                return None
 
-    def invoke_model(self, prompt):
-        model = self.models.get(self.default_model, self.models["llama"])
-        payload = {
-            "prompt": prompt,
-            "max_tokens": self.max_tokens,
-            "temperature": self.temperature,
-        }
-        print("invoke model")
-        response = model.invoke(prompt, payload)
-        print("got response")
+    def _mark_pool_used(self, name):
+        # Invokers keep their client, so the pool only hears about requests here
+        if name.split("@")[0] in BEDROCK_MODELS:
+            self.bedrock_pool.mark_used()
+
+    @staticmethod
+    def _cancel_stream(model, stream_response, metrics):
+        """Abort a stream on purpose, without counting it against the backend"""
+        metrics.cancelled = True
+        model.close_stream(stream_response)
+
+    def _invoke(self, prompt, command, model_name, params, queued_at=None, reserved_tokens=False):
+        prompt = self._enforce_budget(prompt, model_name, params)
+        chain = self._failover_chain(model_name)
+        for index, name in enumerate(chain):
+            try:
+                response = self._invoke_once(prompt, command, name, params, queued_at, reserved_tokens)
+            except Exception:
+                if index == len(chain) - 1:
+                    raise
+                response = None
+            if response is not None:
+                return response
+            reserved_tokens = False
+        return INVOKE_ERROR
+
+    def _invoke_once(self, prompt, command, name, params, queued_at=None, reserved_tokens=False):
+        """Invoke one backend; None if it is unavailable or returned no response"""
+        model = self.models[name]
+        payload = self._build_payload(prompt, name, params)
+        cache_key = self._cache_key(model, payload)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                metrics = self._start_metrics(name, command, streaming=False, queued_at=queued_at)
+                metrics.cache_hit = True
+                self._finish_metrics(metrics)
+                return cached
+        if not self.circuit_breaker(name).allow_request():
+            print(f"Skipping {name}: too many recent failures")
+            return None
+        metrics = self._start_metrics(name, command, streaming=False, queued_at=queued_at)
+        if reserved_tokens is False:
+            reserved_tokens = self._admit(name, prompt, params)
+        metrics.reserved_tokens = reserved_tokens
+        self._mark_pool_used(name)
+        metrics.mark_started()
+        try:
+            response = model.invoke(prompt, payload)
+        except Exception as e:
+            self._finish_metrics(metrics, e)
+            raise
         if response is None:
-            return "Error while invoking the model"
-        return model.process_response(response)
+            self._finish_metrics(metrics, "no response")
+            return None
+        metrics.record_usage(model.extract_usage(response))
+        self._finish_metrics(metrics)
+        text = model.process_response(response)
+        # Error strings are returned like answers but must not be replayed later
+        if cache_key and not is_error_response(text):
+            self.response_cache.put(cache_key, text)
+        return text
+
+    def _get_executor(self):
+        # Imported on first use, like the SDKs, so startup stays fast
+        from concurrent.futures import ThreadPoolExecutor
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix="model-request"
+                )
+            return self._executor
+
+    async def ainvoke(self, prompt, command=None, model_name=None, **params):
+        """
+        Async counterpart of invoke_model.
+
+        Requests run on a bounded worker pool, so any number can be awaited
+        at once while at most ``max_concurrency`` are in flight; the time
+        spent waiting for a worker is reported as queue time.
+        """
+        queued_at = time.perf_counter()
+        # Rate limiting waits on the event loop rather than holding a worker
+        reserved_tokens = await self._aadmit(self._resolve_model(model_name)[0], prompt, params)
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(),
+            lambda: self._invoke(prompt, command, model_name, params, queued_at, reserved_tokens),
+        )
+
+    async def astream(self, prompt, command=None, model_name=None, **params):
+        """
+        Async counterpart of invoke_model_stream, used as
+        ``async for chunk in manager.astream(prompt)``.
+
+        The blocking stream is drained on a worker thread; leaving the loop
+        early stops the worker and closes the underlying stream.
+        """
+        queued_at = time.perf_counter()
+        reserved_tokens = await self._aadmit(self._resolve_model(model_name)[0], prompt, params)
+        import asyncio
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancelled = threading.Event()
+        finished = object()
+
+        def pump():
+            chunks = self._invoke_stream(
+                prompt, command, model_name, params, queued_at, reserved_tokens=reserved_tokens
+            )
+            try:
+                for chunk in chunks:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, _StreamFailure(e))
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+        worker = loop.run_in_executor(self._get_executor(), pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, _StreamFailure):
+                    raise item.error
+                yield item
+        finally:
+            cancelled.set()
+            if not worker.done():
+                # Don't wait for a cancelled worker to notice; it exits on its next chunk
+                worker.add_done_callback(lambda future: future.exception())
+            else:
+                await worker
@@ -0,0 +1,37 @@
+from models.token_budget import estimate_tokens
+
+
+class ModelRouter:
+    """
+    Picks the model and max_tokens for a request from declarative rules.
+
+    A rule matches on ``commands`` (any command if omitted) and on the
+    ``min_input_tokens``/``max_input_tokens`` range of the estimated input
+    size. The first matching rule supplies ``model`` and/or ``max_tokens``;
+    requests that match no rule keep the default model and settings.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = list(rules or [])
+
+    @staticmethod
+    def _matches(rule, command, input_tokens):
+        if "commands" in rule and command not in rule["commands"]:
+            return False
+        if input_tokens < rule.get("min_input_tokens", 0):
+            return False
+        max_input_tokens = rule.get("max_input_tokens")
+        return max_input_tokens is None or input_tokens <= max_input_tokens
+
+    def route(self, command, prompt):
+        """Return the invoke keyword arguments (model_name, max_tokens) for a request"""
+        input_tokens = estimate_tokens(prompt)
+        for rule in self.rules:
+            if self._matches(rule, command, input_tokens):
+                params = {}
+                if "model" in rule:
+                    params["model_name"] = rule["model"]
+                if "max_tokens" in rule:
+                    params["max_tokens"] = rule["max_tokens"]
+                return params
+        return {}
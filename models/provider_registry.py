@@ -0,0 +1,48 @@
+import threading
+
+
+class ProviderRegistry:
+    """
+    Maps model names to invokers, building each invoker on first use.
+
+    Factories are expected to import their provider SDK themselves, so a
+    provider that is never used never costs an import or a client.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, factory):
+        """Register a zero-argument factory that builds the invoker for ``name``"""
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def is_loaded(self, name):
+        """Whether the invoker for ``name`` has been built yet"""
+        return name in self._instances
+
+    def __getitem__(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def get(self, name, default=None):
+        if name not in self._factories:
+            return default
+        return self[name]
+
+    def __contains__(self, name):
+        return name in self._factories
+
+    def __iter__(self):
+        return iter(list(self._factories))
+
+    def keys(self):
+        return list(self._factories)
@@ -0,0 +1,116 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A bucket refilled at ``rate_per_minute`` holding at most
+    ``burst_seconds`` worth of budget.
+
+    Callers reserve budget up front; the level may go negative, in which case
+    the reservation is due once the bucket has refilled back to zero. This
+    spreads queued requests evenly instead of releasing them in bursts.
+    Not thread-safe on its own; RateLimiter serializes access.
+    """
+
+    def __init__(self, rate_per_minute, burst_seconds=10):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now, scale=1.0):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * scale)
+        self.updated = now
+
+    def reserve(self, amount, scale=1.0):
+        """Take ``amount`` and return how many seconds until it is covered"""
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level / (self.rate * scale)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter shared by all threads
+    and tasks calling one model.
+
+    When the provider throttles anyway, the refill rate is halved (at most
+    once per ``decrease_interval`` seconds, down to ``min_scale``) and grows
+    back by ``increase_step`` with every successful request, so the budget
+    settles just under what the endpoint accepts.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, burst_seconds=10,
+                 min_scale=0.1, increase_step=0.05, decrease_interval=1.0):
+        self.requests = TokenBucket(requests_per_minute, burst_seconds) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute else None
+        self.min_scale = min_scale
+        self.increase_step = increase_step
+        self.decrease_interval = decrease_interval
+        self.scale = 1.0
+        self.throttle_count = 0
+        self._last_decrease = None
+        self._lock = threading.Lock()
+
+    def _buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def reserve(self, tokens=0):
+        """Reserve one request and ``tokens``; returns the seconds to wait before sending"""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for bucket in self._buckets():
+                bucket.refill(now, self.scale)
+            if self.requests:
+                wait = max(wait, self.requests.reserve(1, self.scale))
+            if self.tokens and tokens:
+                wait = max(wait, self.tokens.reserve(tokens, self.scale))
+            return wait
+
+    def acquire(self, tokens=0):
+        """Block until the request may be sent; returns the time waited"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens=0):
+        """Async counterpart of acquire"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            import asyncio
+            await asyncio.sleep(wait)
+        return wait
+
+    def charge(self, tokens):
+        """Account for tokens that were used beyond what was reserved"""
+        if not self.tokens or not tokens:
+            return
+        with self._lock:
+            self.tokens.refill(time.monotonic(), self.scale)
+            self.tokens.level -= tokens
+
+    def on_throttle(self):
+        """The provider rejected a request for exceeding its quota"""
+        with self._lock:
+            now = time.monotonic()
+            # One burst of throttled in-flight requests counts as a single signal
+            if self._last_decrease is not None and now - self._last_decrease < self.decrease_interval:
+                return
+            self._last_decrease = now
+            self.throttle_count += 1
+            for bucket in self._buckets():
+                bucket.refill(now, self.scale)
+            self.scale = max(self.min_scale, self.scale / 2)
+
+    def on_success(self):
+        """A request went through; slowly restore the budget"""
+        with self._lock:
+            if self.scale < 1.0:
+                now = time.monotonic()
+                for bucket in self._buckets():
+                    bucket.refill(now, self.scale)
+                self.scale = min(1.0, self.scale + self.increase_step)
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import deque
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of values using linear interpolation"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+class RequestMetrics:
+    """Timing and usage measurements for a single model request"""
+
+    def __init__(self, model, command=None, streaming=False):
+        self.model = model
+        self.command = command
+        self.streaming = streaming
+        self.created_at = time.perf_counter()
+        self.started_at = None
+        self.first_token_at = None
+        self.last_token_at = None
+        self.finished_at = None
+        self.inter_token_gaps = []
+        self.chunk_count = 0
+        self.input_tokens = None
+        self.output_tokens = None
+        self.server_latency_ms = None
+        # Input tokens served from / written to the provider's prompt cache
+        self.prompt_cache_read_tokens = None
+        self.prompt_cache_write_tokens = None
+        self.cache_hit = False
+        # Input tokens reserved with the rate limiter before sending, if any
+        self.reserved_tokens = None
+        # Aborted on purpose (e.g. lost a race) rather than failed
+        self.cancelled = False
+        self.error = None
+
+    def mark_started(self):
+        """The request left the client-side queue and was sent to the provider"""
+        self.started_at = time.perf_counter()
+
+    def mark_token(self):
+        """A chunk of output arrived"""
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.inter_token_gaps.append(now - self.last_token_at)
+        self.last_token_at = now
+        self.chunk_count += 1
+
+    def mark_finished(self, error=None):
+        """The response completed, or failed with ``error``"""
+        self.finished_at = time.perf_counter()
+        if self.first_token_at is None and error is None:
+            self.first_token_at = self.finished_at
+        self.error = error
+
+    def record_usage(self, usage):
+        """Record provider-reported usage as returned by ModelInvoker.extract_usage"""
+        if not usage:
+            return
+        self.input_tokens = usage.get("input_tokens", self.input_tokens)
+        self.output_tokens = usage.get("output_tokens", self.output_tokens)
+        self.server_latency_ms = usage.get("latency_ms", self.server_latency_ms)
+        self.prompt_cache_read_tokens = usage.get("cache_read_tokens", self.prompt_cache_read_tokens)
+        self.prompt_cache_write_tokens = usage.get("cache_write_tokens", self.prompt_cache_write_tokens)
+
+    @property
+    def queue_time(self):
+        if self.started_at is None:
+            return None
+        return self.started_at - self.created_at
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.created_at
+
+    @property
+    def first_token_latency(self):
+        """
+        Backend latency of a stream: time from sending the request to its
+        first token, excluding queueing and rate limiting. None for
+        non-streaming requests, whose first token is the whole answer.
+        """
+        if not self.streaming or not self.chunk_count or self.started_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def total_latency(self):
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.created_at
+
+    @property
+    def tokens_per_second(self):
+        """Output tokens per second of generation time"""
+        if not self.output_tokens or self.finished_at is None:
+            return None
+        # For streams, measure from the first token so queueing and
+        # prompt processing don't dilute the generation rate
+        start = self.first_token_at if self.streaming else self.started_at
+        elapsed = self.finished_at - (start or self.created_at)
+        if elapsed <= 0:
+            return None
+        return self.output_tokens / elapsed
+
+    def to_dict(self):
+        return {
+            "model": self.model,
+            "command": self.command,
+            "streaming": self.streaming,
+            "queue_time": self.queue_time,
+            "time_to_first_token": self.time_to_first_token,
+            "inter_token_gaps": list(self.inter_token_gaps),
+            "total_latency": self.total_latency,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "server_latency_ms": self.server_latency_ms,
+            "prompt_cache_read_tokens": self.prompt_cache_read_tokens,
+            "prompt_cache_write_tokens": self.prompt_cache_write_tokens,
+            "tokens_per_second": self.tokens_per_second,
+            "cache_hit": self.cache_hit,
+            "error": str(self.error) if self.error else None,
+        }
+
+
+class MetricsRecorder:
+    """Thread-safe store of recent RequestMetrics with percentile summaries"""
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, max_records=1000):
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        with self._lock:
+            self._records.append(metrics)
+
+    def records(self, model=None, command=None):
+        with self._lock:
+            records = list(self._records)
+        return [
+            m for m in records
+            if (model is None or m.model == model) and (command is None or m.command == command)
+        ]
+
+    def summary(self, group_by="model"):
+        """
+        Summarize recorded requests grouped by ``model`` or ``command``.
+
+        Returns a dict mapping each group to its request, error and cache hit
+        counts, its prompt cache read/write tokens and p50/p95/p99 of time-to-first-token, total latency and tokens/sec.
+        """
+        groups = {}
+        for m in self.records():
+            groups.setdefault(getattr(m, group_by) or "-", []).append(m)
+
+        summary = {}
+        for key, records in groups.items():
+            ok = [m for m in records if m.error is None]
+            summary[key] = {
+                "count": len(records),
+                "errors": len(records) - len(ok),
+                "cache_hits": sum(1 for m in records if m.cache_hit),
+                "prompt_cache_read_tokens": sum(m.prompt_cache_read_tokens or 0 for m in records),
+                "prompt_cache_write_tokens": sum(m.prompt_cache_write_tokens or 0 for m in records),
+            }
+            for field in ("time_to_first_token", "total_latency", "tokens_per_second"):
+                values = [getattr(m, field) for m in ok if getattr(m, field) is not None]
+                summary[key][field] = {f"p{p}": percentile(values, p) for p in self.PERCENTILES}
+        return summary
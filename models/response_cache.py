@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Content-addressed model response cache backed by SQLite.
+
+    The database runs in WAL mode so several terminals can read and write the
+    same cache concurrently. Entries expire after ``ttl_seconds`` and the least
+    recently used ones are evicted once ``max_entries`` or ``max_bytes`` is
+    exceeded.
+
+    A cache that can't be read or written (locked, corrupt or on a full
+    disk) behaves as a miss and never fails the request it is serving.
+    """
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_entries=2000, max_bytes=50 * 1024 * 1024):
+        self.path = os.path.expanduser(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(model_id, inference_config, prompt):
+        """Hash of the model id, inference settings and prompt"""
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps(
+            {"model": model_id, "config": inference_config, "prompt": prompt_hash},
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for ``key``, or None if missing, expired or unreadable"""
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._connection.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                response, created_at = row
+                if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                    self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._connection.commit()
+                    return None
+                self._connection.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+                )
+                self._connection.commit()
+                return response
+            except sqlite3.Error as e:
+                self._rollback()
+                print(f"Response cache read failed: {e}")
+                return None
+
+    def put(self, key, response):
+        """Store a response and evict whatever no longer fits; failures are ignored"""
+        now = time.time()
+        with self._lock:
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, response, len(response.encode("utf-8")), now, now),
+                )
+                self._evict(now)
+                self._connection.commit()
+            except sqlite3.Error as e:
+                self._rollback()
+                print(f"Response cache write failed: {e}")
+
+    def _rollback(self):
+        try:
+            self._connection.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, now):
+        if self.ttl_seconds:
+            self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+        if self.max_entries:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS total"
+                " FROM responses) WHERE total > ?)",
+                (self.max_bytes,),
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
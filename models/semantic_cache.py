@@ -0,0 +1,209 @@
+import base64
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+from models.embeddings import split_for_embedding
+
+
+class SemanticCache:
+    """
+    Per-command cache of answers keyed by the meaning of the input text.
+
+    Inputs are split into parts the embedding model reads in full and each
+    part is embedded into an L2-normalized float16 vector. An answer is
+    reused when a new input has as many parts as a cached one and every
+    aligned pair of parts reaches a cosine similarity of ``threshold``, so two
+    long inputs that only differ near the end don't match. Inputs of more than
+    ``max_parts`` parts are not cached.
+
+    The embedding model is loaded on a background thread and the cache
+    simply misses until it is ready, so it never delays a request. New
+    entries are appended to ``path + ".jsonl"`` by a background writer; the
+    file is rewritten once it holds mostly evicted entries.
+    """
+
+    def __init__(self, load_embedder, path=None, threshold=0.92, max_entries=500, max_parts=32):
+        self.path = os.path.expanduser(path) if path else None
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_parts = max_parts
+        self.embedder = None
+        self._load_embedder = load_embedder
+        self._loader = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        # command -> [(vectors of shape (parts, dim), answer)], oldest first
+        self._entries = {}
+        # command -> {parts: (stacked vectors, answers)}, rebuilt after adds
+        self._groups = {}
+        # The last input embedded, as lookup and add see the same text
+        self._last_embedded = (None, None)
+        self._writes = None
+        self._logged = 0
+        if self.path:
+            self._load()
+
+    def start(self):
+        """Load the embedding model in the background"""
+        if self._loader is None:
+            self._loader = threading.Thread(target=self._load_model, name="semantic-cache", daemon=True)
+            self._loader.start()
+        return self
+
+    def _load_model(self):
+        try:
+            self.embedder = self._load_embedder()
+        except Exception as e:
+            print(f"Semantic cache disabled: {e}")
+        finally:
+            self._ready.set()
+
+    def wait_until_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    @property
+    def ready(self):
+        return self.embedder is not None
+
+    def _embed(self, text):
+        """Part vectors of ``text``, or None if it has too many parts to cache"""
+        last_text, last_vectors = self._last_embedded
+        if last_text == text:
+            return last_vectors
+        parts = split_for_embedding(text)
+        if not parts or len(parts) > self.max_parts:
+            vectors = None
+        else:
+            vectors = np.asarray(self.embedder(parts), dtype=np.float16)
+        self._last_embedded = (text, vectors)
+        return vectors
+
+    def _group(self, command, parts):
+        groups = self._groups.setdefault(command, {})
+        if parts not in groups:
+            entries = [(vectors, answer) for vectors, answer in self._entries.get(command, []) if len(vectors) == parts]
+            if entries:
+                groups[parts] = (np.stack([vectors for vectors, _ in entries]), [answer for _, answer in entries])
+            else:
+                groups[parts] = (None, [])
+        return groups[parts]
+
+    def lookup(self, command, text):
+        """Return (answer, similarity) of the closest cached input, or None"""
+        if not self.ready or not text:
+            return None
+        vectors = self._embed(text)
+        if vectors is None:
+            return None
+        with self._lock:
+            stacked, answers = self._group(command, len(vectors))
+        if stacked is None:
+            return None
+        # Similarity of each aligned pair of parts; an entry is as similar as its least similar part
+        scores = np.einsum("epd,pd->ep", stacked.astype(np.float32), vectors.astype(np.float32)).min(axis=1)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return answers[best], float(scores[best])
+
+    def add(self, command, text, answer):
+        """Remember the answer to ``text`` for later near-duplicates"""
+        if not self.ready or not text or not answer:
+            return
+        vectors = self._embed(text)
+        if vectors is None:
+            return
+        with self._lock:
+            self._append(command, vectors, answer)
+            if self.path:
+                self._log(command, vectors, answer)
+
+    def _append(self, command, vectors, answer):
+        entries = self._entries.setdefault(command, [])
+        entries.append((vectors, answer))
+        del entries[:-self.max_entries]
+        self._groups.pop(command, None)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
+
+    def _file(self):
+        return self.path + ".jsonl"
+
+    @staticmethod
+    def _record(command, vectors, answer):
+        return json.dumps({
+            "command": command,
+            "shape": list(vectors.shape),
+            "vectors": base64.b64encode(vectors.astype(np.float16).tobytes()).decode("ascii"),
+            "answer": answer,
+        }) + "\n"
+
+    def _load(self):
+        if not os.path.exists(self._file()):
+            return
+        try:
+            with open(self._file(), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        vectors = np.frombuffer(base64.b64decode(record["vectors"]), dtype=np.float16)
+                        vectors = vectors.reshape(record["shape"])
+                    except (ValueError, KeyError, TypeError):
+                        # A line torn by a crash mid-append
+                        continue
+                    self._append(record["command"], vectors, record["answer"])
+                    self._logged += 1
+        except OSError as e:
+            print(f"Ignoring unreadable semantic cache: {e}")
+            self._entries = {}
+
+    def _log(self, command, vectors, answer):
+        """Queue an entry for the writer thread; called with the lock held"""
+        if self._writes is None:
+            self._writes = queue.Queue()
+            threading.Thread(target=self._write_loop, name="semantic-cache-writer", daemon=True).start()
+        self._logged += 1
+        live = sum(len(entries) for entries in self._entries.values())
+        if self._logged > 2 * max(live, self.max_entries):
+            # Mostly evicted entries: rewrite the file with the live ones
+            entries = [
+                (name, entry_vectors, entry_answer)
+                for name, command_entries in self._entries.items()
+                for entry_vectors, entry_answer in command_entries
+            ]
+            self._logged = len(entries)
+            self._writes.put(("rewrite", entries))
+        else:
+            self._writes.put(("append", [(command, vectors, answer)]))
+
+    def _write_loop(self):
+        while True:
+            mode, entries = self._writes.get()
+            try:
+                records = [self._record(*entry) for entry in entries]
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if mode == "rewrite":
+                    # Write to a temporary file first so a crash never loses the cache
+                    with open(self._file() + ".tmp", "w", encoding="utf-8") as f:
+                        f.writelines(records)
+                    os.replace(self._file() + ".tmp", self._file())
+                else:
+                    with open(self._file(), "a", encoding="utf-8") as f:
+                        f.writelines(records)
+            except OSError as e:
+                print(f"Could not save the semantic cache: {e}")
+            finally:
+                self._writes.task_done()
+
+    def flush(self):
+        """Wait until every added entry is written"""
+        if self._writes is not None:
+            self._writes.join()
@@ -0,0 +1,113 @@
+import queue
+import threading
+
+
+_DONE = object()
+
+
+class _RaceFailure:
+    """Carries an exception from the winning stream's thread to the consumer"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class StreamRace:
+    """
+    Starts the same request on several providers and follows whichever
+    yields a first chunk first.
+
+    ``starters`` maps a provider name to a callable that takes an
+    ``on_start`` callback and returns the provider's chunk iterator; the
+    callback receives a handle to the started request so that
+    ``close_response(name, handle)`` can abort it. As soon as one stream produces a chunk, every
+    other stream is closed. Iterating the race yields the winner's chunks;
+    ``winner`` names it once known.
+    """
+
+    def __init__(self, starters, close_response):
+        self.starters = starters
+        self.close_response = close_response
+        self.winner = None
+        self._responses = {}
+        self._pending = len(starters)
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        for name, start in self.starters.items():
+            threading.Thread(target=self._run, args=(name, start), name=f"race-{name}", daemon=True).start()
+        return self
+
+    def _run(self, name, start):
+        chunks = None
+        error = None
+        try:
+            chunks = start(lambda response: self._register(name, response))
+            for chunk in chunks:
+                if self._cancelled.is_set() or not self._claim(name):
+                    return
+                self._queue.put(chunk)
+        except Exception as e:
+            error = e
+        finally:
+            # Only this thread iterates the chunks, so only it may close them;
+            # other threads abort a stream through close_response
+            if hasattr(chunks, "close"):
+                chunks.close()
+            self._finish(name, error)
+
+    def _register(self, name, response):
+        with self._lock:
+            lost = self._cancelled.is_set() or self.winner not in (None, name)
+            if not lost:
+                self._responses[name] = response
+        if lost:
+            self._close(name, response)
+
+    def _claim(self, name):
+        """Make ``name`` the winner if nobody else is; True if it is the winner"""
+        with self._lock:
+            if self.winner is not None:
+                return self.winner == name
+            self.winner = name
+            losers = [(other, response) for other, response in self._responses.items() if other != name]
+        for other, response in losers:
+            self._close(other, response)
+        return True
+
+    def _finish(self, name, error):
+        with self._lock:
+            self._pending -= 1
+            if self.winner == name:
+                self._queue.put(_RaceFailure(error) if error else _DONE)
+            elif self.winner is None and self._pending == 0:
+                # Nobody produced anything
+                self._queue.put(_DONE)
+
+    def _close(self, name, response):
+        try:
+            self.close_response(name, response)
+        except Exception:
+            pass
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _RaceFailure):
+                    raise item.error
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Abort every stream that is still running"""
+        self._cancelled.set()
+        with self._lock:
+            responses = list(self._responses.items())
+        for name, response in responses:
+            self._close(name, response)
@@ -0,0 +1,110 @@
+import math
+import re
+
+
+# Characters per token and tokens per word/punctuation piece for each model
+# family, measured on mixed English prose and code
+FAMILY_RATIOS = {
+    "claude": (3.5, 1.3),
+    "llama": (3.8, 1.25),
+    "titan": (4.0, 1.3),
+    "nova": (4.0, 1.3),
+    "openai": (4.0, 1.25),
+}
+DEFAULT_RATIOS = (4.0, 1.3)
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+POLICIES = ("reject", "trim", "chunk")
+
+
+def model_family(model_name):
+    """Family of a model name, e.g. "claude" for "claude@us-west-2" """
+    return (model_name or "").split("@")[0]
+
+
+def estimate_tokens(text, family=None):
+    """
+    Fast local estimate of the token count of ``text`` for a model family.
+
+    Takes the larger of a character-based and a word-based estimate, which
+    keeps dense code and long prose both from being undercounted.
+    """
+    if not text:
+        return 0
+    chars_per_token, tokens_per_piece = FAMILY_RATIOS.get(family, DEFAULT_RATIOS)
+    pieces = len(_PIECES.findall(text))
+    return math.ceil(max(len(text) / chars_per_token, pieces * tokens_per_piece))
+
+
+class BudgetCheck:
+    """Pre-flight estimate of a request against its model's context window and price"""
+
+    def __init__(self, model, input_tokens, max_output_tokens, context_window=None,
+                 input_price_per_1k=None, output_price_per_1k=None):
+        self.model = model
+        self.input_tokens = input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.context_window = context_window
+        self.input_price_per_1k = input_price_per_1k
+        self.output_price_per_1k = output_price_per_1k
+
+    @property
+    def available_input_tokens(self):
+        """Input tokens that fit next to the reserved output, or None if unknown"""
+        if not self.context_window:
+            return None
+        return max(0, self.context_window - self.max_output_tokens)
+
+    @property
+    def fits(self):
+        available = self.available_input_tokens
+        return available is None or self.input_tokens <= available
+
+    @property
+    def input_cost(self):
+        if self.input_price_per_1k is None:
+            return None
+        return self.input_tokens / 1000 * self.input_price_per_1k
+
+    @property
+    def max_cost(self):
+        """Cost if the model uses its whole output budget"""
+        if self.input_cost is None or self.output_price_per_1k is None:
+            return None
+        return self.input_cost + self.max_output_tokens / 1000 * self.output_price_per_1k
+
+    def describe(self):
+        text = f"~{self.input_tokens:,} input tokens for {self.model}"
+        if self.context_window:
+            text += f" (window {self.context_window:,}, {self.max_output_tokens:,} reserved for output)"
+        if self.input_cost is not None:
+            text += f", est. ${self.input_cost:.4f}"
+            if self.max_cost is not None:
+                text += f" up to ${self.max_cost:.4f}"
+        return text
+
+
+class TokenBudgetExceeded(Exception):
+    """A prompt does not fit its model's context window under the reject or chunk policy"""
+
+    def __init__(self, check, policy):
+        super().__init__(
+            f"Prompt of ~{check.input_tokens:,} tokens exceeds the {check.available_input_tokens:,} "
+            f"input tokens available for {check.model}"
+        )
+        self.check = check
+        self.policy = policy
+
+
+def trim_to_budget(text, max_tokens, family=None):
+    """
+    Cut the middle out of ``text`` so it fits ``max_tokens``, keeping the
+    beginning and the end, where instructions usually are.
+    """
+    tokens = estimate_tokens(text, family)
+    if tokens <= max_tokens:
+        return text
+    keep = int(len(text) * max_tokens / tokens * 0.95) // 2
+    removed = tokens - max_tokens
+    return f"{text[:keep]}\n\n[... about {removed:,} tokens trimmed ...]\n\n{text[len(text) - keep:]}"
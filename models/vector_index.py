@@ -0,0 +1,126 @@
+import os
+import threading
+
+import numpy as np
+
+
+class VectorIndex:
+    """
+    Append-only on-disk index of L2-normalized vectors with string keys.
+
+    Vectors are float16 rows appended to ``path + ".f16"`` and read back
+    through ``np.memmap``, so opening a large index costs nothing until it is
+    searched and adding vectors never rewrites the file. Keys are appended
+    one per line to ``path + ".keys"``, after a first line holding the
+    dimension; rows without a key (an interrupted append) are ignored.
+    """
+
+    # NumPy has no fast float16 matrix product, so rows are converted to
+    # float32 a block at a time, which also bounds the memory used
+    BLOCK_ROWS = 16384
+
+    def __init__(self, path, dim=None):
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.vectors_file = self.path + ".f16"
+        self.keys_file = self.path + ".keys"
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._keys = []
+        self._matrix = None
+        self._load()
+
+    def _load(self):
+        lines = []
+        if os.path.exists(self.keys_file):
+            with open(self.keys_file, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        if lines:
+            dim = int(lines[0])
+            if self.dim is not None and dim != self.dim:
+                raise ValueError(f"{self.keys_file} holds {dim}-dimensional vectors, not {self.dim}")
+            self.dim = dim
+            rows_bytes = os.path.getsize(self.vectors_file) if os.path.exists(self.vectors_file) else 0
+            self._keys = lines[1:rows_bytes // 2 // dim + 1]
+        self._remap()
+
+    def _remap(self):
+        if self._keys:
+            self._matrix = np.memmap(self.vectors_file, dtype=np.float16, mode="r", shape=(len(self._keys), self.dim))
+        else:
+            self._matrix = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._keys)
+
+    def keys(self):
+        with self._lock:
+            return list(self._keys)
+
+    def add(self, keys, vectors):
+        """Append ``vectors`` (one row per key) to the index"""
+        vectors = np.asarray(vectors, dtype=np.float16).reshape(len(keys), -1)
+        if not len(keys):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            if not os.path.exists(self.keys_file) or not os.path.getsize(self.keys_file):
+                with open(self.keys_file, "w", encoding="utf-8") as f:
+                    f.write(f"{self.dim}\n")
+            # Rows without a key from an interrupted append are overwritten
+            with open(self.vectors_file, "ab") as f:
+                f.truncate(len(self._keys) * self.dim * 2)
+                f.write(vectors.tobytes())
+            with open(self.keys_file, "a", encoding="utf-8") as f:
+                f.write("".join(f"{key}\n" for key in keys))
+            self._keys.extend(keys)
+            self._remap()
+
+    def retain(self, keys):
+        """Rewrite the files keeping only the rows whose key is in ``keys``"""
+        keys = set(keys)
+        with self._lock:
+            if self._matrix is None:
+                return
+            rows = [row for row, key in enumerate(self._keys) if key in keys]
+            kept = [self._keys[row] for row in rows]
+            with open(self.vectors_file + ".tmp", "wb") as f:
+                for start in range(0, len(rows), self.BLOCK_ROWS):
+                    f.write(np.asarray(self._matrix[rows[start:start + self.BLOCK_ROWS]]).tobytes())
+            with open(self.keys_file + ".tmp", "w", encoding="utf-8") as f:
+                f.write(f"{self.dim}\n" + "".join(f"{key}\n" for key in kept))
+            # Without a keys file the index loads empty, so a crash between
+            # the two renames loses rows but never pairs keys with wrong rows
+            os.remove(self.keys_file)
+            os.replace(self.vectors_file + ".tmp", self.vectors_file)
+            os.replace(self.keys_file + ".tmp", self.keys_file)
+            self._keys = kept
+            self._remap()
+
+    def _scores(self, matrix, vector):
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), self.BLOCK_ROWS):
+            block = matrix[start:start + self.BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ vector
+        return scores
+
+    def search(self, vector, k=5, min_score=None):
+        """The ``k`` keys most similar to ``vector`` as (key, cosine similarity), best first"""
+        with self._lock:
+            matrix, keys = self._matrix, self._keys
+        if matrix is None or k <= 0:
+            return []
+        scores = self._scores(matrix, np.asarray(vector, dtype=np.float32))
+        k = min(k, len(keys))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (keys[i], float(scores[i])) for i in top
+            if min_score is None or scores[i] >= min_score
+        ]
@@ -0,0 +1,347 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+from models.token_budget import estimate_tokens
+
+
+DEFAULT_EXTENSIONS = (
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".kt", ".go", ".rs", ".rb", ".php", ".cs",
+    ".c", ".h", ".cc", ".cpp", ".hpp", ".swift", ".scala", ".sh", ".sql", ".tf", ".yaml", ".yml",
+    ".toml", ".md",
+)
+SKIP_DIRECTORIES = {"node_modules", "__pycache__", "venv", "env", "build", "dist", "target", "vendor"}
+
+
+def chunk_code(text, max_tokens, family=None):
+    """
+    Split source code into (start_line, end_line, text) chunks of at most
+    about ``max_tokens``. Chunks end before a top-level block (an unindented
+    line after a blank one) where possible, otherwise at a line break.
+    Line numbers start at 1 and are inclusive.
+    """
+    lines = text.splitlines(keepends=True)
+    line_tokens = [estimate_tokens(line, family) for line in lines]
+    chunks = []
+    start = tokens = 0
+    boundary = None
+    i = 0
+    while i < len(lines):
+        if tokens + line_tokens[i] > max_tokens and i > start:
+            end = boundary or i
+            chunks.append((start, end))
+            start, boundary = end, None
+            tokens = sum(line_tokens[start:i])
+            continue
+        if i > start and lines[i][:1].strip() and not lines[i - 1].strip():
+            boundary = i
+        tokens += line_tokens[i]
+        i += 1
+    if start < len(lines):
+        chunks.append((start, len(lines)))
+    texts = [(first + 1, end, "".join(lines[first:end])) for first, end in chunks]
+    return [chunk for chunk in texts if chunk[2].strip()]
+
+
+class CodeIndex:
+    """
+    Embedding index of the source files of local repositories.
+
+    ``update`` walks a repository and re-chunks and re-embeds only the files
+    whose modification time and size changed and whose content hash differs.
+    Chunk text and file state live in SQLite next to a VectorIndex of the
+    chunk embeddings. Chunks of changed or deleted files are removed from
+    SQLite and their vectors are skipped at search time until there are
+    more of them than live ones, when the vector files are rewritten.
+
+    In the REPL the embedding model and index load on a background thread
+    (``start``); ``retrieve`` returns nothing until they are ready.
+    """
+
+    # Files embedded together in one model call and one transaction
+    BATCH_CHUNKS = 64
+    # Parts of a long query that are embedded and averaged
+    QUERY_CHUNKS = 16
+
+    def __init__(self, path, load_embedder, chunk_tokens=200, max_tokens=3000, top_k=8, min_similarity=0.3,
+                 extensions=DEFAULT_EXTENSIONS, max_file_bytes=200000):
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.chunk_tokens = chunk_tokens
+        self.max_tokens = max_tokens
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.extensions = tuple(extensions)
+        self.max_file_bytes = max_file_bytes
+        self.embedder = None
+        self.index = None
+        self._load_embedder = load_embedder
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(self.path + ".sqlite3", timeout=5, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " mtime REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " sha1 TEXT NOT NULL);"
+            # AUTOINCREMENT so the id of a removed chunk, which may still have
+            # a vector, is never given to another chunk
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " path TEXT NOT NULL,"
+            " start_line INTEGER NOT NULL,"
+            " end_line INTEGER NOT NULL,"
+            " text TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path);"
+        )
+        self._connection.commit()
+        # The chunk size the files were split with; another size re-chunks every file on the next update
+        if self._connection.execute("PRAGMA user_version").fetchone()[0] != chunk_tokens:
+            with self._connection:
+                self._connection.execute("UPDATE files SET mtime = 0, sha1 = ''")
+                self._connection.execute(f"PRAGMA user_version = {int(chunk_tokens)}")
+
+    def start(self):
+        """Load the model and index in the background"""
+        threading.Thread(target=self._start, name="code-index", daemon=True).start()
+        return self
+
+    def _start(self):
+        try:
+            self.open()
+        except Exception as e:
+            print(f"Code context disabled: {e}")
+        finally:
+            self._ready.set()
+
+    def wait_until_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    @property
+    def ready(self):
+        return self.index is not None
+
+    def open(self):
+        """Load the embedding model and the vector index"""
+        if self.index is not None:
+            return
+        from models.vector_index import VectorIndex
+
+        embedder = self._load_embedder()
+        if embedder is None:
+            raise RuntimeError("no embedding model is available")
+        self.embedder = embedder
+        index = VectorIndex(self.path)
+        self._repair(index)
+        self.index = index
+
+    def _repair(self, index):
+        """Embed saved chunks whose vectors were lost, e.g. by an interrupted rewrite"""
+        indexed = set(index.keys())
+        with self._lock:
+            missing = [
+                row for row in self._connection.execute("SELECT id, text FROM chunks ORDER BY id")
+                if str(row[0]) not in indexed
+            ]
+        for start in range(0, len(missing), self.BATCH_CHUNKS):
+            batch = missing[start:start + self.BATCH_CHUNKS]
+            index.add([str(row[0]) for row in batch], self.embedder([row[1] for row in batch]))
+
+    def __len__(self):
+        """Number of indexed chunks"""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _source_files(self, root):
+        for directory, subdirectories, files in os.walk(root):
+            subdirectories[:] = sorted(
+                name for name in subdirectories
+                if not name.startswith(".") and name not in SKIP_DIRECTORIES
+            )
+            for name in sorted(files):
+                if name.endswith(self.extensions):
+                    yield os.path.join(directory, name)
+
+    def update(self, root, on_progress=None):
+        """
+        Bring the index up to date with the files under ``root``. Returns
+        counts of "indexed", "unchanged" and "removed" files.
+        ``on_progress(path)`` is called for each file that is re-indexed.
+        """
+        self.open()
+        root = os.path.realpath(root)
+        with self._lock:
+            known = {
+                row[0]: row[1:]
+                for row in self._connection.execute(
+                    "SELECT path, mtime, size, sha1 FROM files WHERE path >= ? AND path < ?",
+                    (root + os.sep, root + os.sep + "\uffff"),
+                )
+            }
+        counts = {"indexed": 0, "unchanged": 0, "removed": 0}
+        batch = []
+        seen = set()
+        for path in self._source_files(root):
+            try:
+                stat = os.stat(path)
+                if stat.st_size > self.max_file_bytes:
+                    continue
+                seen.add(path)
+                previous = known.get(path)
+                if previous and previous[0] == stat.st_mtime and previous[1] == stat.st_size:
+                    counts["unchanged"] += 1
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            sha1 = hashlib.sha1(data).hexdigest()
+            if previous and previous[2] == sha1:
+                # Touched but not changed
+                with self._lock, self._connection:
+                    self._connection.execute(
+                        "UPDATE files SET mtime = ?, size = ? WHERE path = ?", (stat.st_mtime, stat.st_size, path)
+                    )
+                counts["unchanged"] += 1
+                continue
+            try:
+                chunks = chunk_code(data.decode("utf-8"), self.chunk_tokens)
+            except UnicodeDecodeError:
+                chunks = []
+            if on_progress is not None:
+                on_progress(path)
+            counts["indexed"] += 1
+            batch.append((path, stat.st_mtime, stat.st_size, sha1, chunks))
+            if sum(len(item[4]) for item in batch) >= self.BATCH_CHUNKS:
+                self._save(batch)
+                batch = []
+        if batch:
+            self._save(batch)
+
+        removed = [path for path in known if path not in seen]
+        if removed:
+            with self._lock, self._connection:
+                for path in removed:
+                    self._connection.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                    self._connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            counts["removed"] = len(removed)
+        self._compact()
+        return counts
+
+    def _save(self, batch):
+        """Replace the chunks of a batch of files; vectors are added before the commit"""
+        texts = [text for *_, chunks in batch for _, _, text in chunks]
+        vectors = self.embedder(texts) if texts else []
+        with self._lock, self._connection:
+            ids = []
+            for path, mtime, size, sha1, chunks in batch:
+                self._connection.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO files (path, mtime, size, sha1) VALUES (?, ?, ?, ?)",
+                    (path, mtime, size, sha1),
+                )
+                for start_line, end_line, text in chunks:
+                    cursor = self._connection.execute(
+                        "INSERT INTO chunks (path, start_line, end_line, text) VALUES (?, ?, ?, ?)",
+                        (path, start_line, end_line, text),
+                    )
+                    ids.append(str(cursor.lastrowid))
+            # If this fails the transaction rolls back and the files are
+            # picked up again by the next update
+            self.index.add(ids, vectors)
+
+    def _compact(self):
+        """Rewrite the vector files once most of their rows belong to removed chunks"""
+        with self._lock:
+            live = [str(row[0]) for row in self._connection.execute("SELECT id FROM chunks")]
+        if len(self.index) - len(live) > len(live):
+            self.index.retain(live)
+
+    def _query_vector(self, text):
+        import numpy as np
+
+        # Embedding models only read the start of a long input, so long
+        # snippets are embedded part by part and the vectors averaged
+        parts = [chunk for _, _, chunk in chunk_code(text, self.chunk_tokens)][:self.QUERY_CHUNKS] or [text]
+        vector = np.asarray(self.embedder(parts), dtype=np.float32).mean(axis=0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def retrieve(self, text, max_tokens=None, family=None):
+        """
+        Indexed chunks most relevant to ``text`` as dicts with path,
+        start_line, end_line and text, as many as fit ``max_tokens``
+        (``self.max_tokens`` by default), ordered by file and line.
+        Chunks that ``text`` already contains are skipped.
+        """
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        if not self.ready or not text.strip() or budget <= 0:
+            return []
+        # Removed chunks may still have vectors, so ask for more than needed
+        hits = self.index.search(self._query_vector(text), k=self.top_k * 4, min_score=self.min_similarity)
+        if not hits:
+            return []
+        ids = [int(key) for key, _ in hits]
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT id, path, start_line, end_line, text FROM chunks WHERE id IN ({', '.join('?' * len(ids))})",
+                ids,
+            ).fetchall()
+        chunks = {row[0]: {"path": row[1], "start_line": row[2], "end_line": row[3], "text": row[4]} for row in rows}
+        selected = []
+        for chunk_id in ids:
+            chunk = chunks.get(chunk_id)
+            if chunk is None or chunk["text"].strip() in text:
+                continue
+            tokens = estimate_tokens(self.format_chunk(chunk), family)
+            if tokens > budget:
+                continue
+            selected.append(chunk)
+            budget -= tokens
+            if len(selected) == self.top_k:
+                break
+        return sorted(selected, key=lambda chunk: (chunk["path"], chunk["start_line"]))
+
+    @staticmethod
+    def format_chunk(chunk):
+        return f"{chunk['path']}:{chunk['start_line']}-{chunk['end_line']}\n```\n{chunk['text'].rstrip()}\n```"
+
+    @classmethod
+    def format_context(cls, chunks):
+        """Chunks as a context block for a code command"""
+        if not chunks:
+            return None
+        return "\n\n".join(["Relevant code from the indexed repository:"] + [cls.format_chunk(chunk) for chunk in chunks])
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def build_code_index(config):
+    """CodeIndex from the "code_index" config section, or None when disabled"""
+    settings = config.get("code_index", {})
+    if not settings.get("enabled"):
+        return None
+    model_name = settings.get("model", "all-MiniLM-L6-v2")
+
+    def load_embedder():
+        from models.embeddings import SentenceEmbedder
+        return SentenceEmbedder.load(model_name)
+
+    return CodeIndex(
+        settings.get("path", "~/.cache/my-dev-agent/code_index"),
+        load_embedder,
+        chunk_tokens=settings.get("chunk_tokens", 200),
+        max_tokens=settings.get("max_tokens", 3000),
+        top_k=settings.get("top_k", 8),
+        min_similarity=settings.get("min_similarity", 0.3),
+        extensions=settings.get("extensions", DEFAULT_EXTENSIONS),
+        max_file_bytes=settings.get("max_file_bytes", 200000),
+    )
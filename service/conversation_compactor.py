@@ -0,0 +1,211 @@
+import threading
+import time
+
+from models.model_manager import is_error_response
+from models.token_budget import estimate_tokens, model_family
+from service.text_chunker import split_text
+
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "The user sends the current summary and the turns that follow it. "
+    "Reply with an updated summary in a few short markdown bullet points, keeping facts, "
+    "decisions, code identifiers and open questions. Reply with the summary only."
+)
+
+
+class ConversationCompactor:
+    """
+    Turn log that keeps a conversation inside a token budget.
+
+    Recent turns are kept verbatim. Once the log exceeds
+    ``max_history_tokens``, the oldest turns are folded into a rolling summary
+    by ``summary_model`` on a background thread, leaving about
+    ``keep_recent_tokens`` of verbatim turns. Each compaction only summarizes
+    the previous summary plus the newly folded turns. Folded turns longer
+    than ``max_fold_tokens`` are summarized part by part.
+
+    After a failed compaction the next one waits ``retry_after_seconds``,
+    doubling with every further failure. The error is kept for the REPL to
+    show (``pop_error``) rather than printed from the background thread.
+    """
+
+    MAX_RETRY_AFTER_SECONDS = 600
+
+    def __init__(self, model_manager, max_history_tokens=8000, keep_recent_tokens=4000,
+                 summary_model=None, min_recent_exchanges=2, max_fold_tokens=None, retry_after_seconds=30):
+        self.model_manager = model_manager
+        self.max_history_tokens = max_history_tokens
+        self.keep_recent_tokens = keep_recent_tokens
+        self.summary_model = summary_model
+        self.min_recent_exchanges = min_recent_exchanges
+        self.max_fold_tokens = max_fold_tokens or max_history_tokens
+        self.retry_after_seconds = retry_after_seconds
+        # {"role", "content", "command", "timestamp", "tokens"}, oldest first
+        self.turns = []
+        self.summary = ""
+        self._lock = threading.Lock()
+        self._compaction = None
+        self._failures = 0
+        self._retry_at = 0
+        self._error = None
+
+    def _tokens(self, text):
+        return estimate_tokens(text, model_family(self.model_manager.default_model))
+
+    def __len__(self):
+        """Number of exchanges kept verbatim"""
+        return len(self.turns) // 2
+
+    def add(self, user_input, ai_response, command=None):
+        """Log an exchange and start a compaction if the log is over budget"""
+        now = time.time()
+        with self._lock:
+            for role, content in (("user", user_input), ("assistant", ai_response)):
+                self.turns.append({
+                    "role": role, "content": content, "command": command,
+                    "timestamp": now, "tokens": self._tokens(content),
+                })
+        self._maybe_compact()
+
+    def load(self, exchanges):
+        """
+        Replace the log with the most recent of ``exchanges`` (dicts with
+        "user", "assistant", "command" and "timestamp", oldest first) that
+        fit ``keep_recent_tokens``. Older exchanges are left out rather than
+        summarized, so resuming a long session makes no model calls.
+        """
+        turns = []
+        for exchange in exchanges:
+            for role, content in (("user", exchange["user"]), ("assistant", exchange["assistant"])):
+                turns.append({
+                    "role": role, "content": content, "command": exchange.get("command"),
+                    "timestamp": exchange.get("timestamp"), "tokens": self._tokens(content),
+                })
+        recent = sum(turn["tokens"] for turn in turns)
+        start = 0
+        while recent > self.keep_recent_tokens and len(turns) - start > 2 * self.min_recent_exchanges:
+            recent -= turns[start]["tokens"] + turns[start + 1]["tokens"]
+            start += 2
+        with self._lock:
+            self.turns = turns[start:]
+            self.summary = ""
+            self._failures = 0
+            self._retry_at = 0
+
+    def clear(self):
+        with self._lock:
+            self.turns = []
+            self.summary = ""
+            self._failures = 0
+            self._retry_at = 0
+
+    def pop_error(self):
+        """The error of the last failed compaction not yet shown, if any"""
+        with self._lock:
+            error, self._error = self._error, None
+        return error
+
+    def history_tokens(self):
+        with self._lock:
+            return self._tokens(self.summary) + sum(turn["tokens"] for turn in self.turns)
+
+    def system_prompt(self, instructions):
+        """``instructions`` followed by the rolling summary of older turns, if any"""
+        with self._lock:
+            summary = self.summary
+        if not summary:
+            return instructions
+        return f"{instructions}\n\nSummary of the earlier conversation:\n{summary}"
+
+    def messages(self):
+        """
+        Verbatim turns as a model message list, oldest first. While a
+        compaction is still running the oldest turns are left out so the
+        result never exceeds the budget.
+        """
+        with self._lock:
+            turns = list(self.turns)
+            budget = self.max_history_tokens - self._tokens(self.summary)
+        total = sum(turn["tokens"] for turn in turns)
+        start = 0
+        # Drop whole exchanges so the list still starts with a user turn
+        while total > budget and len(turns) - start > 2 * self.min_recent_exchanges:
+            total -= turns[start]["tokens"] + turns[start + 1]["tokens"]
+            start += 2
+        return [{"role": turn["role"], "content": turn["content"]} for turn in turns[start:]]
+
+    def _fold_count(self):
+        """How many of the oldest turns to fold so about keep_recent_tokens remain"""
+        recent = sum(turn["tokens"] for turn in self.turns)
+        count = 0
+        while recent > self.keep_recent_tokens and len(self.turns) - count > 2 * self.min_recent_exchanges:
+            recent -= self.turns[count]["tokens"] + self.turns[count + 1]["tokens"]
+            count += 2
+        return count
+
+    def _maybe_compact(self):
+        with self._lock:
+            if self._compaction is not None or time.monotonic() < self._retry_at:
+                return
+            total = self._tokens(self.summary) + sum(turn["tokens"] for turn in self.turns)
+            if total <= self.max_history_tokens:
+                return
+            count = self._fold_count()
+            if not count:
+                return
+            folded = self.turns[:count]
+            summary = self.summary
+            self._compaction = threading.Thread(
+                target=self._compact, args=(summary, folded), name="conversation-compaction", daemon=True
+            )
+            self._compaction.start()
+
+    def _summarize(self, summary, transcript):
+        prompt = f"Current summary:\n{summary or '(none)'}\n\nTurns to add:\n{transcript}"
+        new_summary = self.model_manager.invoke_model(
+            prompt, command="compact_history", model_name=self.summary_model, system=SUMMARY_INSTRUCTIONS
+        )
+        if is_error_response(new_summary):
+            raise RuntimeError("the summary model returned no summary")
+        return new_summary.strip()
+
+    def _compact(self, summary, folded):
+        transcript = "\n\n".join(f"{turn['role'].capitalize()}: {turn['content']}" for turn in folded)
+        family = model_family(self.summary_model or self.model_manager.default_model)
+        error = None
+        try:
+            # Long turns, like a pasted document, are folded in one part at a time
+            for part in split_text(transcript, self.max_fold_tokens, family):
+                summary = self._summarize(summary, part)
+        except Exception as e:
+            error = e
+        with self._lock:
+            self._compaction = None
+            if error is not None:
+                # The turns stay verbatim; messages() keeps them within budget
+                self._failures += 1
+                delay = self.retry_after_seconds * 2 ** (self._failures - 1)
+                self._retry_at = time.monotonic() + min(delay, self.MAX_RETRY_AFTER_SECONDS)
+                self._error = f"Conversation compaction failed: {error}"
+                return
+            self._failures = 0
+            # Turns are only ever appended, so the folded ones are still first,
+            # unless the log was cleared in the meantime
+            if self.turns[:len(folded)] != folded:
+                return
+            self.turns = self.turns[len(folded):]
+            self.summary = summary
+        # Turns added while this compaction ran may already need the next one
+        self._maybe_compact()
+
+    def wait(self, timeout=None):
+        """Wait until no compaction is running"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            compaction = self._compaction
+            if compaction is None:
+                return
+            compaction.join(None if deadline is None else max(0, deadline - time.monotonic()))
+            if deadline is not None and time.monotonic() >= deadline:
+                return
@@ -0,0 +1,146 @@
+import os
+import queue
+import threading
+
+from models.token_budget import estimate_tokens
+
+
+class ExchangeRetriever:
+    """
+    Finds the saved exchanges most relevant to a follow-up question.
+
+    Every exchange in the SessionStore is embedded into a VectorIndex next
+    to the store's database. The embedding model and index load on a
+    background thread, which then indexes whatever was saved since the index
+    was last updated and keeps indexing new exchanges as the store writes
+    them. ``retrieve`` returns nothing until the index is ready.
+    """
+
+    # Characters of a response that go into its embedding; the start of an
+    # answer says what it is about, and embedding models truncate anyway
+    RESPONSE_CHARS = 1000
+
+    def __init__(self, session_store, load_embedder, index_path=None, top_k=4, max_tokens=2000,
+                 min_similarity=0.35):
+        self.session_store = session_store
+        self.index_path = os.path.expanduser(index_path or session_store.path + ".exchanges")
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+        self.min_similarity = min_similarity
+        self.embedder = None
+        self.index = None
+        self._load_embedder = load_embedder
+        self._pending = queue.Queue()
+        self._ready = threading.Event()
+        self._worker = None
+        self._last_id = 0
+
+    def start(self):
+        """Load the model and index in the background and follow the store's writes"""
+        if self._worker is None:
+            self.session_store.listeners.append(self._pending.put)
+            self._worker = threading.Thread(target=self._run, name="exchange-index", daemon=True)
+            self._worker.start()
+        return self
+
+    def wait_until_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    @property
+    def ready(self):
+        return self.index is not None
+
+    def _text(self, exchange):
+        return f"{exchange['user']}\n{exchange['assistant'][:self.RESPONSE_CHARS]}"
+
+    def _run(self):
+        try:
+            from models.vector_index import VectorIndex
+
+            embedder = self._load_embedder()
+            if embedder is None:
+                return
+            index = VectorIndex(self.index_path)
+            self.embedder = embedder
+            keys = index.keys()
+            self._last_id = int(keys[-1]) if keys else 0
+            behind = not self._catch_up(index)
+            self.index = index
+        except Exception as e:
+            print(f"Follow-up retrieval disabled: {e}")
+            return
+        finally:
+            self._ready.set()
+        while True:
+            exchanges = [self._pending.get()]
+            while True:
+                try:
+                    exchanges.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            if behind:
+                # Exchanges that failed to be indexed are read back from the store
+                behind = not self._catch_up(index)
+            else:
+                behind = not self._add(index, exchanges)
+
+    def _catch_up(self, index):
+        """Index exchanges saved after the last indexed one; False if indexing failed"""
+        while True:
+            exchanges = self.session_store.exchanges_since(self._last_id)
+            if not exchanges:
+                return True
+            if not self._add(index, exchanges):
+                return False
+
+    def _add(self, index, exchanges):
+        """Index new exchanges; False if they could not be indexed"""
+        # Ids only grow, so anything at or below the last indexed id was
+        # already picked up by the catch-up
+        exchanges = [exchange for exchange in exchanges if exchange["id"] > self._last_id]
+        if not exchanges:
+            return True
+        try:
+            vectors = self.embedder([self._text(exchange) for exchange in exchanges])
+            index.add([str(exchange["id"]) for exchange in exchanges], vectors)
+        except Exception as e:
+            print(f"Could not index exchanges: {e}")
+            return False
+        self._last_id = exchanges[-1]["id"]
+        return True
+
+    def retrieve(self, question, exclude=(), family=None):
+        """
+        The most relevant saved exchanges for ``question``, oldest first, as
+        many as fit ``max_tokens``. Exchanges whose user text is in
+        ``exclude`` (e.g. turns already sent verbatim) are skipped.
+        """
+        if not self.ready or not question:
+            return []
+        vector = self.embedder([question])[0]
+        hits = self.index.search(vector, k=self.top_k + len(exclude), min_score=self.min_similarity)
+        by_id = {exchange["id"]: exchange for exchange in self.session_store.exchanges_by_id(int(key) for key, _ in hits)}
+        selected = []
+        budget = self.max_tokens
+        for key, _ in hits:
+            exchange = by_id.get(int(key))
+            if exchange is None or exchange["user"] in exclude:
+                continue
+            tokens = estimate_tokens(f"{exchange['user']}\n{exchange['assistant']}", family)
+            if tokens > budget:
+                continue
+            selected.append(exchange)
+            budget -= tokens
+            if len(selected) == self.top_k:
+                break
+        return sorted(selected, key=lambda exchange: exchange["id"])
+
+    @staticmethod
+    def format_context(exchanges):
+        """Exchanges as a context block for a follow-up prompt"""
+        if not exchanges:
+            return None
+        parts = ["Relevant earlier exchanges:"]
+        for exchange in exchanges:
+            parts.append(f"User: {exchange['user']}\nAssistant: {exchange['assistant']}")
+        return "\n\n".join(parts)
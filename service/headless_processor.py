@@ -0,0 +1,80 @@
+# service/headless_processor.py
+import sys
+
+from service.live_markdown_processor import LiveMarkdownProcessor
+
+
+class HeadlessProcessor(LiveMarkdownProcessor):
+    """
+    Text processor for pipes and scripts.
+
+    Uses the same command prompts as LiveMarkdownProcessor but writes tokens
+    straight to the output stream as they arrive, without any Live display,
+    panels or markdown parsing.
+    """
+
+    def __init__(self, model_manager, output=None):
+        super().__init__(model_manager)
+        self.output = output or sys.stdout
+
+    def _write(self, text):
+        self.output.write(text)
+        self.output.flush()
+
+    def _accept_similar_answer(self, similarity):
+        # There is nobody to ask in a pipe, so only reuse when configured to
+        return self.model_manager.semantic_cache_mode == "return"
+
+    def _show_similar_answer(self, answer, similarity, title):
+        self._write(answer)
+        self._write("\n")
+
+    def _report_budget(self, check):
+        print(check.describe(), file=sys.stderr)
+
+    def _show_error(self, error):
+        print(f"Error: {error}", file=sys.stderr)
+
+    def _report_progress(self, done, total):
+        print(f"Summarized part {done}/{total}", file=sys.stderr)
+
+    def _stream_response(self, prompt, title, command, route=None):
+        """Stream raw tokens to the output stream"""
+        if route is None:
+            route = self._route(prompt, command)
+        model_name = route.get("model_name", self.model_manager.default_model)
+        if not self.model_manager.is_streaming_supported(model_name):
+            response = self.model_manager.invoke_model(prompt, command=command, **route)
+            self._write(response)
+            self._write("\n")
+            return response
+
+        response_chunks = []
+        chunks = stream = self._open_stream(prompt, command, route)
+        resume_attempts = 0
+        while True:
+            try:
+                for chunk in chunks:
+                    response_chunks.append(chunk)
+                    self._write(chunk)
+                break
+            except Exception as e:
+                # Continue from what was already written rather than starting over
+                partial = "".join(response_chunks)
+                chunks = None
+                if partial.strip() and resume_attempts < self.MAX_RESUME_ATTEMPTS:
+                    chunks = self.model_manager.resume_model_stream(
+                        prompt, partial, command=command,
+                        **dict(route, model_name=getattr(stream, "winner", route.get("model_name"))),
+                    )
+                if chunks is None:
+                    raise
+                resume_attempts += 1
+                print(f"Stream interrupted ({e}), resuming...", file=sys.stderr)
+        self._write("\n")
+        return "".join(response_chunks)
+
+    def null(self, text):
+        """Null operation - echo the input"""
+        self._write(text)
+        return text
@@ -0,0 +1,202 @@
+# service/incremental_markdown.py
+import re
+
+from rich.markdown import Markdown
+from rich.segment import Segment
+from rich.style import Style
+
+
+FENCE_PATTERN = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+HEADING_PATTERN = re.compile(r"^ {0,3}#{1,6}(\s|$)")
+LIST_ITEM_PATTERN = re.compile(r"^ {0,3}([-*+]|\d{1,9}[.)])(\s|$)")
+
+
+def _render_markdown_lines(console, markdown, options):
+    """Render markdown to lines without the blank lines rich puts around blocks"""
+    lines = console.render_lines(markdown, options, pad=False)
+    while lines and not lines[0]:
+        lines.pop(0)
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+class _CompletedBlock:
+    """A finished markdown block, parsed once and rendered once per width"""
+
+    def __init__(self, text, code_theme):
+        self.text = text
+        self.markdown = Markdown(text, code_theme=code_theme)
+        self._lines_by_width = {}
+
+    def render_lines(self, console, options):
+        """Return the rendered lines for the given width, rendering on first use"""
+        lines = self._lines_by_width.get(options.max_width)
+        if lines is None:
+            lines = _render_markdown_lines(console, self.markdown, options)
+            # Only the current terminal width is worth keeping around
+            self._lines_by_width = {options.max_width: lines}
+        return lines
+
+
+class IncrementalMarkdownRenderer:
+    """
+    Markdown renderable for streamed text.
+
+    Text is fed in chunks. Paragraphs, lists, headings and fenced code blocks
+    are parsed and rendered once as soon as they are complete; only the open
+    trailing block is re-parsed on every frame.
+    """
+
+    def __init__(self, code_theme="monokai"):
+        self.code_theme = code_theme
+        self._chunks = []
+        self._blocks = []
+        self._open_lines = []
+        self._partial_line = ""
+        self._fence = None
+        self._blank_seen = False
+
+    @property
+    def text(self):
+        """The full text received so far"""
+        return "".join(self._chunks)
+
+    @property
+    def completed_blocks(self):
+        """Source text of every completed block"""
+        return [block.text for block in self._blocks]
+
+    @property
+    def open_block(self):
+        """Source text of the trailing block that is still being streamed"""
+        lines = list(self._open_lines)
+        if self._partial_line:
+            if self._blank_seen:
+                lines.append("")
+            lines.append(self._partial_line)
+        return "\n".join(lines)
+
+    def feed(self, chunk):
+        """Add a streamed chunk, completing any blocks it closes"""
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        lines = (self._partial_line + chunk).split("\n")
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._consume_line(line)
+        # A paragraph is known to be complete as soon as the next one starts
+        if self._blank_seen and self._partial_line[:1].strip() and not self._fence:
+            if not LIST_ITEM_PATTERN.match(self._open_lines[0]):
+                self._commit_open_block()
+
+    def close(self):
+        """Mark the stream as finished and complete the trailing block"""
+        if self._partial_line:
+            self._consume_line(self._partial_line)
+            self._partial_line = ""
+        self._commit_open_block()
+        self._fence = None
+
+    def _consume_line(self, line):
+        if self._fence:
+            self._open_lines.append(line)
+            if line.strip().startswith(self._fence) and not line.strip().strip(self._fence[0]):
+                self._fence = None
+                self._commit_open_block()
+            return
+
+        if not line.strip():
+            if self._open_lines:
+                self._blank_seen = True
+            return
+
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match or HEADING_PATTERN.match(line):
+            self._commit_open_block()
+        elif self._blank_seen and not self._continues_open_block(line):
+            self._commit_open_block()
+        elif self._blank_seen:
+            self._open_lines.append("")
+        self._blank_seen = False
+
+        self._open_lines.append(line)
+        if fence_match:
+            self._fence = fence_match.group(1)
+        elif HEADING_PATTERN.match(line):
+            self._commit_open_block()
+
+    def _continues_open_block(self, line):
+        """Whether a line after a blank line still belongs to the open block"""
+        if line[0] in " \t":
+            return True
+        return bool(LIST_ITEM_PATTERN.match(line) and LIST_ITEM_PATTERN.match(self._open_lines[0]))
+
+    def _commit_open_block(self):
+        self._blank_seen = False
+        if not self._open_lines:
+            return
+        self._blocks.append(_CompletedBlock("\n".join(self._open_lines), self.code_theme))
+        self._open_lines = []
+
+    def tail_lines(self, console, options, count):
+        """
+        Render only the last ``count`` lines.
+
+        Completed blocks are visited from the end and only until the window is
+        full, so the cost does not grow with the length of the response.
+        Returns the lines and whether anything above them was cut off.
+        """
+        lines = []
+        open_block = self.open_block
+        if open_block.strip():
+            markdown = Markdown(open_block, code_theme=self.code_theme)
+            lines = _render_markdown_lines(console, markdown, options)
+
+        remaining = len(self._blocks)
+        while remaining and len(lines) < count:
+            remaining -= 1
+            block_lines = self._blocks[remaining].render_lines(console, options)
+            lines = block_lines + ([[]] if lines else []) + lines
+
+        truncated = remaining > 0 or len(lines) > count
+        return lines[-count:], truncated
+
+    def __rich_console__(self, console, options):
+        options = options.update(height=None)
+        new_line = Segment.line()
+        first = True
+        for block in self._blocks:
+            if not first:
+                yield new_line
+            first = False
+            for line in block.render_lines(console, options):
+                yield from line
+                yield new_line
+
+        open_block = self.open_block
+        if open_block.strip():
+            if not first:
+                yield new_line
+            markdown = Markdown(open_block, code_theme=self.code_theme)
+            for line in _render_markdown_lines(console, markdown, options):
+                yield from line
+                yield new_line
+
+
+class MarkdownTailView:
+    """Renders only the visible tail window of an IncrementalMarkdownRenderer"""
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+
+    def __rich_console__(self, console, options):
+        height = options.height or console.height
+        lines, truncated = self.renderer.tail_lines(console, options.update(height=None), height)
+        if truncated and lines:
+            lines[0] = [Segment("↑ earlier output above", Style(dim=True))]
+        new_line = Segment.line()
+        for line in lines:
+            yield from line
+            yield new_line
@@ -5,69 +5,369 @@ from rich.live import Live
 from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.text import Text
+from contextlib import contextmanager
+from models.token_budget import TokenBudgetExceeded, model_family
+from service.incremental_markdown import IncrementalMarkdownRenderer, MarkdownTailView
+from service.map_reduce_summarizer import REDUCE_SYSTEM
+from service.text_chunker import split_text
+from service.utils.stream_reader import StreamReader
 import time
 import re
 
 
 class LiveMarkdownProcessor:
     """Text processor that renders markdown in real-time during streaming"""
+
+    # Frame pacing: render at most this often, and never spend more than
+    # RENDER_DUTY_CYCLE of wall time painting the terminal
+    MIN_FRAME_INTERVAL = 1 / 30
+    MAX_FRAME_INTERVAL = 0.5
+    RENDER_DUTY_CYCLE = 0.5
+    # How many times an interrupted stream is continued before giving up
+    MAX_RESUME_ATTEMPTS = 2
+
+    # Title, instructions and input template of each command. The
+    # instructions are sent as the system prompt, a stable prefix the
+    # provider can cache, and only the user's text ({text}) varies
+    COMMAND_PROMPTS = {
+        "summarize": (
+            "📝 Text Summary",
+            "Summarize the text the user sends and format your response in markdown.\n"
+            "Use markdown formatting including:\n"
+            "- Headers for main points\n"
+            "- Bullet points for key details\n"
+            "- Bold/italic for emphasis where appropriate",
+            "{text}",
+        ),
+        "critical_response": (
+            "🔍 Critical Analysis",
+            "Provide a critical analysis of the text the user sends using markdown formatting.\n"
+            "Include:\n"
+            "- Main arguments\n"
+            "- Supporting evidence\n"
+            "- Potential counterarguments\n"
+            "- Your evaluation",
+            "{text}",
+        ),
+        "response": (
+            "💭 AI Response",
+            "Generate a detailed response to the text the user sends using markdown formatting.",
+            "{text}",
+        ),
+        "rewrite_code": (
+            "🔧 Code Rewrite",
+            "Rewrite and improve the code the user sends. Format your response in markdown.\n"
+            "Include:\n"
+            "- Improved code in a code block\n"
+            "- Explanation of changes\n"
+            "- Best practices applied",
+            "```\n{text}\n```",
+        ),
+        "unit_test": (
+            "🧪 Unit Tests",
+            "Generate unit tests for the code the user sends using markdown formatting.\n"
+            "Include:\n"
+            "- Complete unit test code\n"
+            "- Test cases for different scenarios\n"
+            "- Explanation of test strategy",
+            "```\n{text}\n```",
+        ),
+        "list_typos": (
+            "📝 Typo Check",
+            "Identify and list any typos or grammatical errors in the text the user sends.\n"
+            "Format your response in markdown with:\n"
+            "- List of errors found\n"
+            "- Suggested corrections\n"
+            "- Corrected version if needed",
+            "{text}",
+        ),
+        "code_review": (
+            "👀 Code Review",
+            "Perform a comprehensive code review of the code the user sends.\n"
+            "Include in your markdown response:\n"
+            "- Code quality assessment\n"
+            "- Security considerations\n"
+            "- Performance improvements\n"
+            "- Best practices recommendations\n"
+            "- Potential bugs or issues",
+            "```\n{text}\n```",
+        ),
+        "sec_review": (
+            "🔒 Security Review",
+            "Perform a security review of the code or text the user sends.\n"
+            "Focus on:\n"
+            "- Security vulnerabilities\n"
+            "- Potential attack vectors\n"
+            "- Security best practices\n"
+            "- Recommendations for improvement\n"
+            "Format your response in markdown.",
+            "```\n{text}\n```",
+        ),
+        "reword": (
+            "✏️ Text Rewrite",
+            "Reword and improve the text the user sends while maintaining its meaning.\n"
+            "Make it:\n"
+            "- More clear and concise\n"
+            "- Better structured\n"
+            "- More engaging\n"
+            "Format your response in markdown.",
+            "{text}",
+        ),
+    }
+    # Commands that get relevant code from the CodeIndex as context
+    CODE_COMMANDS = {"rewrite_code", "unit_test", "code_review", "sec_review"}
     
     def __init__(self, model_manager):
         self.model_manager = model_manager
         self.console = Console()
+        # Commands whose requests are raced across ModelManager.racing_models
+        self.race_commands = set()
+        self._racing = False
+        # Optional ModelRouter choosing model and max_tokens per request
+        self.router = None
+        # Optional MapReduceSummarizer for documents too large for one prompt
+        self.summarizer = None
+        # Optional CodeIndex of the user's repositories for code commands
+        self.code_index = None
+
+    @contextmanager
+    def racing(self):
+        """Race every request made inside the block, whatever the command"""
+        self._racing = True
+        try:
+            yield
+        finally:
+            self._racing = False
+
+    def _route(self, prompt, command):
+        """Invoke keyword arguments chosen by the router for this request"""
+        if self.router is None:
+            return {}
+        return dict(self.router.route(command, prompt))
+
+    def _races(self, command):
+        return self._racing or command in self.race_commands
+
+    def _budget_route(self, prompt, command, route):
+        """``route`` naming the model whose context window limits the request"""
+        if not self._races(command):
+            return route
+        # Every racer gets the same prompt, so the smallest window applies
+        params = {key: value for key, value in route.items() if key != "model_name"}
+        return dict(params, model_name=self.model_manager.race_budget_model(prompt, **params))
+
+    def _open_stream(self, prompt, command, route):
+        """Start the model stream, racing providers when requested"""
+        if self._races(command):
+            # Racing picks its own models; only the size limit still applies
+            params = {key: value for key, value in route.items() if key != "model_name"}
+            return self.model_manager.race_model_stream(prompt, command=command, **params)
+        return self.model_manager.invoke_model_stream(prompt, command=command, **route)
+
+    def _run_command(self, command, text):
+        title, instructions, template = self.COMMAND_PROMPTS[command]
+        prompt = template.format(text=text)
+        return self._stream_with_live_markdown(
+            prompt, title, command=command, source_text=text, system=instructions,
+            context=self._code_context(command, prompt, text, instructions),
+        )
+
+    def _code_context(self, command, prompt, text, instructions):
+        """Indexed code relevant to ``text`` that fits in the context window next to the prompt"""
+        if self.code_index is None or command not in self.CODE_COMMANDS:
+            return None
+        route = self._budget_route(prompt, command, self._route(prompt, command))
+        check = self.model_manager.preflight(prompt, system=instructions, **route)
+        room = self.code_index.max_tokens
+        # Without a known context window only the configured budget applies
+        if check.available_input_tokens is not None:
+            room = min(room, check.available_input_tokens - check.input_tokens)
+        chunks = self.code_index.retrieve(text, max_tokens=room, family=model_family(check.model))
+        return self.code_index.format_context(chunks)
+
+    def _stream_with_live_markdown(self, prompt, title="AI Response", command=None, source_text=None,
+                                   system=None, context=None, messages=None):
+        """
+        Stream response with live markdown rendering.
+
+        ``system`` instructions, earlier ``messages`` of the conversation and
+        ``context`` are sent ahead of ``prompt`` as a prefix the provider can cache.
+        ``source_text`` is the user's input; when the semantic cache holds the
+        answer to a near-identical input for the same command it is reused.
+        Inputs too large for the model's context window are rejected or, under
+        the "chunk" budget policy, processed part by part.
+        """
+        similar = self._similar_answer(command, source_text, title)
+        if similar is not None:
+            return similar
+        route = self._route(prompt, command)
+        if system:
+            route["system"] = system
+        if context:
+            route["context"] = context
+        if messages:
+            route["messages"] = messages
+        check = self.model_manager.preflight(prompt, **self._budget_route(prompt, command, route))
+        self._report_budget(check)
+        policy = self.model_manager.budget_policy
+        if not check.fits and policy == "chunk" and source_text and command in self.COMMAND_PROMPTS:
+            response = self._process_in_chunks(command, source_text, route, check)
+        elif not check.fits and policy != "trim":
+            self._show_error(TokenBudgetExceeded(check, policy))
+            return None
+        else:
+            response = self._stream_response(prompt, title, command, route)
+        if source_text:
+            self.model_manager.remember_answer(command, source_text, response)
+        return response
+
+    def _similar_answer(self, command, source_text, title):
+        """Return a cached answer to a near-identical input if the user accepts it"""
+        if not source_text:
+            return None
+        match = self.model_manager.find_similar_answer(command, source_text)
+        if match is None:
+            return None
+        answer, similarity = match
+        if not self._accept_similar_answer(similarity):
+            return None
+        self._show_similar_answer(answer, similarity, title)
+        return answer
+
+    def _report_budget(self, check):
+        rprint(f"[dim]{check.describe()}[/dim]")
+
+    def _show_error(self, error):
+        rprint(f"[red]❌ {error}[/red]")
+
+    def _process_in_chunks(self, command, text, route, check):
+        """Run a command over parts of ``text`` that each fit the context window"""
+        title, instructions, template = self.COMMAND_PROMPTS[command]
+        family = model_family(check.model)
+        # Everything sent along with each part: instructions, earlier messages and code context
+        overhead = self.model_manager.preflight(template.format(text=""), **dict(route, model_name=check.model))
+        room = check.available_input_tokens - overhead.input_tokens
+        if room <= 0:
+            self._show_error(TokenBudgetExceeded(overhead, self.model_manager.budget_policy))
+            return None
+        parts = split_text(text, room, family)
+        responses = []
+        for index, part in enumerate(parts, 1):
+            responses.append(self._stream_response(
+                template.format(text=part), f"{title} (part {index}/{len(parts)})", command, route
+            ))
+        return "\n\n".join(responses)
+
+    def _accept_similar_answer(self, similarity):
+        if self.model_manager.semantic_cache_mode == "return":
+            return True
+        reply = self.console.input(
+            f"[cyan]♻️  A near-identical request was answered before (similarity {similarity:.2f}). "
+            "Reuse that answer? [Y/n] [/cyan]"
+        )
+        return reply.strip().lower() in ("", "y", "yes")
 
-    def _stream_with_live_markdown(self, prompt, title="AI Response"):
-        """Stream response with live markdown rendering"""
+    def _show_similar_answer(self, answer, similarity, title):
+        rprint(f"\n[bold blue]🤖 {title}[/bold blue] [dim](reused, similarity {similarity:.2f})[/dim]")
+        self._display_final_markdown(answer)
+
+    def _stream_response(self, prompt, title, command, route=None):
+        """Stream a fresh model response into the live display"""
         rprint(f"\n[bold blue]🤖 {title}[/bold blue]")
         
         # Check if streaming is supported
-        default_model = self.model_manager.default_model
-        if not self.model_manager.is_streaming_supported(default_model):
-            rprint(f"[yellow]⚠️  Streaming not supported for {default_model}, using regular response...[/yellow]")
-            response = self.model_manager.invoke_model(prompt)
+        if route is None:
+            route = self._route(prompt, command)
+        model_name = route.get("model_name", self.model_manager.default_model)
+        if not self.model_manager.is_streaming_supported(model_name):
+            rprint(f"[yellow]⚠️  Streaming not supported for {model_name}, using regular response...[/yellow]")
+            response = self.model_manager.invoke_model(prompt, command=command, **route)
             self._display_final_markdown(response)
             return response
         
         # Stream with live markdown updates and scroll control
         response_chunks = []
-        accumulated_text = ""
+        renderer = IncrementalMarkdownRenderer()
+        # The live screen only ever lays out the visible tail of the response
+        tail_view = MarkdownTailView(renderer)
         
         try:
             # Create console with specific settings to control scrolling
             console = Console(force_terminal=True, legacy_windows=False)
             
-            with Live(console=console, refresh_per_second=10, screen=True) as live:
-                live.update(Panel(Text("🔄 Starting stream...", style="dim"), title=title, border_style="blue"))
+            chunks = stream = self._open_stream(prompt, command, route)
+            resume_attempts = 0
+            
+            with Live(console=console, auto_refresh=False, screen=True) as live:
+                live.update(Panel(Text("🔄 Starting stream...", style="dim"), title=title, border_style="blue"), refresh=True)
                 
-                for chunk in self.model_manager.invoke_model_stream(prompt):
-                    response_chunks.append(chunk)
-                    accumulated_text += chunk
-                    
-                    try:
-                        markdown = Markdown(accumulated_text)
-                        live.update(Panel(markdown, title=f"{title} (streaming...)", border_style="blue"))
-                    except Exception:
-                        live.update(Panel(Text(accumulated_text), title=f"{title} (streaming...)", border_style="blue"))
+                while True:
+                    # Network reads happen on a background thread so a slow terminal
+                    # never throttles how fast the model stream is drained
+                    reader = StreamReader(chunks).start()
+                    self._render_stream(live, reader, renderer, tail_view, title, response_chunks)
+                    if reader.error is None:
+                        break
                     
-                    time.sleep(0.01)
+                    # Keep what was already generated and only ask for the rest
+                    chunks = None
+                    if renderer.text.strip() and resume_attempts < self.MAX_RESUME_ATTEMPTS:
+                        # A raced stream is continued by the provider that won
+                        chunks = self.model_manager.resume_model_stream(
+                            prompt, renderer.text, command=command,
+                            **dict(route, model_name=getattr(stream, "winner", route.get("model_name"))),
+                        )
+                    if chunks is None:
+                        raise reader.error
+                    resume_attempts += 1
+                    live.update(Panel(tail_view, title=f"{title} (resuming after error: {reader.error})", border_style="yellow"), refresh=True)
                 
                 # Final update with completed status
-                try:
-                    markdown = Markdown(accumulated_text)
-                    live.update(Panel(markdown, title=f"{title} ✅ Complete", border_style="green"))
-                except Exception:
-                    live.update(Panel(Text(accumulated_text), title=f"{title} ✅ Complete", border_style="green"))
+                renderer.close()
+                live.update(Panel(tail_view, title=f"{title} ✅ Complete", border_style="green"), refresh=True)
             
+            # Print the whole response once after the alternate screen closes
+            # so it ends up in the terminal's scrollback
+            console.print(Panel(renderer, title=f"{title} ✅ Complete", border_style="green"))
+            accumulated_text = renderer.text
             rprint(f"[green]✅ Response complete! ({len(response_chunks)} chunks, {len(accumulated_text)} characters)[/green]\n")
             return accumulated_text
             
         except Exception as e:
             rprint(f"\n[red]❌ Streaming error: {e}[/red]")
             rprint("[yellow]Falling back to regular response...[/yellow]")
-            response = self.model_manager.invoke_model(prompt)
+            response = self.model_manager.invoke_model(prompt, command=command, **route)
             self._display_final_markdown(response)
             return response
 
+    def _render_stream(self, live, reader, renderer, tail_view, title, response_chunks):
+        """Render frames from a StreamReader until its stream ends or fails"""
+        while True:
+            reader.wait_for_data()
+            finished = reader.done
+            chunks = reader.take()
+            
+            if chunks:
+                # Coalesce everything received since the last frame into one render
+                for chunk in chunks:
+                    renderer.feed(chunk)
+                response_chunks.extend(chunks)
+                
+                render_started = time.perf_counter()
+                live.update(Panel(tail_view, title=f"{title} (streaming...)", border_style="blue"), refresh=True)
+                render_cost = time.perf_counter() - render_started
+                frame_interval = min(
+                    self.MAX_FRAME_INTERVAL,
+                    max(self.MIN_FRAME_INTERVAL, render_cost / self.RENDER_DUTY_CYCLE),
+                )
+                
+                # Let chunks accumulate until the next frame is due
+                if not finished:
+                    reader.wait_for_finish(frame_interval - render_cost)
+            
+            if finished:
+                return
+
     def _display_final_markdown(self, text):
         """Display final markdown rendering"""
         try:
@@ -78,93 +378,54 @@ class LiveMarkdownProcessor:
             print(text)
 
     def summarize_text(self, text):
-        prompt = (
-            "Please summarize the following text and format your response in markdown:\n\n"
-            f"{text}\n\n"
-            "Use markdown formatting including:\n"
-            "- Headers for main points\n"
-            "- Bullet points for key details\n"
-            "- Bold/italic for emphasis where appropriate"
+        if self.summarizer is not None and self.summarizer.should_map_reduce(text):
+            return self._map_reduce_summary(text)
+        return self._run_command("summarize", text)
+
+    def _map_reduce_summary(self, text):
+        """Summarize the parts of a large document in parallel, then stream their combination"""
+        title = self.COMMAND_PROMPTS["summarize"][0]
+        similar = self._similar_answer("summarize", text, title)
+        if similar is not None:
+            return similar
+        summaries = self.summarizer.summarize_parts(text, on_progress=self._report_progress)
+        prompt = self.summarizer.reduce_prompt(summaries)
+        route = dict(self._route(prompt, "summarize"), system=REDUCE_SYSTEM)
+        check = self.model_manager.preflight(prompt, **route)
+        self._report_budget(check)
+        # The part summaries can't be chunked again; only trimming can still make them fit
+        if not check.fits and self.model_manager.budget_policy != "trim":
+            self._show_error(TokenBudgetExceeded(check, self.model_manager.budget_policy))
+            return None
+        response = self._stream_response(
+            prompt, f"{title} (combined from {len(summaries)} parts)", "summarize", route,
         )
-        return self._stream_with_live_markdown(prompt, "📝 Text Summary")
+        self.model_manager.remember_answer("summarize", text, response)
+        return response
+
+    def _report_progress(self, done, total):
+        rprint(f"[dim]Summarized part {done}/{total}[/dim]")
 
     def critical_response(self, text):
-        prompt = (
-            "Please provide a critical analysis of the following text using markdown formatting:\n\n"
-            f"{text}\n\n"
-            "Include:\n"
-            "- Main arguments\n"
-            "- Supporting evidence\n"
-            "- Potential counterarguments\n"
-            "- Your evaluation"
-        )
-        return self._stream_with_live_markdown(prompt, "🔍 Critical Analysis")
+        return self._run_command("critical_response", text)
 
     def generate_response(self, text):
-        prompt = (
-            "Please generate a detailed response to the following text using markdown formatting:\n\n"
-            f"{text}"
-        )
-        return self._stream_with_live_markdown(prompt, "💭 AI Response")
+        return self._run_command("response", text)
 
     def rewrite_code(self, text):
-        prompt = (
-            "Please rewrite and improve the following code. Format your response in markdown:\n\n"
-            f"```\n{text}\n```\n\n"
-            "Include:\n"
-            "- Improved code in a code block\n"
-            "- Explanation of changes\n"
-            "- Best practices applied"
-        )
-        return self._stream_with_live_markdown(prompt, "🔧 Code Rewrite")
+        return self._run_command("rewrite_code", text)
 
     def generate_unit_test(self, text):
-        prompt = (
-            "Please generate unit tests for the following code using markdown formatting:\n\n"
-            f"```\n{text}\n```\n\n"
-            "Include:\n"
-            "- Complete unit test code\n"
-            "- Test cases for different scenarios\n"
-            "- Explanation of test strategy"
-        )
-        return self._stream_with_live_markdown(prompt, "🧪 Unit Tests")
+        return self._run_command("unit_test", text)
 
     def list_typos(self, text):
-        prompt = (
-            "Please identify and list any typos or grammatical errors in the following text:\n\n"
-            f"{text}\n\n"
-            "Format your response in markdown with:\n"
-            "- List of errors found\n"
-            "- Suggested corrections\n"
-            "- Corrected version if needed"
-        )
-        return self._stream_with_live_markdown(prompt, "📝 Typo Check")
+        return self._run_command("list_typos", text)
 
     def code_review(self, text):
-        prompt = (
-            "Please perform a comprehensive code review of the following code:\n\n"
-            f"```\n{text}\n```\n\n"
-            "Include in your markdown response:\n"
-            "- Code quality assessment\n"
-            "- Security considerations\n"
-            "- Performance improvements\n"
-            "- Best practices recommendations\n"
-            "- Potential bugs or issues"
-        )
-        return self._stream_with_live_markdown(prompt, "👀 Code Review")
+        return self._run_command("code_review", text)
 
     def sec_review(self, text):
-        prompt = (
-            "Please perform a security review of the following code or text:\n\n"
-            f"```\n{text}\n```\n\n"
-            "Focus on:\n"
-            "- Security vulnerabilities\n"
-            "- Potential attack vectors\n"
-            "- Security best practices\n"
-            "- Recommendations for improvement\n"
-            "Format your response in markdown."
-        )
-        return self._stream_with_live_markdown(prompt, "🔒 Security Review")
+        return self._run_command("sec_review", text)
 
     def null(self, text):
         """Null operation - just return the text"""
@@ -172,13 +433,4 @@ class LiveMarkdownProcessor:
         return text
 
     def reword(self, text):
-        prompt = (
-            "Please reword and improve the following text while maintaining its meaning:\n\n"
-            f"{text}\n\n"
-            "Make it:\n"
-            "- More clear and concise\n"
-            "- Better structured\n"
-            "- More engaging\n"
-            "Format your response in markdown."
-        )
-        return self._stream_with_live_markdown(prompt, "✏️ Text Rewrite")
+        return self._run_command("reword", text)
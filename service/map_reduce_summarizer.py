@@ -0,0 +1,129 @@
+from models.model_manager import is_error_response
+from models.token_budget import estimate_tokens, model_family
+from service.text_chunker import split_text
+
+
+# Instructions are sent as the system prompt, shared by every part
+MAP_SYSTEM = (
+    "The user sends one part of a longer document. "
+    "Summarize this part in markdown, keeping its key points, names, numbers and decisions. "
+    "Do not add an introduction or conclusion."
+)
+MAP_PROMPT = "Part {index} of {total}:\n\n{text}"
+
+REDUCE_SYSTEM = (
+    "The user sends summaries of consecutive parts of one document. "
+    "Combine them into a single summary of the whole document and format your response in markdown.\n"
+    "Use markdown formatting including:\n"
+    "- Headers for main points\n"
+    "- Bullet points for key details\n"
+    "- Bold/italic for emphasis where appropriate"
+)
+
+
+class MapReduceSummarizer:
+    """
+    Summarizes documents too large for one prompt.
+
+    The document is split at headings and paragraphs into parts of at most
+    ``chunk_tokens``, every part is summarized concurrently (at most
+    ``max_parallel`` requests in flight), and the part summaries are combined
+    by one final reduce prompt. Part summaries that are still too long for
+    one prompt are summarized again, for at most ``max_rounds`` rounds.
+    """
+
+    def __init__(self, model_manager, chunk_tokens=6000, max_parallel=8, min_input_tokens=12000,
+                 map_model=None, max_rounds=3):
+        self.model_manager = model_manager
+        self.chunk_tokens = chunk_tokens
+        self.max_parallel = max_parallel
+        self.min_input_tokens = min_input_tokens
+        self.map_model = map_model
+        self.max_rounds = max_rounds
+
+    def _family(self):
+        return model_family(self.map_model or self.model_manager.default_model)
+
+    def should_map_reduce(self, text):
+        """Whether ``text`` is large enough to be summarized part by part"""
+        return estimate_tokens(text, self._family()) > self.min_input_tokens
+
+    def _part_tokens(self):
+        """Largest part that still fits the map model next to the prompt"""
+        overhead = estimate_tokens(MAP_SYSTEM + MAP_PROMPT.format(index=0, total=0, text=""), self._family())
+        available = self.model_manager.preflight("", self.map_model).available_input_tokens
+        if available is None:
+            return self.chunk_tokens
+        return max(1, min(self.chunk_tokens, available - overhead))
+
+    def summarize_parts(self, text, on_progress=None):
+        """Summarize the parts of ``text`` concurrently; returns the part summaries in order"""
+        import asyncio
+        return asyncio.run(self.asummarize_parts(text, on_progress))
+
+    async def asummarize_parts(self, text, on_progress=None):
+        summaries = await self._map(text, on_progress)
+        for _ in range(self.max_rounds - 1):
+            if estimate_tokens("\n\n".join(summaries), self._family()) <= self.min_input_tokens:
+                break
+            summaries = await self._map("\n\n".join(summaries), on_progress)
+        return summaries
+
+    async def _map(self, text, on_progress):
+        import asyncio
+        parts = split_text(text, self._part_tokens(), self._family())
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        done = 0
+
+        async def summarize(index, part):
+            nonlocal done
+            async with semaphore:
+                prompt = MAP_PROMPT.format(index=index, total=len(parts), text=part)
+                summary = await self.model_manager.ainvoke(
+                    prompt, command="summarize_part", model_name=self.map_model, system=MAP_SYSTEM
+                )
+            done += 1
+            # Backends that fail without raising return an error string in place of a summary
+            if is_error_response(summary):
+                raise RuntimeError(summary or "no summary was returned")
+            if on_progress:
+                on_progress(done, len(parts))
+            return summary
+
+        results = await asyncio.gather(
+            *(summarize(index, part) for index, part in enumerate(parts, 1)), return_exceptions=True
+        )
+        if all(isinstance(result, Exception) for result in results):
+            raise results[0]
+        # One failed part shouldn't discard the rest of the document
+        return [
+            f"[Part {index} could not be summarized: {result}]" if isinstance(result, Exception) else result
+            for index, result in enumerate(results, 1)
+        ]
+
+    def reduce_prompt(self, summaries):
+        """Prompt combining part summaries into the final summary, to send with REDUCE_SYSTEM"""
+        return "\n\n".join(
+            f"## Part {index}\n\n{summary}" for index, summary in enumerate(summaries, 1)
+        )
+
+    def summarize(self, text):
+        """Summarize ``text`` without streaming the reduce pass"""
+        return self.model_manager.invoke_model(
+            self.reduce_prompt(self.summarize_parts(text)), command="summarize", system=REDUCE_SYSTEM
+        )
+
+
+def build_summarizer(config, model_manager):
+    """MapReduceSummarizer from the "map_reduce" config section, or None when disabled"""
+    settings = config.get("map_reduce", {})
+    if not settings.get("enabled", True):
+        return None
+    return MapReduceSummarizer(
+        model_manager,
+        chunk_tokens=settings.get("chunk_tokens", 6000),
+        max_parallel=settings.get("max_parallel", 8),
+        min_input_tokens=settings.get("min_input_tokens", 12000),
+        map_model=settings.get("map_model"),
+        max_rounds=settings.get("max_rounds", 3),
+    )
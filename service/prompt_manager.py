@@ -1,5 +1,6 @@
 # service/prompt_manager.py
 import subprocess
+from service.map_reduce_summarizer import build_summarizer
 from service.text_processor import TextProcessor
 from rich.console import Console
 from rich.markdown import Markdown
@@ -17,6 +18,7 @@ class PromptManager:
         self.config = config
         self.model_manager = model_manager
         self.text_processor = TextProcessor(model_manager)
+        self.text_processor.summarizer = build_summarizer(config, model_manager)
         self.console = Console()
         self.command_map = {
             "s": ("summarize", self.text_processor.summarize_text),
@@ -0,0 +1,219 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+
+class SessionStore:
+    """
+    Local SQLite history of chat sessions.
+
+    Exchanges are appended by a background writer thread, so saving never
+    blocks the REPL; responses are stored zlib-compressed. A contentless FTS5
+    index over the user text and responses makes ``search`` fast even with
+    tens of thousands of exchanges (plain LIKE matching of the user text is
+    used when SQLite was built without FTS5).
+    """
+
+    TITLE_LENGTH = 80
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " title TEXT NOT NULL,"
+            " started_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " exchange_count INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);"
+            "CREATE TABLE IF NOT EXISTS exchanges ("
+            " id INTEGER PRIMARY KEY,"
+            " session_id TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " command TEXT,"
+            " timestamp REAL NOT NULL,"
+            " user_text TEXT NOT NULL,"
+            " response BLOB NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS exchanges_session ON exchanges (session_id, position);"
+        )
+        try:
+            self._connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS exchanges_fts"
+                " USING fts5(user_text, response, content='')"
+            )
+            self.full_text = True
+        except sqlite3.OperationalError:
+            self.full_text = False
+        self._connection.commit()
+
+        # Called on the writer thread with each saved exchange, as returned by
+        # exchanges_since, once it is committed
+        self.listeners = []
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="session-store", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @staticmethod
+    def new_session_id():
+        return uuid.uuid4().hex[:8]
+
+    def append(self, session_id, user_text, response, command=None):
+        """Queue an exchange to be saved; returns immediately"""
+        self._queue.put((session_id, user_text, response, command, time.time()))
+
+    def flush(self):
+        """Wait until every queued exchange is written"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._connection.close()
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            item = self._queue.get()
+            # Write everything that queued up meanwhile in one transaction
+            batch = [item]
+            while item is not None:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            saved = []
+            try:
+                with connection:
+                    for exchange in batch:
+                        if exchange is not None:
+                            saved.append(self._insert(connection, *exchange))
+                for exchange in saved:
+                    for listener in self.listeners:
+                        listener(exchange)
+            except sqlite3.Error as e:
+                print(f"Session store write failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is None:
+                connection.close()
+                return
+
+    def _insert(self, connection, session_id, user_text, response, command, timestamp):
+        connection.execute(
+            "INSERT INTO sessions (id, title, started_at, updated_at, exchange_count) VALUES (?, ?, ?, ?, 1)"
+            " ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at,"
+            " exchange_count = exchange_count + 1",
+            (session_id, " ".join(user_text.split())[:self.TITLE_LENGTH], timestamp, timestamp),
+        )
+        cursor = connection.execute(
+            "INSERT INTO exchanges (session_id, position, command, timestamp, user_text, response)"
+            " VALUES (?, (SELECT COALESCE(MAX(position) + 1, 0) FROM exchanges WHERE session_id = ?), ?, ?, ?, ?)",
+            (session_id, session_id, command, timestamp, user_text, zlib.compress(response.encode("utf-8"))),
+        )
+        if self.full_text:
+            connection.execute(
+                "INSERT INTO exchanges_fts (rowid, user_text, response) VALUES (?, ?, ?)",
+                (cursor.lastrowid, user_text, response),
+            )
+        return {"id": cursor.lastrowid, "session_id": session_id, "user": user_text, "assistant": response,
+                "command": command, "timestamp": timestamp}
+
+    def sessions(self, limit=20):
+        """Most recently updated sessions as dicts, newest first"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, title, started_at, updated_at, exchange_count FROM sessions"
+                " ORDER BY updated_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {"id": row[0], "title": row[1], "started_at": row[2], "updated_at": row[3], "exchanges": row[4]}
+            for row in rows
+        ]
+
+    def resolve(self, session_id):
+        """Full id of the session whose id starts with ``session_id``, or None if not exactly one"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id FROM sessions WHERE id >= ? AND id < ? LIMIT 2", (session_id, session_id + "\uffff")
+            ).fetchall()
+        return rows[0][0] if len(rows) == 1 else None
+
+    def _exchange_rows(self, where, params, limit=-1):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, session_id, user_text, response, command, timestamp FROM exchanges"
+                f" WHERE {where} ORDER BY id LIMIT ?",
+                list(params) + [limit],
+            ).fetchall()
+        return [
+            {"id": row[0], "session_id": row[1], "user": row[2], "assistant": zlib.decompress(row[3]).decode("utf-8"),
+             "command": row[4], "timestamp": row[5]}
+            for row in rows
+        ]
+
+    def exchanges(self, session_id):
+        """Every exchange of a session, oldest first"""
+        return self._exchange_rows("session_id = ?", (session_id,))
+
+    def exchanges_since(self, exchange_id, limit=500):
+        """Saved exchanges with an id above ``exchange_id``, oldest first"""
+        return self._exchange_rows("id > ?", (exchange_id,), limit)
+
+    def exchanges_by_id(self, exchange_ids):
+        """Saved exchanges with the given ids, oldest first"""
+        exchange_ids = list(exchange_ids)
+        if not exchange_ids:
+            return []
+        return self._exchange_rows(f"id IN ({', '.join('?' * len(exchange_ids))})", exchange_ids)
+
+    def search(self, text, limit=20):
+        """
+        Exchanges whose user text or response contains every word of
+        ``text``, newest first. Without FTS5 only the user text is searched,
+        since responses are stored compressed.
+        """
+        words = re.findall(r"\w+", text)
+        if not words:
+            return []
+        with self._lock:
+            if self.full_text:
+                query = " ".join('"' + word + '"' for word in words)
+                rows = self._connection.execute(
+                    "SELECT e.session_id, e.position, e.timestamp, e.user_text FROM exchanges_fts"
+                    " JOIN exchanges e ON e.id = exchanges_fts.rowid"
+                    " WHERE exchanges_fts MATCH ? ORDER BY e.id DESC LIMIT ?",
+                    (query, limit),
+                ).fetchall()
+            else:
+                condition = " AND ".join("e.user_text LIKE ?" for _ in words)
+                rows = self._connection.execute(
+                    "SELECT e.session_id, e.position, e.timestamp, e.user_text FROM exchanges e"
+                    f" WHERE {condition} ORDER BY e.id DESC LIMIT ?",
+                    [f"%{word}%" for word in words] + [limit],
+                ).fetchall()
+        return [
+            {"session_id": row[0], "position": row[1], "timestamp": row[2], "user": row[3]}
+            for row in rows
+        ]
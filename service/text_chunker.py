@@ -0,0 +1,72 @@
+import re
+
+from models.token_budget import estimate_tokens
+
+
+# Boundaries to split at, from the most to the least structural
+SEPARATORS = (
+    re.compile(r"\n(?=#{1,6} )"),   # before markdown headings
+    re.compile(r"\n[ \t]*\n"),      # between paragraphs
+    re.compile(r"\n"),              # between lines
+    re.compile(r"(?<=[.!?])\s+"),   # between sentences
+)
+
+
+def _split_after(text, pattern):
+    """Split ``text`` after every match of ``pattern``, keeping all characters"""
+    pieces = []
+    start = 0
+    for match in pattern.finditer(text):
+        if match.end() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    pieces.append(text[start:])
+    return [piece for piece in pieces if piece]
+
+
+def _split_hard(text, max_tokens, family):
+    """Cut into equal-sized pieces, moving each cut back to a space when there is one nearby"""
+    step = max(1, int(len(text) * max_tokens / estimate_tokens(text, family) * 0.95))
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = min(start + step, len(text))
+        if end < len(text):
+            space = text.rfind(" ", start + step // 2, end)
+            if space > start:
+                end = space + 1
+        pieces.append(text[start:end])
+        start = end
+    return pieces
+
+
+def split_text(text, max_tokens, family=None, level=0):
+    """
+    Split ``text`` into chunks of at most ``max_tokens`` estimated tokens.
+
+    Chunks break at headings where possible, then at paragraphs, lines and
+    sentences, and finally at spaces near the size limit.
+    """
+    if estimate_tokens(text, family) <= max_tokens:
+        return [text] if text.strip() else []
+    if level == len(SEPARATORS):
+        return _split_hard(text, max_tokens, family)
+
+    chunks = []
+    current, current_tokens = "", 0
+    for piece in _split_after(text, SEPARATORS[level]):
+        tokens = estimate_tokens(piece, family)
+        if tokens > max_tokens:
+            # Split what is pending together with the oversized piece, so a
+            # heading stays with the start of its section
+            chunks.extend(split_text(current + piece, max_tokens, family, level + 1))
+            current, current_tokens = "", 0
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = "", 0
+        current += piece
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
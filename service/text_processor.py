@@ -2,8 +2,12 @@
 class TextProcessor:
     def __init__(self, model_manager):
         self.model_manager = model_manager
+        # Optional MapReduceSummarizer for documents too large for one prompt
+        self.summarizer = None
 
     def summarize_text(self, text):
+        if self.summarizer is not None and self.summarizer.should_map_reduce(text):
+            return self.summarizer.summarize(text)
         prompt = (
             "Please summarize the following text and format your response in markdown:\n\n"
             f"{text}\n\n"
@@ -3,5 +3,6 @@
 
 from .clipboard_utils import ClipboardUtils
 from .spinner import Spinner, spinning_cursor, show_spinner
+from .stream_reader import StreamReader
 
-__all__ = ['ClipboardUtils', 'Spinner', 'spinning_cursor', 'show_spinner']
+__all__ = ['ClipboardUtils', 'Spinner', 'spinning_cursor', 'show_spinner', 'StreamReader']
@@ -0,0 +1,61 @@
+import threading
+
+
+class StreamReader:
+    """Drains a chunk iterator on a background thread into a buffer"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.error = None
+        self.thread = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._data_ready = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def done(self):
+        """True once the iterator is exhausted or raised"""
+        return self._finished.is_set()
+
+    def _drain(self):
+        """Internal method that consumes the iterator as fast as it produces"""
+        try:
+            for chunk in self.chunks:
+                with self._lock:
+                    self._buffer.append(chunk)
+                    self._data_ready.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finished.set()
+            self._data_ready.set()
+
+    def start(self):
+        """Start draining in the background"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._drain)
+            self.thread.daemon = True
+            self.thread.start()
+        return self
+
+    def wait_for_data(self, timeout=None):
+        """Block until chunks are buffered or the stream ends"""
+        return self._data_ready.wait(timeout)
+
+    def wait_for_finish(self, timeout=None):
+        """Block until the stream ends, at most ``timeout`` seconds"""
+        return self._finished.wait(timeout)
+
+    def take(self):
+        """Return every chunk buffered since the last call"""
+        with self._lock:
+            chunks, self._buffer = self._buffer, []
+            if not self._finished.is_set():
+                self._data_ready.clear()
+        return chunks
+
+    def join(self, timeout=None):
+        """Wait for the background thread to exit"""
+        if self.thread:
+            self.thread.join(timeout)
@@ -0,0 +1,18 @@
+import re
+import numpy as np
+
+
+class BagOfWords:
+    """Deterministic stand-in for a sentence embedding model over a fixed vocabulary"""
+
+    def __init__(self, vocabulary):
+        self.vocabulary = list(vocabulary)
+
+    def __call__(self, texts):
+        vectors = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"[a-z0-9]+", text.lower()):
+                if word in self.vocabulary:
+                    vectors[row, self.vocabulary.index(word)] += 1
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
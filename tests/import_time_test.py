@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Opt-in import time budget for the entry point, in milliseconds; timings vary
+# too much between machines to enforce one by default
+IMPORT_BUDGET_MS = os.environ.get("IMPORT_BUDGET_MS")
+
+# Provider SDKs and async machinery that must only be imported when first used
+LAZY_MODULES = ("boto3", "botocore", "openai", "asyncio", "concurrent")
+
+
+def measure_import_time(module):
+    """
+    Import ``module`` in a fresh interpreter with ``python -X importtime``.
+
+    Returns a dict mapping every imported module to its cumulative import
+    time in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+class TestImportTime(unittest.TestCase):
+    def setUp(self):
+        self.timings = measure_import_time("capture")
+
+    def test_lazy_modules_are_not_imported_at_startup(self):
+        loaded = [name for name in self.timings if name.split(".")[0] in LAZY_MODULES]
+        self.assertEqual(loaded, [])
+
+    def test_entry_point_within_budget(self):
+        slowest = sorted(self.timings.items(), key=lambda item: item[1], reverse=True)[:10]
+        report = "\n".join(f"{us / 1000:8.1f} ms  {name}" for name, us in slowest)
+        if not IMPORT_BUDGET_MS:
+            self.skipTest(f"set IMPORT_BUDGET_MS to enforce a budget; slowest imports:\n{report}")
+        self.assertLess(self.timings["capture"] / 1000, float(IMPORT_BUDGET_MS), f"slowest imports:\n{report}")
+
+
+if __name__ == '__main__':
+    unittest.main()
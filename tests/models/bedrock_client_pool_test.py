@@ -0,0 +1,104 @@
+import threading
+import unittest
+from unittest.mock import patch, Mock
+from models.bedrock_client_pool import BedrockClientPool
+
+
+class TestBedrockClientPool(unittest.TestCase):
+    def setUp(self):
+        session_patcher = patch('boto3.Session')
+        self.mock_session = session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+        self.session = self.mock_session.return_value
+        self.session.client.side_effect = lambda *args, **kwargs: Mock(region=kwargs["region_name"])
+        self.pool = BedrockClientPool("us-east-1", profile="dev", max_pool_connections=32)
+        self.addCleanup(self.pool.stop)
+
+    def test_client_configures_pool_and_keepalive(self):
+        client = self.pool.client()
+
+        self.assertEqual(client.region, "us-east-1")
+        self.mock_session.assert_called_once_with(profile_name="dev")
+        config = self.session.client.call_args[1]["config"]
+        self.assertEqual(config.max_pool_connections, 32)
+        self.assertTrue(config.tcp_keepalive)
+        self.assertEqual(config.retries, {"max_attempts": 6, "mode": "standard"})
+
+    def test_one_client_per_region(self):
+        self.assertIs(self.pool.client(), self.pool.client("us-east-1"))
+        self.assertEqual(self.pool.client("us-west-2").region, "us-west-2")
+        self.assertEqual(self.session.client.call_count, 2)
+
+    def test_concurrent_callers_share_one_client(self):
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(self.pool.client())) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({id(client) for client in clients}), 1)
+        self.session.client.assert_called_once()
+
+    def test_prewarm_resolves_credentials_and_connects(self):
+        self.pool.prewarm().join(5)
+
+        self.session.get_credentials.return_value.get_frozen_credentials.assert_called_once()
+        self.pool.client().list_async_invokes.assert_called_once_with(maxResults=1)
+
+    def test_warm_ignores_errors(self):
+        self.session.get_credentials.side_effect = Exception("no credentials")
+
+        self.pool.warm()
+
+    def test_rewarms_after_idle(self):
+        pool = BedrockClientPool("us-east-1", rewarm_after_idle=60)
+        client = pool.client()
+        pool.warm()
+
+        with patch('models.bedrock_client_pool.time.monotonic', return_value=pool.last_used + 60):
+            self.assertTrue(pool._rewarm_if_idle())
+
+        self.assertEqual(client.list_async_invokes.call_count, 2)
+
+    def test_not_rewarmed_while_requests_flow(self):
+        pool = BedrockClientPool("us-east-1", rewarm_after_idle=60)
+        client = pool.client()
+        pool.warm()
+
+        with patch('models.bedrock_client_pool.time.monotonic') as monotonic:
+            for now in range(100, 300, 30):
+                monotonic.return_value = now
+                pool.mark_used()
+                monotonic.return_value = now + 30
+                self.assertFalse(pool._rewarm_if_idle())
+
+        self.assertEqual(client.list_async_invokes.call_count, 1)
+
+    def test_keep_warm_thread_only_starts_with_rewarm_after_idle(self):
+        self.pool.prewarm().join(5)
+        self.assertIsNone(self.pool._keep_warm_thread)
+
+        pool = BedrockClientPool("us-east-1", rewarm_after_idle=60)
+        self.addCleanup(pool.stop)
+        pool.prewarm().join(5)
+        self.assertTrue(pool._keep_warm_thread.daemon)
+
+    def test_throttled_attempts_are_reported(self):
+        throttled = []
+        self.pool.on_throttle = throttled.append
+        self.pool.client()
+        event, hook = self.pool.client().meta.events.register.call_args[0]
+
+        hook(response=(Mock(), {"Error": {"Code": "ThrottlingException"}}),
+             request_dict={"url_path": "/model/us.anthropic.claude-v1%3A0/converse-stream"})
+        hook(response=(Mock(), {"Error": {"Code": "ValidationException"}}),
+             request_dict={"url_path": "/model/other/converse"})
+        hook(response=None, request_dict={})
+
+        self.assertEqual(event, "needs-retry.bedrock-runtime")
+        self.assertEqual(throttled, ["us.anthropic.claude-v1:0"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import json
 import unittest
 from unittest.mock import patch, Mock, MagicMock
 from models.bedrock_models import ClaudeInvoker, LlamaInvoker, TitanInvoker
+from botocore.eventstream import EventStream
 from botocore.exceptions import ClientError
 from configuration.config import config
 
@@ -122,5 +123,137 @@ class TestInvoker(unittest.TestCase):
             }
         )
 
+    def test_invoke_stream_with_prefill(self):
+        bedrock_client = Mock()
+        invoker = ClaudeInvoker(bedrock_client)
+        invoker.invoke_stream('test prompt', {"prefill": "Partial answer"})
+
+        messages = bedrock_client.converse_stream.call_args[1]["messages"]
+        self.assertEqual(messages, [
+            {"role": "user", "content": [{"text": "test prompt"}]},
+            {"role": "assistant", "content": [{"text": "Partial answer"}]},
+        ])
+
+    def test_long_system_gets_a_cache_point_but_retrieved_context_does_not(self):
+        bedrock_client = Mock()
+        invoker = ClaudeInvoker(bedrock_client)
+        system = "Follow these rules. " * 400
+        context = "Retrieved code. " * 400
+        invoker.invoke('question', {"system": system, "context": context})
+
+        kwargs = bedrock_client.converse.call_args[1]
+        self.assertEqual(kwargs["system"], [{"text": system}, {"cachePoint": {"type": "default"}}])
+        self.assertEqual(kwargs["messages"][0]["content"], [
+            {"text": context},
+            {"text": "question"},
+        ])
+
+    def test_earlier_turns_are_sent_as_messages(self):
+        bedrock_client = Mock()
+        invoker = ClaudeInvoker(bedrock_client)
+        answer = "A long answer. " * 400
+        invoker.invoke_stream('and then?', {"messages": [
+            {"role": "user", "content": "first question"},
+            {"role": "assistant", "content": answer},
+        ]})
+
+        self.assertEqual(bedrock_client.converse_stream.call_args[1]["messages"], [
+            {"role": "user", "content": [{"text": "first question"}]},
+            {"role": "assistant", "content": [{"text": answer}, {"cachePoint": {"type": "default"}}]},
+            {"role": "user", "content": [{"text": "and then?"}]},
+        ])
+
+    def test_short_prefix_gets_no_cache_point(self):
+        bedrock_client = Mock()
+        invoker = ClaudeInvoker(bedrock_client)
+        invoker.invoke_stream('question', {"system": "Be brief."})
+
+        kwargs = bedrock_client.converse_stream.call_args[1]
+        self.assertEqual(kwargs["system"], [{"text": "Be brief."}])
+        self.assertEqual(kwargs["messages"][0]["content"], [{"text": "question"}])
+
+    def test_claude_usage_reports_prompt_cache_tokens(self):
+        usage = ClaudeInvoker(Mock()).extract_usage({
+            "usage": {"inputTokens": 10, "outputTokens": 5, "cacheReadInputTokens": 2048, "cacheWriteInputTokens": 0},
+            "metrics": {"latencyMs": 300},
+        })
+        self.assertEqual(usage["cache_read_tokens"], 2048)
+        self.assertEqual(usage["cache_write_tokens"], 0)
+
+    def test_llama_prepends_system_and_context(self):
+        bedrock_client = Mock()
+        invoker = LlamaInvoker(bedrock_client)
+        invoker.invoke_stream('question', {
+            "system": "Be brief.", "context": "earlier", "messages": [{"role": "user", "content": "hi"}],
+        })
+
+        request = json.loads(bedrock_client.invoke_model_with_response_stream.call_args[1]['body'])
+        self.assertIn("Be brief.\n\nUser: hi\n\nearlier\n\nquestion", request['prompt'])
+
+    def test_process_stream_response_propagates_errors(self):
+        def events():
+            yield {'contentBlockDelta': {'delta': {'text': 'partial'}}}
+            raise ConnectionError("stream dropped")
+
+        invoker = ClaudeInvoker(Mock())
+        chunks = invoker.process_stream_response({'stream': events()})
+        self.assertEqual(next(chunks), 'partial')
+        with self.assertRaises(ConnectionError):
+            next(chunks)
+    def test_llama_streams_generation_chunks(self):
+        bedrock_client = Mock()
+        body = [
+            {'chunk': {'bytes': json.dumps({'generation': 'Hello', 'prompt_token_count': 5}).encode()}},
+            {'chunk': {'bytes': json.dumps({'generation': ' world', 'stop_reason': 'stop',
+                                            'amazon-bedrock-invocationMetrics': {
+                                                'inputTokenCount': 5, 'outputTokenCount': 2,
+                                                'invocationLatency': 120}}).encode()}},
+        ]
+        bedrock_client.invoke_model_with_response_stream.return_value = {'body': body}
+        invoker = LlamaInvoker(bedrock_client)
+        metadata = []
+
+        stream_response = invoker.invoke_stream('test prompt', {"max_tokens": 100})
+        chunks = list(invoker.process_stream_response(stream_response, on_metadata=metadata.append))
+
+        self.assertEqual(chunks, ['Hello', ' world'])
+        request = json.loads(bedrock_client.invoke_model_with_response_stream.call_args[1]['body'])
+        self.assertEqual(request['max_gen_len'], 100)
+        self.assertEqual(invoker.extract_usage(metadata[0]),
+                         {"input_tokens": 5, "output_tokens": 2, "latency_ms": 120})
+
+    def test_titan_streams_output_text_chunks(self):
+        bedrock_client = Mock()
+        body = [
+            {'chunk': {'bytes': json.dumps({'outputText': 'Hi', 'index': 0}).encode()}},
+            {'chunk': {'bytes': json.dumps({'outputText': '', 'completionReason': 'FINISH'}).encode()}},
+        ]
+        bedrock_client.invoke_model_with_response_stream.return_value = {'body': body}
+        invoker = TitanInvoker(bedrock_client)
+
+        stream_response = invoker.invoke_stream('test prompt')
+        self.assertEqual(list(invoker.process_stream_response(stream_response)), ['Hi'])
+        request = json.loads(bedrock_client.invoke_model_with_response_stream.call_args[1]['body'])
+        self.assertEqual(request['inputText'], 'test prompt')
+
+    def test_response_stream_error_returns_none(self):
+        bedrock_client = Mock()
+        bedrock_client.invoke_model_with_response_stream.side_effect = ClientError(
+            {'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'InvokeModelWithResponseStream'
+        )
+        self.assertIsNone(TitanInvoker(bedrock_client).invoke_stream('test prompt'))
+
+    def test_close_stream_shuts_the_socket_down_before_closing(self):
+        raw = Mock()
+        calls = []
+        raw.connection.sock.shutdown.side_effect = lambda how: calls.append("shutdown")
+        raw.close.side_effect = lambda: calls.append("close")
+
+        ClaudeInvoker(Mock()).close_stream({'stream': EventStream(raw, None, None, 'ConverseStream')})
+        LlamaInvoker(Mock()).close_stream({'body': EventStream(raw, None, None, 'InvokeModelWithResponseStream')})
+
+        self.assertEqual(calls, ["shutdown", "close"] * 2)
+
+
 if __name__ == '__main__':
     unittest.main()
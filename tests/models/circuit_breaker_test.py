@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import patch
+from models.circuit_breaker import CircuitBreaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock_patcher = patch('models.circuit_breaker.time.monotonic', lambda: self.now)
+        clock_patcher.start()
+        self.addCleanup(clock_patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, latency_threshold=5, reset_timeout=30)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_success_resets_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_success(1.0)
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_latency_spikes_count_as_failures(self):
+        self.breaker.record_success(10.0)
+        self.breaker.record_success(12.0)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_single_probe_after_reset_timeout(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 31
+
+        self.assertTrue(self.breaker.allow_request())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+        self.breaker.record_success(1.0)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_failed_probe_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 31
+        self.breaker.allow_request()
+
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_released_probe_lets_another_through(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 31
+        self.assertTrue(self.breaker.allow_request())
+
+        self.breaker.release_probe()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(self.breaker.failures, 2)
+        self.assertTrue(self.breaker.allow_request())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+from models.embeddings import split_for_embedding
+from models.token_budget import estimate_tokens
+
+
+class TestSplitForEmbedding(unittest.TestCase):
+    def test_parts_fit_and_keep_the_text(self):
+        text = "def f(x):\n    return x * 2\n" * 300 + "y" * 5000 + "\n"
+
+        parts = split_for_embedding(text, max_tokens=100)
+
+        self.assertGreater(len(parts), 1)
+        self.assertTrue(all(estimate_tokens(part) <= 100 for part in parts))
+        self.assertEqual("".join(parts), text)
+
+    def test_short_text_is_one_part(self):
+        self.assertEqual(split_for_embedding("a short prompt"), ["a short prompt"])
+
+    def test_blank_text_has_no_parts(self):
+        self.assertEqual(split_for_embedding("  \n\n"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
+import json
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
 from unittest.mock import patch, Mock
 import os
 from configuration.config import config
@@ -35,6 +38,136 @@ class TestChatGPTModelInvoker(unittest.TestCase):
         response = None
         processed_response = self.model_invoker.process_response(response)
         self.assertEqual(processed_response, "No valid response received.")
+    def test_process_stream_response_yields_deltas_and_usage(self):
+        chunks = [
+            {"choices": [{"delta": {"role": "assistant"}}]},
+            {"choices": [{"delta": {"content": "Hel"}}]},
+            {"choices": [{"delta": {"content": "lo"}}]},
+            {"choices": [], "usage": {"prompt_tokens": 3, "completion_tokens": 2}},
+        ]
+        metadata = []
+
+        text = list(self.model_invoker.process_stream_response(iter(chunks), on_metadata=metadata.append))
+
+        self.assertEqual(text, ["Hel", "lo"])
+        self.assertEqual(self.model_invoker.extract_usage(metadata[0]),
+                         {"input_tokens": 3, "output_tokens": 2})
+
+    def test_invoke_stream_requests_streaming(self):
+        with patch('models.gpt_models.openai.ChatCompletion.create') as mock_create:
+            self.model_invoker.invoke_stream("Hello", {"max_tokens": 50})
+
+        kwargs = mock_create.call_args[1]
+        self.assertTrue(kwargs["stream"])
+        self.assertEqual(kwargs["max_tokens"], 50)
+        self.assertNotIn("api_base", kwargs)
+
+    def test_system_instructions_go_first(self):
+        with patch('models.gpt_models.openai.ChatCompletion.create') as mock_create:
+            self.model_invoker.invoke("Hello", {
+                "system": "Be brief.",
+                "messages": [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hey"}],
+                "context": "Earlier turns",
+            })
+
+        self.assertEqual(mock_create.call_args[1]["messages"], [
+            {"role": "system", "content": "Be brief."},
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hey"},
+            {"role": "user", "content": "Earlier turns\n\nHello"},
+        ])
+
+    def test_streams_from_openai_compatible_endpoint(self):
+        server = HTTPServer(("127.0.0.1", 0), _StandInHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.model_invoker.api_base = f"http://127.0.0.1:{server.server_port}/v1"
+        self.model_invoker.stream_usage = False
+
+        stream_response = self.model_invoker.invoke_stream("Hello")
+        text = list(self.model_invoker.process_stream_response(stream_response))
+
+        self.assertEqual(text, ["Streamed", " from", " stand-in"])
+        self.assertEqual(_StandInHandler.requests[-1]["path"], "/v1/chat/completions")
+        self.assertTrue(_StandInHandler.requests[-1]["body"]["stream"])
+        self.assertEqual(_StandInHandler.requests[-1]["authorization"], "Bearer not-needed")
+
+    def test_close_stream_aborts_a_read_on_another_thread(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StallingHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(_StallingHandler.release.set)
+        self.model_invoker.api_base = f"http://127.0.0.1:{server.server_port}/v1"
+        self.model_invoker.stream_usage = False
+        stream_response = self.model_invoker.invoke_stream("Hello")
+        received = []
+        first_chunk = threading.Event()
+
+        def read():
+            try:
+                for text in self.model_invoker.process_stream_response(stream_response):
+                    received.append(text)
+                    first_chunk.set()
+            except Exception:
+                pass
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        self.assertTrue(first_chunk.wait(5))
+        self.model_invoker.close_stream(stream_response)
+        reader.join(2)
+
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(received, ["Stalled"])
+
+
+class _StallingHandler(BaseHTTPRequestHandler):
+    """Streams one chunk, then waits as a model thinking about its next token would"""
+
+    protocol_version = "HTTP/1.1"
+    release = threading.Event()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": "Stalled"}}]}
+        data = f"data: {json.dumps(chunk)}\n\n".encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+        self.release.wait(10)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible server streaming a fixed completion"""
+
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        _StandInHandler.requests.append(
+            {"path": self.path, "body": body, "authorization": self.headers.get("Authorization")}
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for content in ["Streamed", " from", " stand-in"]:
+            chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": content}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
 
 if __name__ == '__main__':
     unittest.main()
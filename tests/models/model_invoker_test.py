@@ -1,14 +1,27 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, Mock
 import boto3
+import numpy as np
 
 from models.bedrock_models import ClaudeInvoker, LlamaInvoker, TitanInvoker
 from models.gpt_models import ChatGPTModelInvoker
 from models.model_manager import ModelManager
+from models.token_budget import TokenBudgetExceeded
 
 class TestModelManager(unittest.TestCase):
-    @patch('models.model_manager.boto3.Session')
-    def setUp(self, mock_session):
+    def setUp(self):
+        # The Bedrock client is created lazily, so keep the session patched
+        # for the whole test rather than just construction
+        session_patcher = patch('boto3.Session')
+        mock_session = session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+        self.mock_session = mock_session
         self.mock_bedrock_runtime = Mock()
         mock_session_instance = Mock()
         mock_session.return_value = mock_session_instance
@@ -59,6 +72,509 @@ class TestModelManager(unittest.TestCase):
                 self.model_manager.invoke_model("Hello")
                 mock_process_response.assert_called_once_with({"response": "Hello"})
 
+    def test_invoke_model_records_metrics(self):
+        response = {
+            "output": {"message": {"content": [{"text": "Hi"}]}},
+            "usage": {"inputTokens": 12, "outputTokens": 3},
+            "metrics": {"latencyMs": 420},
+        }
+        with patch.object(self.model_manager.models["claude"], "invoke", return_value=response):
+            self.model_manager.invoke_model("Hello", command="summarize")
+
+        records = self.model_manager.metrics.records(model="claude", command="summarize")
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].input_tokens, 12)
+        self.assertEqual(records[0].output_tokens, 3)
+        self.assertEqual(records[0].server_latency_ms, 420)
+        self.assertIsNotNone(records[0].total_latency)
+
+    def test_invoke_model_records_failed_request(self):
+        with patch.object(self.model_manager.models["claude"], "invoke", return_value=None):
+            result = self.model_manager.invoke_model("Hello")
+
+        self.assertEqual(result, "Error while invoking the model")
+        self.assertEqual(self.model_manager.last_metrics.error, "no response")
+
+    def test_invoke_model_stream_records_metrics(self):
+        stream = {"stream": [
+            {"contentBlockDelta": {"delta": {"text": "Hel"}}},
+            {"contentBlockDelta": {"delta": {"text": "lo"}}},
+            {"messageStop": {"stopReason": "end_turn"}},
+            {"metadata": {"usage": {"inputTokens": 5, "outputTokens": 2}, "metrics": {"latencyMs": 99}}},
+        ]}
+        with patch.object(self.model_manager.models["claude"], "invoke_stream", return_value=stream):
+            chunks = list(self.model_manager.invoke_model_stream("Hello", command="response"))
+
+        self.assertEqual(chunks, ["Hel", "lo"])
+        metrics = self.model_manager.last_metrics
+        self.assertTrue(metrics.streaming)
+        self.assertEqual(metrics.command, "response")
+        self.assertEqual(len(metrics.inter_token_gaps), 1)
+        self.assertEqual(metrics.output_tokens, 2)
+        self.assertEqual(metrics.server_latency_ms, 99)
+        self.assertEqual(self.model_manager.metrics.records(), [metrics])
+
+
+    def test_resume_model_stream_sends_prefill(self):
+        stream = {"stream": [
+            {"contentBlockDelta": {"delta": {"text": "\n\nSecond"}}},
+            {"contentBlockDelta": {"delta": {"text": " part"}}},
+        ]}
+        with patch.object(self.model_manager.models["claude"], "invoke_stream", return_value=stream) as mock_stream:
+            chunks = list(self.model_manager.resume_model_stream("Hello", "First part\n\n", command="response"))
+
+        # Trailing whitespace is kept out of the prefill and not repeated
+        self.assertEqual(chunks, ["Second", " part"])
+        payload = mock_stream.call_args[0][1]
+        self.assertEqual(payload["prefill"], "First part")
+
+    def test_resume_model_stream_that_cannot_start_returns_none(self):
+        with patch.object(self.model_manager.models["claude"], "invoke_stream", return_value=None):
+            self.assertIsNone(self.model_manager.resume_model_stream("Hello", "partial"))
+
+    def test_resume_skips_fallbacks_that_ignore_the_prefill(self):
+        self.config["failover"] = {"claude": ["llama"]}
+        manager = ModelManager(self.config)
+        with patch.object(manager.models["claude"], "invoke_stream", return_value=None), \
+                patch.object(manager.models["llama"], "invoke_stream") as llama_stream:
+            self.assertIsNone(manager.resume_model_stream("Hello", "partial"))
+        llama_stream.assert_not_called()
+
+    def test_resume_model_stream_unsupported(self):
+        self.model_manager.default_model = "llama"
+        self.assertIsNone(self.model_manager.resume_model_stream("Hello", "partial"))
+
+    def test_stitch_continuation(self):
+        stitch = ModelManager._stitch_continuation
+        self.assertEqual("".join(stitch(" ", iter([" ", "word"]))), "word")
+        self.assertEqual("".join(stitch("", iter(["word", " more"]))), "word more")
+        self.assertEqual("".join(stitch(" ", iter(["\n\n## Next"]))), "\n\n## Next")
+
+
+    def test_ainvoke_with_per_request_params(self):
+        async def run():
+            return await asyncio.gather(
+                self.model_manager.ainvoke("first", command="summarize"),
+                self.model_manager.ainvoke("second", max_tokens=50, temperature=0.1),
+            )
+
+        with patch.object(self.model_manager.models["claude"], "invoke", return_value={"r": 1}) as mock_invoke:
+            with patch.object(self.model_manager.models["claude"], "process_response", side_effect=["a", "b"]):
+                results = asyncio.run(run())
+
+        self.assertEqual(sorted(results), ["a", "b"])
+        payloads = {c[0][0]: c[0][1] for c in mock_invoke.call_args_list}
+        self.assertEqual(payloads["first"]["max_tokens"], 1000)
+        self.assertEqual(payloads["second"]["max_tokens"], 50)
+        self.assertEqual(payloads["second"]["temperature"], 0.1)
+
+    def test_ainvoke_respects_concurrency_limit(self):
+        self.model_manager.max_concurrency = 2
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def slow_invoke(prompt, payload):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+            return {"output": {"message": {"content": [{"text": prompt}]}}}
+
+        async def run():
+            return await asyncio.gather(*(self.model_manager.ainvoke(f"p{i}") for i in range(6)))
+
+        with patch.object(self.model_manager.models["claude"], "invoke", side_effect=slow_invoke):
+            results = asyncio.run(run())
+
+        self.assertEqual(results, [f"p{i}" for i in range(6)])
+        self.assertEqual(peak[0], 2)
+        # Requests that waited for a free worker report it as queue time
+        self.assertGreater(max(m.queue_time for m in self.model_manager.metrics.records()), 0.04)
+
+    def test_astream_yields_chunks(self):
+        stream = {"stream": [
+            {"contentBlockDelta": {"delta": {"text": "Hel"}}},
+            {"contentBlockDelta": {"delta": {"text": "lo"}}},
+        ]}
+
+        async def run():
+            return [chunk async for chunk in self.model_manager.astream("Hello", model_name="claude")]
+
+        with patch.object(self.model_manager.models["claude"], "invoke_stream", return_value=stream):
+            self.assertEqual(asyncio.run(run()), ["Hel", "lo"])
+
+    def test_astream_propagates_errors(self):
+        def events():
+            yield {"contentBlockDelta": {"delta": {"text": "partial"}}}
+            raise ConnectionError("stream dropped")
+
+        async def run():
+            chunks = []
+            with self.assertRaises(ConnectionError):
+                async for chunk in self.model_manager.astream("Hello"):
+                    chunks.append(chunk)
+            return chunks
+
+        with patch.object(self.model_manager.models["claude"], "invoke_stream", return_value={"stream": events()}):
+            self.assertEqual(asyncio.run(run()), ["partial"])
+
+
+    def test_providers_built_on_first_use(self):
+        self.assertFalse(self.model_manager.models.is_loaded("claude"))
+        self.mock_session.assert_not_called()
+
+        invoker = self.model_manager.models["claude"]
+
+        self.assertIsInstance(invoker, ClaudeInvoker)
+        self.assertIs(invoker.bedrock_client, self.mock_bedrock_runtime)
+        self.assertIs(self.model_manager.models["claude"], invoker)
+        self.assertFalse(self.model_manager.models.is_loaded("openai"))
+        self.mock_session.assert_called_once()
+
+
+    def enable_response_cache(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.config["response_cache"] = {"enabled": True, "path": os.path.join(tmpdir.name, "cache.sqlite3")}
+        manager = ModelManager(self.config)
+        self.addCleanup(manager.response_cache.close)
+        return manager
+
+    def test_response_cache_disabled_by_default(self):
+        self.assertIsNone(self.model_manager.response_cache)
+
+    def test_unwritable_response_cache_is_disabled(self):
+        with tempfile.NamedTemporaryFile() as blocker:
+            # A file where the cache directory should be
+            self.config["response_cache"] = {"enabled": True, "path": os.path.join(blocker.name, "cache.sqlite3")}
+            with patch('builtins.print') as mock_print:
+                manager = ModelManager(self.config)
+
+        self.assertIsNone(manager.response_cache)
+        self.assertIn("Response cache disabled", mock_print.call_args[0][0])
+        response = {"output": {"message": {"content": [{"text": "Answer"}]}}}
+        with patch.object(manager.models["claude"], "invoke", return_value=response):
+            self.assertEqual(manager.invoke_model("Hello"), "Answer")
+
+    def test_invoke_model_uses_response_cache(self):
+        manager = self.enable_response_cache()
+        response = {"output": {"message": {"content": [{"text": "Cached answer"}]}}}
+        with patch.object(manager.models["claude"], "invoke", return_value=response) as mock_invoke:
+            first = manager.invoke_model("Hello")
+            second = manager.invoke_model("Hello")
+            manager.invoke_model("Hello", max_tokens=5)
+
+        self.assertEqual(first, "Cached answer")
+        self.assertEqual(second, "Cached answer")
+        # Different inference settings are a different cache entry
+        self.assertEqual(mock_invoke.call_count, 2)
+        self.assertTrue(manager.metrics.records()[1].cache_hit)
+
+    def test_error_responses_are_not_cached(self):
+        manager = self.enable_response_cache()
+        with patch.object(manager.models["claude"], "invoke", return_value={"output": {}}) as mock_invoke:
+            first = manager.invoke_model("Hello")
+            manager.invoke_model("Hello")
+
+        self.assertEqual(first, "Error processing response")
+        self.assertEqual(mock_invoke.call_count, 2)
+        self.assertEqual(len(manager.response_cache), 0)
+
+    def test_streamed_answer_is_cached_and_replayed(self):
+        manager = self.enable_response_cache()
+        stream = {"stream": [
+            {"contentBlockDelta": {"delta": {"text": "line one\nli"}}},
+            {"contentBlockDelta": {"delta": {"text": "ne two"}}},
+        ]}
+        with patch.object(manager.models["claude"], "invoke_stream", return_value=stream) as mock_stream:
+            first = list(manager.invoke_model_stream("Hello"))
+            replayed = list(manager.invoke_model_stream("Hello"))
+
+        mock_stream.assert_called_once()
+        self.assertEqual("".join(first), "line one\nline two")
+        self.assertEqual(replayed, ["line one\n", "line two"])
+        self.assertTrue(manager.last_metrics.cache_hit)
+
+    def test_failed_stream_is_not_cached(self):
+        manager = self.enable_response_cache()
+
+        def events():
+            yield {"contentBlockDelta": {"delta": {"text": "partial"}}}
+            raise ConnectionError("stream dropped")
+
+        with patch.object(manager.models["claude"], "invoke_stream", return_value={"stream": events()}):
+            with self.assertRaises(ConnectionError):
+                list(manager.invoke_model_stream("Hello"))
+
+        self.assertEqual(len(manager.response_cache), 0)
+
+    def test_semantic_cache_remembers_answers_per_command(self):
+        self.config["semantic_cache"] = {"enabled": True, "threshold": 0.9}
+        with patch('models.model_manager._load_embedder', return_value=lambda texts: np.ones((len(texts), 4)) / 2):
+            manager = ModelManager(self.config)
+            manager._semantic_cache_loader.join(5)
+            manager.semantic_cache.wait_until_ready(5)
+
+        manager.remember_answer("reword", "some text", "reworded")
+        manager.remember_answer("reword", "other text", "Error while invoking the model")
+        manager.remember_answer("reword", "third text", "Error processing response")
+        manager.remember_answer("reword", "fourth text", "No valid response received.")
+
+        self.assertEqual(manager.find_similar_answer("reword", "some text"), ("reworded", 1.0))
+        self.assertIsNone(manager.find_similar_answer("summarize", "some text"))
+        self.assertIsNone(manager.find_similar_answer(None, "some text"))
+        self.assertEqual(len(manager.semantic_cache), 1)
+
+    def test_builds_from_shipped_config(self):
+        with open("configuration/config.json") as f:
+            config = json.load(f)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        for section in ("response_cache", "semantic_cache"):
+            config[section]["path"] = os.path.join(tmpdir.name, section)
+        config["semantic_cache"]["enabled"] = False
+
+        with patch('models.model_manager.BedrockClientPool.prewarm'):
+            manager = ModelManager(config)
+        self.addCleanup(manager.response_cache.close)
+
+        check = manager.preflight("Hello")
+        self.assertEqual(check.model, config["default_model"])
+        self.assertEqual(check.context_window, config[config["default_model"]]["context_window"])
+        self.assertIn("claude", manager.rate_limiters)
+
+    def test_bedrock_client_is_shared_from_pool(self):
+        self.assertIs(self.model_manager.models["claude"].bedrock_client, self.model_manager.models["llama"].bedrock_client)
+        self.mock_session.return_value.client.assert_called_once()
+
+    def test_bedrock_requests_mark_the_pool_used(self):
+        response = {"output": {"message": {"content": [{"text": "Answer"}]}}}
+        with patch.object(self.model_manager.models["claude"], "invoke", return_value=response), \
+                patch.object(self.model_manager.bedrock_pool, "mark_used") as mock_mark_used:
+            self.model_manager.invoke_model("Hello")
+
+        mock_mark_used.assert_called_once()
+
+    def test_prewarm_on_startup_when_configured(self):
+        self.config["bedrock_pool"] = {"prewarm": True}
+        with patch('models.model_manager.BedrockClientPool.prewarm') as mock_prewarm:
+            ModelManager(self.config)
+        mock_prewarm.assert_called_once()
+
+    def test_race_model_stream_streams_fastest_provider(self):
+        self.config["racing"] = {"models": ["claude", "llama"]}
+        manager = ModelManager(self.config)
+        cancelled = []
+
+        def invoke_stream_once(prompt, command, name, params, queued_at, on_start, reserved_tokens):
+            on_start(lambda: cancelled.append(name))
+            if name == "claude":
+                time.sleep(0.2)
+            return iter([f"{name} answer"])
+
+        with patch.object(manager, "_invoke_stream_once", side_effect=invoke_stream_once):
+            race = manager.race_model_stream("Hello", command="response")
+            self.assertEqual(list(race), ["llama answer"])
+
+        self.assertEqual(race.winner, "llama")
+        self.assertIn("claude", cancelled)
+
+    def test_cancelled_stream_does_not_count_as_failure(self):
+        metrics = self.model_manager._start_metrics("claude", None, streaming=True)
+        model = Mock()
+        self.model_manager._cancel_stream(model, "stream", metrics)
+        self.model_manager._finish_metrics(metrics, ConnectionError("closed"))
+
+        model.close_stream.assert_called_once_with("stream")
+        self.assertEqual(self.model_manager.circuit_breaker("claude").failures, 0)
+
+    def test_cancelled_probe_is_released(self):
+        breaker = self.model_manager.circuit_breaker("claude")
+        breaker.state, breaker.opened_at = breaker.OPEN, time.monotonic() - breaker.reset_timeout
+        self.assertTrue(breaker.allow_request())
+        metrics = self.model_manager._start_metrics("claude", None, streaming=True)
+        self.model_manager._cancel_stream(Mock(), "stream", metrics)
+        self.model_manager._finish_metrics(metrics, ConnectionError("closed"))
+
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+
+    def test_slow_queue_or_long_answer_is_not_a_latency_failure(self):
+        self.config["circuit_breaker"] = {"failure_threshold": 1, "latency_threshold_seconds": 0.01}
+        manager = ModelManager(self.config)
+        response = {"output": {"message": {"content": [{"text": "Answer"}]}}}
+
+        def slow_invoke(prompt, payload):
+            time.sleep(0.05)
+            return response
+
+        with patch.object(manager.models["claude"], "invoke", side_effect=slow_invoke):
+            manager.invoke_model("Hello")
+        queued_at = time.perf_counter() - 1
+        stream = {"stream": [{"contentBlockDelta": {"delta": {"text": "Hi"}}}]}
+        with patch.object(manager.models["claude"], "invoke_stream", return_value=stream):
+            list(manager._invoke_stream("Hi", None, None, {}, queued_at=queued_at))
+
+        self.assertEqual(manager.circuit_breaker("claude").state, "closed")
+
+    def test_race_is_budgeted_for_the_smallest_window(self):
+        self.config["racing"] = {"models": ["claude", "llama"]}
+        self.config["claude"]["context_window"] = 200000
+        self.config["llama"] = {"modelId": "llama", "max_tokens": 500, "context_window": 2000}
+        self.config["token_budget"] = {"policy": "reject"}
+        manager = ModelManager(self.config)
+
+        self.assertEqual(manager.race_budget_model("word " * 10), "llama")
+        with patch.object(manager, "_invoke_stream_once") as mock_start:
+            with self.assertRaises(TokenBudgetExceeded) as raised:
+                manager.race_model_stream("word " * 2000)
+        self.assertEqual(raised.exception.check.model, "llama")
+        mock_start.assert_not_called()
+
+    def test_race_model_stream_needs_two_streaming_models(self):
+        with patch.object(self.model_manager, "invoke_model_stream", return_value=iter(["x"])) as mock_stream:
+            self.model_manager.race_model_stream("Hello", model_names=["claude", "nova"])
+        mock_stream.assert_called_once_with("Hello", command=None, model_name="claude")
+
+    def test_rate_limiter_admits_and_charges_usage(self):
+        self.config["rate_limits"] = {"claude": {"requests_per_minute": 60, "tokens_per_minute": 60000}}
+        manager = ModelManager(self.config)
+        limiter = manager.rate_limiters["claude"]
+        response = {
+            "output": {"message": {"content": [{"text": "Answer"}]}},
+            "usage": {"inputTokens": 10, "outputTokens": 500},
+        }
+        with patch.object(manager.models["claude"], "invoke", return_value=response), \
+                patch.object(limiter, "acquire", wraps=limiter.acquire) as mock_acquire, \
+                patch.object(limiter, "charge") as mock_charge:
+            manager.invoke_model("x" * 35)
+
+        mock_acquire.assert_called_once_with(10)
+        mock_charge.assert_called_once_with(500)
+        self.assertEqual(manager.last_metrics.reserved_tokens, 10)
+
+    def test_throttling_tightens_the_models_limiter(self):
+        self.config["rate_limits"] = {"claude": {"requests_per_minute": 60}}
+        manager = ModelManager(self.config)
+
+        manager.bedrock_pool.on_throttle("claude-3-sonnet")
+        manager.bedrock_pool.on_throttle("some-other-model")
+
+        self.assertEqual(manager.rate_limiters["claude"].scale, 0.5)
+
+    def test_ainvoke_waits_for_rate_limiter_on_event_loop(self):
+        self.config["rate_limits"] = {"claude": {"requests_per_minute": 60}}
+        manager = ModelManager(self.config)
+        response = {"output": {"message": {"content": [{"text": "Answer"}]}}}
+        with patch.object(manager.models["claude"], "invoke", return_value=response), \
+                patch.object(manager.rate_limiters["claude"], "acquire") as mock_acquire, \
+                patch.object(manager.rate_limiters["claude"], "aacquire", wraps=manager.rate_limiters["claude"].aacquire) as mock_aacquire:
+            self.assertEqual(asyncio.run(manager.ainvoke("Hello")), "Answer")
+
+        mock_aacquire.assert_called_once()
+        mock_acquire.assert_not_called()
+
+    def test_failover_to_next_backend_when_invoke_fails(self):
+        self.config["failover"] = {"claude": ["claude@us-west-2", "openai"]}
+        manager = ModelManager(self.config)
+        response = {"output": {"message": {"content": [{"text": "West answer"}]}}}
+        with patch.object(manager.models["claude"], "invoke", return_value=None):
+            with patch.object(manager.models["claude@us-west-2"], "invoke", return_value=response) as mock_west:
+                self.assertEqual(manager.invoke_model("Hello"), "West answer")
+
+        mock_west.assert_called_once()
+        self.mock_session.return_value.client.assert_any_call(
+            "bedrock-runtime", config=unittest.mock.ANY, region_name="us-west-2"
+        )
+        self.assertEqual(manager.last_metrics.model, "claude@us-west-2")
+
+    def test_open_circuit_skips_sick_backend(self):
+        self.config["failover"] = {"claude": ["openai"]}
+        self.config["circuit_breaker"] = {"failure_threshold": 2, "reset_timeout_seconds": 60}
+        manager = ModelManager(self.config)
+        with patch.object(manager.models["claude"], "invoke", return_value=None) as mock_claude, \
+                patch.object(manager.models["openai"], "invoke", return_value={}), \
+                patch.object(manager.models["openai"], "process_response", return_value="OpenAI answer"):
+            for _ in range(4):
+                self.assertEqual(manager.invoke_model("Hello"), "OpenAI answer")
+
+        self.assertEqual(mock_claude.call_count, 2)
+        self.assertEqual(manager.circuit_breaker("claude").state, "open")
+
+    def test_stream_fails_over_when_it_cannot_start(self):
+        self.config["failover"] = {"claude": ["claude@us-west-2"]}
+        manager = ModelManager(self.config)
+        stream = {"stream": [{"contentBlockDelta": {"delta": {"text": "West"}}}]}
+        with patch.object(manager.models["claude"], "invoke_stream", return_value=None), \
+                patch.object(manager.models["claude@us-west-2"], "invoke_stream", return_value=stream):
+            self.assertEqual(list(manager.invoke_model_stream("Hello")), ["West"])
+
+    def test_all_backends_failing_returns_error(self):
+        with patch.object(self.model_manager.models["claude"], "invoke", return_value=None):
+            self.assertEqual(self.model_manager.invoke_model("Hello"), "Error while invoking the model")
+
+    def test_streaming_support_is_discovered_from_invoker(self):
+        self.assertTrue(self.model_manager.is_streaming_supported("claude"))
+        self.assertTrue(self.model_manager.is_streaming_supported("llama"))
+        self.assertTrue(self.model_manager.is_streaming_supported("titan"))
+        self.assertTrue(self.model_manager.is_streaming_supported("claude@us-west-2"))
+
+    def test_preflight_reports_window_and_cost(self):
+        self.config["claude"].update({"context_window": 4000, "input_price_per_1k": 0.003, "output_price_per_1k": 0.015})
+        manager = ModelManager(self.config)
+
+        check = manager.preflight("x" * 3500)
+
+        self.assertEqual(check.input_tokens, 1000)
+        self.assertEqual(check.available_input_tokens, 3000)
+        self.assertAlmostEqual(check.max_cost, 0.018)
+        self.assertEqual(manager.preflight("x", max_tokens=3900).available_input_tokens, 100)
+
+    def test_oversized_prompt_is_rejected_before_the_call(self):
+        self.config["claude"]["context_window"] = 2000
+        self.config["token_budget"] = {"policy": "reject"}
+        manager = ModelManager(self.config)
+
+        with patch.object(manager.models["claude"], "invoke") as mock_invoke:
+            with self.assertRaises(TokenBudgetExceeded):
+                manager.invoke_model("word " * 2000)
+            with self.assertRaises(TokenBudgetExceeded):
+                manager.invoke_model_stream("word " * 2000)
+        mock_invoke.assert_not_called()
+
+    def test_trim_policy_trims_the_prompt(self):
+        self.config["claude"]["context_window"] = 2000
+        self.config["token_budget"] = {"policy": "trim"}
+        manager = ModelManager(self.config)
+
+        with patch.object(manager.models["claude"], "invoke", return_value=None) as mock_invoke:
+            manager.invoke_model("start " + "word " * 2000 + "end")
+
+        prompt = mock_invoke.call_args[0][0]
+        self.assertTrue(prompt.startswith("start"))
+        self.assertTrue(prompt.endswith("end"))
+        self.assertLessEqual(manager.preflight(prompt).input_tokens, 1000)
+
+    def test_system_and_context_reach_the_payload_and_budget(self):
+        with patch.object(self.model_manager.models["claude"], "invoke") as mock_invoke:
+            self.model_manager.invoke_model("question", system="Be brief.", context="earlier")
+
+        payload = mock_invoke.call_args[0][1]
+        self.assertEqual(payload["system"], "Be brief.")
+        self.assertEqual(payload["context"], "earlier")
+        self.assertGreater(
+            self.model_manager.preflight("question", system="x" * 700).input_tokens,
+            self.model_manager.preflight("question").input_tokens + 150,
+        )
+        messages = [{"role": "user", "content": "y" * 700}]
+        self.assertGreater(
+            self.model_manager.preflight("question", messages=messages).input_tokens,
+            self.model_manager.preflight("question").input_tokens + 150,
+        )
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
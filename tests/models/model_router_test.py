@@ -0,0 +1,28 @@
+import unittest
+from models.model_router import ModelRouter
+
+
+class TestModelRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = ModelRouter([
+            {"commands": ["list_typos"], "max_input_tokens": 100, "model": "llama", "max_tokens": 512},
+            {"commands": ["code_review"], "min_input_tokens": 1000, "model": "claude", "max_tokens": 16000},
+            {"max_input_tokens": 100, "max_tokens": 1024},
+        ])
+
+    def test_small_input_goes_to_fast_model(self):
+        self.assertEqual(self.router.route("list_typos", "teh sentence"), {"model_name": "llama", "max_tokens": 512})
+
+    def test_large_input_skips_size_limited_rule(self):
+        self.assertEqual(self.router.route("list_typos", "x" * 4000), {})
+
+    def test_min_input_tokens(self):
+        self.assertEqual(self.router.route("code_review", "x" * 8000), {"model_name": "claude", "max_tokens": 16000})
+        self.assertEqual(self.router.route("code_review", "x"), {"max_tokens": 1024})
+
+    def test_no_rules_keeps_defaults(self):
+        self.assertEqual(ModelRouter().route("summarize", "text"), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
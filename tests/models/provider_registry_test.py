@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import Mock
+from models.provider_registry import ProviderRegistry
+
+
+class TestProviderRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ProviderRegistry()
+        self.factory = Mock(return_value="invoker")
+        self.registry.register("claude", self.factory)
+
+    def test_builds_on_first_use_only(self):
+        self.factory.assert_not_called()
+        self.assertFalse(self.registry.is_loaded("claude"))
+
+        self.assertEqual(self.registry["claude"], "invoker")
+        self.assertEqual(self.registry["claude"], "invoker")
+
+        self.factory.assert_called_once_with()
+        self.assertTrue(self.registry.is_loaded("claude"))
+
+    def test_get_and_contains(self):
+        self.assertIn("claude", self.registry)
+        self.assertNotIn("llama", self.registry)
+        self.assertEqual(self.registry.get("llama", "fallback"), "fallback")
+        self.assertEqual(self.registry.keys(), ["claude"])
+        self.factory.assert_not_called()
+
+    def test_unknown_model_raises_key_error(self):
+        with self.assertRaises(KeyError):
+            self.registry["llama"]
+
+    def test_register_replaces_instance(self):
+        self.registry["claude"]
+        self.registry.register("claude", Mock(return_value="replacement"))
+        self.assertEqual(self.registry["claude"], "replacement")
+
+
+if __name__ == '__main__':
+    unittest.main()
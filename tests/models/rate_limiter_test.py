@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from models.rate_limiter import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        clock_patcher = patch('models.rate_limiter.time.monotonic', self.clock)
+        clock_patcher.start()
+        self.addCleanup(clock_patcher.stop)
+
+    def test_bucket_allows_burst_then_spaces_requests(self):
+        bucket = TokenBucket(60, burst_seconds=2)
+
+        self.assertEqual(bucket.reserve(1), 0)
+        self.assertEqual(bucket.reserve(1), 0)
+        self.assertEqual(bucket.reserve(1), 1.0)
+        self.assertEqual(bucket.reserve(1), 2.0)
+
+    def test_requests_per_minute(self):
+        limiter = RateLimiter(requests_per_minute=120, burst_seconds=1)
+
+        waits = [limiter.reserve() for _ in range(4)]
+
+        self.assertEqual(waits, [0, 0, 0.5, 1.0])
+
+    def test_tokens_per_minute(self):
+        limiter = RateLimiter(tokens_per_minute=6000, burst_seconds=1)
+
+        self.assertEqual(limiter.reserve(100), 0)
+        self.assertAlmostEqual(limiter.reserve(500), 5.0)
+        self.clock.now += 5
+        self.assertEqual(limiter.reserve(0), 0)
+
+    def test_charge_delays_later_requests(self):
+        limiter = RateLimiter(tokens_per_minute=6000, burst_seconds=1)
+        limiter.reserve(100)
+        limiter.charge(100)
+
+        self.assertAlmostEqual(limiter.reserve(10), 1.1)
+
+    def test_throttle_halves_rate_once_per_interval(self):
+        limiter = RateLimiter(requests_per_minute=60, burst_seconds=1)
+
+        limiter.on_throttle()
+        limiter.on_throttle()
+        self.assertEqual(limiter.scale, 0.5)
+        self.assertEqual(limiter.throttle_count, 1)
+
+        limiter.reserve()
+        self.assertEqual(limiter.reserve(), 2.0)
+
+        self.clock.now += 2
+        limiter.on_throttle()
+        self.assertEqual(limiter.scale, 0.25)
+
+    def test_success_restores_rate_gradually(self):
+        limiter = RateLimiter(requests_per_minute=60, min_scale=0.1, increase_step=0.25)
+        for _ in range(5):
+            self.clock.now += 2
+            limiter.on_throttle()
+        self.assertEqual(limiter.scale, 0.1)
+
+        for _ in range(10):
+            limiter.on_success()
+        self.assertEqual(limiter.scale, 1.0)
+
+    def test_unlimited_when_not_configured(self):
+        limiter = RateLimiter()
+
+        self.assertEqual([limiter.reserve(10 ** 6) for _ in range(100)], [0] * 100)
+
+    def test_shared_between_threads_and_tasks(self):
+        limiter = RateLimiter(requests_per_minute=60, burst_seconds=1)
+        waits = []
+        threads = [threading.Thread(target=lambda: waits.append(limiter.reserve())) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with patch('asyncio.sleep') as mock_sleep:
+            waits.append(asyncio.run(limiter.aacquire()))
+
+        self.assertEqual(sorted(waits), [0, 1.0, 2.0, 3.0])
+        mock_sleep.assert_called_once_with(3.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from unittest.mock import patch
+from models.request_metrics import MetricsRecorder, RequestMetrics, percentile
+
+
+class TestPercentile(unittest.TestCase):
+    def test_percentile(self):
+        values = [1, 2, 3, 4, 5]
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 100), 5)
+        self.assertAlmostEqual(percentile(values, 95), 4.8)
+
+    def test_percentile_empty(self):
+        self.assertIsNone(percentile([], 50))
+
+
+class TestRequestMetrics(unittest.TestCase):
+    @patch('models.request_metrics.time.perf_counter')
+    def test_streaming_timings(self, mock_clock):
+        mock_clock.side_effect = [10.0, 10.5, 11.0, 11.25, 11.75, 12.0]
+        metrics = RequestMetrics("claude", command="code_review", streaming=True)
+        metrics.mark_started()
+        metrics.mark_token()
+        metrics.mark_token()
+        metrics.mark_token()
+        metrics.record_usage({"input_tokens": 100, "output_tokens": 50, "latency_ms": 1900})
+        metrics.mark_finished()
+
+        self.assertEqual(metrics.queue_time, 0.5)
+        self.assertEqual(metrics.time_to_first_token, 1.0)
+        self.assertEqual(metrics.inter_token_gaps, [0.25, 0.5])
+        self.assertEqual(metrics.total_latency, 2.0)
+        self.assertEqual(metrics.tokens_per_second, 50.0)
+        self.assertEqual(metrics.to_dict()["server_latency_ms"], 1900)
+
+    @patch('models.request_metrics.time.perf_counter')
+    def test_first_token_latency_excludes_queueing(self, mock_clock):
+        mock_clock.side_effect = [10.0, 14.0, 14.5, 20.0]
+        metrics = RequestMetrics("claude", streaming=True)
+        metrics.mark_started()
+        metrics.mark_token()
+        metrics.mark_finished()
+
+        self.assertEqual(metrics.time_to_first_token, 4.5)
+        self.assertEqual(metrics.first_token_latency, 0.5)
+
+    def test_first_token_latency_only_for_streams(self):
+        metrics = RequestMetrics("claude")
+        metrics.mark_started()
+        metrics.mark_finished()
+
+        self.assertIsNone(metrics.first_token_latency)
+
+    def test_tokens_per_second_without_usage(self):
+        metrics = RequestMetrics("llama")
+        metrics.mark_started()
+        metrics.mark_finished()
+        self.assertIsNone(metrics.tokens_per_second)
+
+    def test_records_prompt_cache_usage(self):
+        metrics = RequestMetrics("claude")
+        metrics.record_usage({"input_tokens": 10, "cache_read_tokens": 2000, "cache_write_tokens": 0})
+        self.assertEqual(metrics.prompt_cache_read_tokens, 2000)
+        self.assertEqual(metrics.to_dict()["prompt_cache_write_tokens"], 0)
+
+        recorder = MetricsRecorder()
+        recorder.record(metrics)
+        self.assertEqual(recorder.summary()["claude"]["prompt_cache_read_tokens"], 2000)
+
+
+class TestMetricsRecorder(unittest.TestCase):
+    def make_metrics(self, model, command, ttft, error=None):
+        metrics = RequestMetrics(model, command=command)
+        metrics.first_token_at = metrics.created_at + ttft
+        metrics.finished_at = metrics.created_at + ttft * 2
+        metrics.error = error
+        return metrics
+
+    def test_summary_groups_by_model_and_command(self):
+        recorder = MetricsRecorder()
+        recorder.record(self.make_metrics("claude", "summarize", 1.0))
+        recorder.record(self.make_metrics("claude", "code_review", 3.0))
+        recorder.record(self.make_metrics("llama", "summarize", 0.5, error="boom"))
+
+        by_model = recorder.summary(group_by="model")
+        self.assertEqual(by_model["claude"]["count"], 2)
+        self.assertAlmostEqual(by_model["claude"]["time_to_first_token"]["p50"], 2.0)
+        self.assertEqual(by_model["llama"]["errors"], 1)
+        self.assertIsNone(by_model["llama"]["time_to_first_token"]["p50"])
+
+        by_command = recorder.summary(group_by="command")
+        self.assertEqual(set(by_command), {"summarize", "code_review"})
+        self.assertEqual(len(recorder.records(command="summarize")), 2)
+
+    def test_keeps_most_recent_records(self):
+        recorder = MetricsRecorder(max_records=2)
+        for ttft in (1.0, 2.0, 3.0):
+            recorder.record(self.make_metrics("claude", None, ttft))
+        self.assertEqual(len(recorder.records()), 2)
+        self.assertEqual(set(recorder.summary(group_by="command")), {"-"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch, Mock
+from models.response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "cache", "responses.sqlite3")
+        self.cache = ResponseCache(self.path, ttl_seconds=60, max_entries=3, max_bytes=1000)
+        self.addCleanup(self.cache.close)
+
+    def test_make_key_depends_on_every_component(self):
+        key = ResponseCache.make_key("model-a", {"max_tokens": 10}, "prompt")
+        self.assertEqual(key, ResponseCache.make_key("model-a", {"max_tokens": 10}, "prompt"))
+        self.assertNotEqual(key, ResponseCache.make_key("model-b", {"max_tokens": 10}, "prompt"))
+        self.assertNotEqual(key, ResponseCache.make_key("model-a", {"max_tokens": 20}, "prompt"))
+        self.assertNotEqual(key, ResponseCache.make_key("model-a", {"max_tokens": 10}, "other"))
+
+    def test_put_and_get(self):
+        self.assertIsNone(self.cache.get("k"))
+        self.cache.put("k", "answer")
+        self.assertEqual(self.cache.get("k"), "answer")
+        self.assertEqual(len(self.cache), 1)
+
+    def test_shared_between_connections(self):
+        self.cache.put("k", "answer")
+        other = ResponseCache(self.path)
+        self.addCleanup(other.close)
+        self.assertEqual(other.get("k"), "answer")
+        journal_mode = other._connection.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(journal_mode, "wal")
+
+    @patch('models.response_cache.time.time')
+    def test_expired_entries_are_dropped(self, mock_time):
+        mock_time.return_value = 1000.0
+        self.cache.put("k", "answer")
+        mock_time.return_value = 1061.0
+        self.assertIsNone(self.cache.get("k"))
+        self.assertEqual(len(self.cache), 0)
+
+    @patch('models.response_cache.time.time')
+    def test_evicts_least_recently_used_over_entry_cap(self, mock_time):
+        for i, key in enumerate(["a", "b", "c"]):
+            mock_time.return_value = 1000.0 + i
+            self.cache.put(key, key)
+        mock_time.return_value = 1010.0
+        self.cache.get("a")
+        mock_time.return_value = 1011.0
+        self.cache.put("d", "d")
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual([self.cache.get(k) for k in ("a", "c", "d")], ["a", "c", "d"])
+
+    @patch('models.response_cache.time.time')
+    def test_evicts_over_size_cap(self, mock_time):
+        mock_time.return_value = 1000.0
+        self.cache.put("old", "x" * 600)
+        mock_time.return_value = 1001.0
+        self.cache.put("new", "y" * 600)
+        self.assertIsNone(self.cache.get("old"))
+        self.assertEqual(self.cache.get("new"), "y" * 600)
+
+    def test_database_errors_degrade_to_a_miss(self):
+        self.cache.put("k", "answer")
+        connection = self.cache._connection
+        self.cache._connection = Mock()
+        self.cache._connection.execute.side_effect = sqlite3.OperationalError("database is locked")
+
+        with patch('builtins.print') as mock_print:
+            self.assertIsNone(self.cache.get("k"))
+            self.cache.put("other", "answer")
+
+        self.assertEqual(mock_print.call_count, 2)
+        self.cache._connection = connection
+        self.assertEqual(self.cache.get("k"), "answer")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from models.semantic_cache import SemanticCache
+from tests.fake_embeddings import BagOfWords
+
+
+bag_of_words = BagOfWords(["traceback", "keyerror", "line", "file", "typo", "paragraph", "cat", "dog", "42", "43"])
+
+
+class TestSemanticCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "semantic")
+
+    def make_cache(self, **kwargs):
+        cache = SemanticCache(lambda: bag_of_words, path=self.path, threshold=0.75, **kwargs).start()
+        self.assertTrue(cache.wait_until_ready(5))
+        return cache
+
+    def test_near_duplicate_hits(self):
+        cache = self.make_cache()
+        cache.add("code_review", "Traceback file line 42 KeyError", "fix the key")
+
+        answer, similarity = cache.lookup("code_review", "Traceback file line 43 KeyError")
+
+        self.assertEqual(answer, "fix the key")
+        self.assertGreaterEqual(similarity, 0.75)
+
+    def test_different_input_or_command_misses(self):
+        cache = self.make_cache()
+        cache.add("code_review", "Traceback file line 42 KeyError", "fix the key")
+
+        self.assertIsNone(cache.lookup("code_review", "cat dog paragraph"))
+        self.assertIsNone(cache.lookup("summarize", "Traceback file line 42 KeyError"))
+
+    def test_misses_until_embedder_is_loaded(self):
+        cache = SemanticCache(lambda: bag_of_words, threshold=0.9)
+        cache.add("reword", "cat dog", "answer")
+
+        self.assertIsNone(cache.lookup("reword", "cat dog"))
+        self.assertEqual(len(cache), 0)
+
+    def test_missing_embedder_disables_cache(self):
+        cache = SemanticCache(lambda: None).start()
+        cache.wait_until_ready(5)
+
+        self.assertFalse(cache.ready)
+        self.assertIsNone(cache.lookup("reword", "cat dog"))
+
+    def test_keeps_most_recent_entries(self):
+        cache = self.make_cache(max_entries=2)
+        cache.add("reword", "cat", "1")
+        cache.add("reword", "dog", "2")
+        cache.add("reword", "typo", "3")
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.lookup("reword", "cat"))
+        self.assertEqual(cache.lookup("reword", "typo")[0], "3")
+
+    def test_long_inputs_differing_at_the_end_miss(self):
+        cache = self.make_cache()
+        shared = "traceback file line paragraph\n" * 100
+        cache.add("code_review", shared + "cat", "about a cat")
+
+        self.assertEqual(cache.lookup("code_review", shared + "cat")[0], "about a cat")
+        self.assertIsNone(cache.lookup("code_review", shared + "dog"))
+
+    def test_inputs_with_too_many_parts_are_not_cached(self):
+        cache = self.make_cache(max_parts=2)
+        cache.add("summarize", "cat dog paragraph\n" * 200, "too long")
+
+        self.assertEqual(len(cache), 0)
+
+    def test_persists_between_instances(self):
+        cache = self.make_cache()
+        cache.add("summarize", "paragraph about a cat", "a cat")
+        cache.flush()
+
+        reloaded = self.make_cache()
+
+        self.assertEqual(reloaded.lookup("summarize", "paragraph about a cat")[0], "a cat")
+        self.assertEqual(reloaded._entries["summarize"][0][0].dtype, np.float16)
+
+    def test_appends_entries_and_compacts_evicted_ones(self):
+        cache = self.make_cache(max_entries=2)
+        for word in ["cat", "dog", "typo", "file"]:
+            cache.add("reword", word, word)
+            cache.flush()
+            with open(self.path + ".jsonl") as f:
+                lines = len(f.readlines())
+        self.assertEqual(lines, 4)
+
+        cache.add("reword", "line", "line")
+        cache.flush()
+
+        with open(self.path + ".jsonl") as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(len(self.make_cache(max_entries=2)), 2)
+
+    def test_ignores_torn_last_line(self):
+        cache = self.make_cache()
+        cache.add("reword", "cat", "a cat")
+        cache.flush()
+        with open(self.path + ".jsonl", "a") as f:
+            f.write('{"command": "reword", "sha')
+
+        self.assertEqual(self.make_cache().lookup("reword", "cat")[0], "a cat")
+
+
+if __name__ == '__main__':
+    unittest.main()
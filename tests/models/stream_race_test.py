@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+from models.stream_race import StreamRace
+
+
+class TestStreamRace(unittest.TestCase):
+    def setUp(self):
+        self.closed = []
+
+    def close_response(self, name, response):
+        self.closed.append(name)
+        response.set()
+
+    def starter(self, chunks, delay=0.0, error=None):
+        def start(on_response):
+            aborted = threading.Event()
+            on_response(aborted)
+
+            def generate():
+                if aborted.wait(delay):
+                    raise ConnectionError("aborted")
+                for chunk in chunks:
+                    yield chunk
+                if error:
+                    raise error
+            return generate()
+        return start
+
+    def test_first_token_wins_and_losers_are_closed(self):
+        race = StreamRace({
+            "slow": self.starter(["slow"], delay=2),
+            "fast": self.starter(["fast", " answer"]),
+        }, self.close_response).start()
+
+        started = time.perf_counter()
+        self.assertEqual("".join(race), "fast answer")
+
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(race.winner, "fast")
+        self.assertIn("slow", self.closed)
+
+    def test_empty_streams_lose(self):
+        race = StreamRace({
+            "empty": self.starter([]),
+            "late": self.starter(["late"], delay=0.05),
+        }, self.close_response).start()
+
+        self.assertEqual(list(race), ["late"])
+        self.assertEqual(race.winner, "late")
+
+    def test_all_empty_yields_nothing(self):
+        race = StreamRace({"a": self.starter([]), "b": self.starter([])}, self.close_response).start()
+
+        self.assertEqual(list(race), [])
+        self.assertIsNone(race.winner)
+
+    def test_winner_error_propagates(self):
+        race = StreamRace({
+            "broken": self.starter(["partial"], error=ConnectionError("dropped")),
+            "slow": self.starter(["slow"], delay=2),
+        }, self.close_response).start()
+
+        chunks = []
+        with self.assertRaises(ConnectionError):
+            for chunk in race:
+                chunks.append(chunk)
+        self.assertEqual(chunks, ["partial"])
+
+    def test_closing_early_aborts_winner(self):
+        race = StreamRace({
+            "a": self.starter(["one", "two"]),
+            "b": self.starter(["x"], delay=2),
+        }, self.close_response).start()
+
+        stream = iter(race)
+        next(stream)
+        stream.close()
+
+        self.assertEqual(sorted(set(self.closed)), ["a", "b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
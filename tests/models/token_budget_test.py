@@ -0,0 +1,52 @@
+import unittest
+from models.token_budget import BudgetCheck, TokenBudgetExceeded, estimate_tokens, model_family, trim_to_budget
+
+
+class TestTokenBudget(unittest.TestCase):
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("a" * 400), 100)
+        self.assertEqual(estimate_tokens("a" * 350, "claude"), 100)
+
+    def test_punctuation_heavy_text_counts_pieces(self):
+        code = "f(a,b);" * 10
+        self.assertGreater(estimate_tokens(code), len(code) / 4)
+
+    def test_model_family(self):
+        self.assertEqual(model_family("claude@us-west-2"), "claude")
+        self.assertEqual(model_family(None), "")
+
+    def test_budget_check_fits_and_costs(self):
+        check = BudgetCheck("claude", 2000, 1000, context_window=4000,
+                            input_price_per_1k=0.003, output_price_per_1k=0.015)
+
+        self.assertEqual(check.available_input_tokens, 3000)
+        self.assertTrue(check.fits)
+        self.assertAlmostEqual(check.input_cost, 0.006)
+        self.assertAlmostEqual(check.max_cost, 0.021)
+        self.assertIn("$0.0060 up to $0.0210", check.describe())
+
+    def test_unknown_window_always_fits(self):
+        check = BudgetCheck("openai", 10 ** 9, 1000)
+        self.assertTrue(check.fits)
+        self.assertIsNone(check.input_cost)
+
+    def test_exceeded_message(self):
+        error = TokenBudgetExceeded(BudgetCheck("titan", 9000, 3000, context_window=8000), "reject")
+        self.assertIn("5,000", str(error))
+        self.assertEqual(error.policy, "reject")
+
+    def test_trim_keeps_head_and_tail(self):
+        text = "head " + "middle " * 1000 + "tail"
+
+        trimmed = trim_to_budget(text, 200)
+
+        self.assertTrue(trimmed.startswith("head"))
+        self.assertTrue(trimmed.endswith("tail"))
+        self.assertIn("tokens trimmed", trimmed)
+        self.assertLessEqual(estimate_tokens(trimmed), 220)
+        self.assertEqual(trim_to_budget("short", 200), "short")
+
+
+if __name__ == '__main__':
+    unittest.main()
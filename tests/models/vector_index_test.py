@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from models.vector_index import VectorIndex
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class TestVectorIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "index")
+
+    def test_search_returns_best_matches_first(self):
+        index = VectorIndex(self.path)
+        index.add(["a", "b", "c"], [unit(1, 0, 0), unit(1, 1, 0), unit(0, 0, 1)])
+
+        hits = index.search(unit(1, 0.1, 0), k=2)
+
+        self.assertEqual([key for key, _ in hits], ["a", "b"])
+        self.assertGreater(hits[0][1], hits[1][1])
+
+    def test_min_score_filters_hits(self):
+        index = VectorIndex(self.path)
+        index.add(["a", "c"], [unit(1, 0, 0), unit(0, 0, 1)])
+
+        self.assertEqual([key for key, _ in index.search(unit(1, 0, 0), k=2, min_score=0.5)], ["a"])
+
+    def test_empty_index_returns_nothing(self):
+        self.assertEqual(VectorIndex(self.path).search(unit(1, 0, 0)), [])
+
+    def test_appends_persist_across_instances(self):
+        index = VectorIndex(self.path)
+        index.add(["a"], [unit(1, 0, 0)])
+        index.add(["b"], [unit(0, 1, 0)])
+
+        reopened = VectorIndex(self.path)
+
+        self.assertEqual(reopened.keys(), ["a", "b"])
+        self.assertEqual(reopened.search(unit(0, 1, 0), k=1)[0][0], "b")
+
+    def test_rows_without_keys_are_ignored_and_overwritten(self):
+        index = VectorIndex(self.path)
+        index.add(["a"], [unit(1, 0, 0)])
+        # An append interrupted after the vectors were written
+        with open(index.vectors_file, "ab") as f:
+            f.write(unit(0, 1, 0).astype(np.float16).tobytes())
+
+        reopened = VectorIndex(self.path)
+        self.assertEqual(len(reopened), 1)
+        reopened.add(["c"], [unit(0, 0, 1)])
+
+        self.assertEqual(os.path.getsize(index.vectors_file), 2 * 3 * 2)
+        self.assertEqual(VectorIndex(self.path).search(unit(0, 0, 1), k=1)[0][0], "c")
+
+    def test_retain_rewrites_only_kept_rows(self):
+        index = VectorIndex(self.path)
+        index.add(["a", "b", "c"], [unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)])
+
+        index.retain({"a", "c"})
+
+        self.assertEqual(index.keys(), ["a", "c"])
+        self.assertEqual(os.path.getsize(index.vectors_file), 2 * 3 * 2)
+        reopened = VectorIndex(self.path)
+        self.assertEqual(reopened.search(unit(0, 0, 1), k=1)[0][0], "c")
+        self.assertEqual(reopened.search(unit(0, 1, 0), k=1, min_score=0.5), [])
+
+    def test_rejects_vectors_of_another_dimension(self):
+        index = VectorIndex(self.path)
+        index.add(["a"], [unit(1, 0, 0)])
+
+        with self.assertRaises(ValueError):
+            index.add(["b"], [unit(1, 0)])
+
+    def test_search_spans_blocks(self):
+        index = VectorIndex(self.path)
+        index.BLOCK_ROWS = 2
+        index.add([str(i) for i in range(5)], [unit(1, i, 0) for i in range(5)])
+
+        self.assertEqual(index.search(unit(0, 1, 0), k=1)[0][0], "4")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import tempfile
+import time
+import unittest
+from service.code_index import CodeIndex, chunk_code
+from tests.fake_embeddings import BagOfWords
+
+
+bag_of_words = BagOfWords(["invoice", "total", "tax", "user", "login", "password", "render", "template"])
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        return bag_of_words(texts)
+
+
+class TestChunkCode(unittest.TestCase):
+    def test_small_file_is_one_chunk(self):
+        self.assertEqual(chunk_code("a = 1\nb = 2\n", 100), [(1, 2, "a = 1\nb = 2\n")])
+
+    def test_cuts_before_top_level_blocks(self):
+        text = "def a():\n    return 1\n\ndef b():\n    return 2\n\ndef c():\n    return 3\n"
+
+        chunks = chunk_code(text, 12, family="gpt")
+
+        self.assertEqual([chunk[0] for chunk in chunks], [1, 4, 7])
+        self.assertEqual("".join(chunk[2] for chunk in chunks), text)
+
+    def test_long_block_is_cut_at_lines(self):
+        text = "def a():\n" + "    x = 1\n" * 50
+
+        chunks = chunk_code(text, 20, family="gpt")
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunk[2] for chunk in chunks), text)
+        self.assertEqual(chunks[-1][1], 51)
+
+    def test_blank_chunks_are_dropped(self):
+        self.assertEqual(chunk_code("\n\n\n", 100), [])
+
+
+class TestCodeIndex(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.repo = os.path.join(tmpdir.name, "repo")
+        os.makedirs(os.path.join(self.repo, "node_modules"))
+        self.embedder = CountingEmbedder()
+        self.code_index = CodeIndex(os.path.join(tmpdir.name, "cache", "code"), lambda: self.embedder)
+        self.addCleanup(self.code_index.close)
+        self.write("billing.py", "def invoice_total(invoice):\n    return invoice.total + tax\n")
+        self.write("auth.py", "def user_login(user, password):\n    return check(password)\n")
+        self.write("node_modules/dep.js", "function invoice_total() {}\n")
+        self.write("notes.txt", "invoice total tax\n")
+
+    def write(self, name, text):
+        path = os.path.join(self.repo, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_indexes_source_files_and_retrieves_relevant_chunks(self):
+        counts = self.code_index.update(self.repo)
+
+        self.assertEqual(counts, {"indexed": 2, "unchanged": 0, "removed": 0})
+        chunks = self.code_index.retrieve("fix the tax in this invoice total")
+        self.assertEqual([os.path.basename(chunk["path"]) for chunk in chunks], ["billing.py"])
+        self.assertEqual((chunks[0]["start_line"], chunks[0]["end_line"]), (1, 2))
+
+    def test_update_only_reembeds_changed_files(self):
+        self.code_index.update(self.repo)
+        self.embedder.texts.clear()
+        path = self.write("auth.py", "def user_login(user, password):\n    return render(template)\n")
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        billing = os.path.join(self.repo, "billing.py")
+        os.utime(billing, (time.time() + 10, time.time() + 10))
+
+        counts = self.code_index.update(self.repo)
+
+        self.assertEqual(counts, {"indexed": 1, "unchanged": 1, "removed": 0})
+        self.assertEqual(len(self.embedder.texts), 1)
+        self.assertIn("render", self.code_index.retrieve("render template")[0]["text"])
+
+    def test_other_chunk_size_reindexes_every_file(self):
+        self.code_index.update(self.repo)
+        self.code_index.close()
+
+        code_index = CodeIndex(self.code_index.path, lambda: self.embedder, chunk_tokens=100)
+        self.addCleanup(code_index.close)
+        counts = code_index.update(self.repo)
+
+        self.assertEqual(counts, {"indexed": 2, "unchanged": 0, "removed": 0})
+        self.assertEqual(code_index.update(self.repo)["unchanged"], 2)
+
+    def test_deleted_files_are_dropped_and_vectors_compacted(self):
+        self.code_index.update(self.repo)
+        os.remove(os.path.join(self.repo, "billing.py"))
+        os.remove(os.path.join(self.repo, "auth.py"))
+        self.write("view.py", "def render(template):\n    pass\n")
+
+        counts = self.code_index.update(self.repo)
+
+        self.assertEqual(counts["removed"], 2)
+        self.assertEqual(self.code_index.retrieve("invoice total tax"), [])
+        self.assertEqual(len(self.code_index.index), len(self.code_index))
+
+    def test_skips_chunks_the_query_already_contains(self):
+        self.code_index.update(self.repo)
+        snippet = "def invoice_total(invoice):\n    return invoice.total + tax\n"
+
+        self.assertEqual(self.code_index.retrieve(snippet), [])
+
+    def test_respects_token_budget(self):
+        self.code_index.update(self.repo)
+
+        self.assertEqual(self.code_index.retrieve("invoice total tax", max_tokens=5), [])
+
+    def test_lost_vectors_are_reembedded_on_open(self):
+        self.code_index.update(self.repo)
+        os.remove(self.code_index.index.keys_file)
+        reopened = CodeIndex(self.code_index.path, lambda: bag_of_words)
+        self.addCleanup(reopened.close)
+
+        reopened.start()
+        self.assertTrue(reopened.wait_until_ready(5))
+
+        self.assertEqual(len(reopened.index), 2)
+        self.assertEqual(len(reopened.retrieve("user login password")), 1)
+
+    def test_format_context(self):
+        context = CodeIndex.format_context([{"path": "a.py", "start_line": 3, "end_line": 4, "text": "x = 1\n"}])
+
+        self.assertEqual(context, "Relevant code from the indexed repository:\n\na.py:3-4\n```\nx = 1\n```")
+        self.assertIsNone(CodeIndex.format_context([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import threading
+import unittest
+from unittest.mock import Mock
+from models.bedrock_models import ClaudeInvoker
+from models.gpt_models import ChatGPTModelInvoker
+from models.model_manager import INVOKE_ERROR
+from service.conversation_compactor import ConversationCompactor
+
+
+class TestConversationCompactor(unittest.TestCase):
+    def setUp(self):
+        self.model_manager = Mock()
+        self.model_manager.default_model = "claude"
+        self.model_manager.invoke_model.return_value = "- earlier facts"
+        self.compactor = ConversationCompactor(
+            self.model_manager, max_history_tokens=300, keep_recent_tokens=150, summary_model="llama",
+            min_recent_exchanges=1,
+        )
+
+    def add_exchanges(self, count, first=0):
+        for i in range(first, first + count):
+            self.compactor.add(f"question {i} " + "word " * 20, f"answer {i} " + "word " * 20, "response")
+
+    def test_small_history_is_kept_verbatim(self):
+        self.add_exchanges(2)
+
+        self.assertEqual(len(self.compactor), 2)
+        self.assertEqual(self.compactor.messages()[0]["role"], "user")
+        self.assertEqual(self.compactor.system_prompt("Answer."), "Answer.")
+        self.model_manager.invoke_model.assert_not_called()
+
+    def test_old_turns_are_folded_into_a_summary(self):
+        self.add_exchanges(6)
+        self.compactor.wait()
+
+        self.assertEqual(self.compactor.summary, "- earlier facts")
+        self.assertLessEqual(self.compactor.history_tokens(), 300)
+        self.assertEqual(self.compactor.turns[0]["role"], "user")
+        self.assertIn("earlier facts", self.compactor.system_prompt("Answer."))
+        kwargs = self.model_manager.invoke_model.call_args[1]
+        self.assertEqual(kwargs["model_name"], "llama")
+        prompt = self.model_manager.invoke_model.call_args[0][0]
+        self.assertIn("question 0", prompt)
+        self.assertNotIn("question 5", prompt)
+
+    def test_next_compaction_only_adds_new_turns(self):
+        self.add_exchanges(6)
+        self.compactor.wait()
+        self.add_exchanges(6, first=6)
+        self.compactor.wait()
+
+        prompt = self.model_manager.invoke_model.call_args[0][0]
+        self.assertIn("- earlier facts", prompt)
+        self.assertNotIn("question 0 ", prompt)
+
+    def test_messages_stay_in_budget_while_compaction_runs(self):
+        release = threading.Event()
+
+        def slow_summary(*args, **kwargs):
+            release.wait(5)
+            return "- summary"
+
+        self.model_manager.invoke_model.side_effect = slow_summary
+        self.add_exchanges(10)
+
+        messages = self.compactor.messages()
+        self.assertLess(len(messages), 20)
+        self.assertEqual(messages[0]["role"], "user")
+        release.set()
+        self.compactor.wait()
+
+    def test_failed_compaction_keeps_turns(self):
+        self.model_manager.invoke_model.side_effect = RuntimeError("down")
+        self.add_exchanges(4)
+        self.compactor.wait()
+
+        self.assertEqual(self.compactor.summary, "")
+        self.assertEqual(len(self.compactor), 4)
+
+    def test_failed_compaction_backs_off_and_reports_once(self):
+        self.model_manager.invoke_model.side_effect = RuntimeError("down")
+        self.add_exchanges(4)
+        self.compactor.wait()
+        self.add_exchanges(2, first=4)
+        self.compactor.wait()
+
+        self.assertEqual(self.model_manager.invoke_model.call_count, 1)
+        self.assertEqual(self.compactor.pop_error(), "Conversation compaction failed: down")
+        self.assertIsNone(self.compactor.pop_error())
+
+        self.model_manager.invoke_model.side_effect = None
+        self.compactor._retry_at = 0
+        self.add_exchanges(1, first=6)
+        self.compactor.wait()
+
+        self.assertEqual(self.compactor.summary, "- earlier facts")
+
+    def test_error_reply_counts_as_failure(self):
+        for reply in (INVOKE_ERROR, ClaudeInvoker.NO_RESPONSE, ChatGPTModelInvoker.NO_RESPONSE):
+            self.compactor.clear()
+            self.model_manager.invoke_model.return_value = reply
+            self.add_exchanges(6)
+            self.compactor.wait()
+
+            self.assertEqual(len(self.compactor), 6)
+            self.assertEqual(self.compactor.summary, "")
+            self.assertIsNotNone(self.compactor.pop_error())
+
+    def test_long_turns_are_folded_part_by_part(self):
+        self.compactor.add("paste " + "A long document line.\n" * 400, "noted", "response")
+        self.add_exchanges(2, first=1)
+        self.compactor.wait()
+
+        prompts = [call[0][0] for call in self.model_manager.invoke_model.call_args_list]
+        self.assertGreater(len(prompts), 1)
+        self.assertIn("- earlier facts", prompts[1])
+        self.assertEqual(self.compactor.summary, "- earlier facts")
+        self.assertNotIn("paste", self.compactor.turns[0]["content"])
+
+    def test_load_keeps_the_recent_tail_without_summarizing(self):
+        exchanges = [
+            {"user": f"question {i} " + "word " * 20, "assistant": f"answer {i} " + "word " * 20,
+             "command": "response", "timestamp": i}
+            for i in range(20)
+        ]
+
+        self.compactor.load(exchanges)
+        self.compactor.wait()
+
+        self.model_manager.invoke_model.assert_not_called()
+        self.assertEqual(self.compactor.summary, "")
+        self.assertLessEqual(self.compactor.history_tokens(), 150)
+        self.assertGreaterEqual(len(self.compactor), 1)
+        self.assertTrue(self.compactor.messages()[-1]["content"].startswith("answer 19"))
+        self.assertEqual(self.compactor.messages()[0]["role"], "user")
+
+    def test_clear(self):
+        self.add_exchanges(6)
+        self.compactor.wait()
+        self.compactor.clear()
+
+        self.assertEqual(len(self.compactor), 0)
+        self.assertEqual(self.compactor.summary, "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import time
+import unittest
+from service.exchange_retriever import ExchangeRetriever
+from service.session_store import SessionStore
+from tests.fake_embeddings import BagOfWords
+
+
+bag_of_words = BagOfWords(["docker", "build", "cache", "python", "asyncio", "loop", "sql", "index", "join"])
+
+
+class TestExchangeRetriever(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.store = SessionStore(os.path.join(self.tmpdir.name, "sessions.sqlite3"))
+        self.addCleanup(self.store.close)
+
+    def save(self, *exchanges, session_id="s1"):
+        for user, assistant in exchanges:
+            self.store.append(session_id, user, assistant)
+        self.store.flush()
+
+    def make_retriever(self, **kwargs):
+        retriever = ExchangeRetriever(self.store, lambda: bag_of_words, **kwargs).start()
+        self.assertTrue(retriever.wait_until_ready(5))
+        return retriever
+
+    def wait_for_index(self, retriever, count):
+        deadline = time.monotonic() + 5
+        while len(retriever.index) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(retriever.index), count)
+
+    def test_indexes_saved_exchanges_and_retrieves_relevant_ones(self):
+        self.save(
+            ("docker build cache", "use layers"),
+            ("sql index join", "add an index"),
+            ("python asyncio loop", "use asyncio.run"),
+        )
+        retriever = self.make_retriever()
+
+        exchanges = retriever.retrieve("why is my docker build cache slow?")
+
+        self.assertEqual([exchange["user"] for exchange in exchanges], ["docker build cache"])
+
+    def test_new_exchanges_are_indexed_as_they_are_saved(self):
+        retriever = self.make_retriever()
+        self.save(("sql index join", "add an index"), session_id="s2")
+        self.wait_for_index(retriever, 1)
+
+        self.assertEqual(retriever.retrieve("sql join")[0]["assistant"], "add an index")
+
+    def test_catches_up_with_exchanges_saved_while_off(self):
+        first = self.make_retriever()
+        self.save(("docker build", "a"))
+        self.wait_for_index(first, 1)
+        # Saved while no retriever follows the store
+        self.store.listeners.clear()
+        self.save(("sql join", "b"))
+
+        retriever = self.make_retriever()
+
+        self.assertEqual(retriever.index.keys(), ["1", "2"])
+        self.assertEqual(retriever.retrieve("sql join")[0]["assistant"], "b")
+
+    def test_exchanges_that_failed_to_index_are_retried(self):
+        calls = []
+
+        def flaky_embedder(texts):
+            calls.append(texts)
+            if len(calls) == 1:
+                raise RuntimeError("model busy")
+            return bag_of_words(texts)
+
+        retriever = ExchangeRetriever(self.store, lambda: flaky_embedder).start()
+        self.assertTrue(retriever.wait_until_ready(5))
+        self.save(("docker build", "a"))
+        deadline = time.monotonic() + 5
+        while not calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.save(("sql join", "b"))
+
+        self.wait_for_index(retriever, 2)
+        self.assertEqual(retriever.index.keys(), ["1", "2"])
+
+    def test_excluded_and_dissimilar_exchanges_are_skipped(self):
+        self.save(("docker build", "a"), ("docker cache", "b"), ("python loop", "c"))
+        retriever = self.make_retriever()
+
+        exchanges = retriever.retrieve("docker", exclude={"docker build"})
+
+        self.assertEqual([exchange["user"] for exchange in exchanges], ["docker cache"])
+
+    def test_results_fit_token_budget_oldest_first(self):
+        self.save(("docker build", "x" * 400), ("docker build cache", "short"), ("docker", "also short"))
+        retriever = self.make_retriever(max_tokens=50)
+
+        exchanges = retriever.retrieve("docker build cache")
+
+        self.assertEqual([exchange["user"] for exchange in exchanges], ["docker build cache", "docker"])
+
+    def test_returns_nothing_until_ready(self):
+        retriever = ExchangeRetriever(self.store, lambda: bag_of_words)
+
+        self.assertEqual(retriever.retrieve("docker"), [])
+
+    def test_format_context(self):
+        context = ExchangeRetriever.format_context([{"user": "q", "assistant": "a"}])
+
+        self.assertEqual(context, "Relevant earlier exchanges:\n\nUser: q\nAssistant: a")
+        self.assertIsNone(ExchangeRetriever.format_context([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
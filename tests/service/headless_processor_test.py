@@ -0,0 +1,63 @@
+import io
+import unittest
+from unittest.mock import Mock
+from service.headless_processor import HeadlessProcessor
+
+
+class TestHeadlessProcessor(unittest.TestCase):
+    def setUp(self):
+        self.mock_model_manager = Mock()
+        self.mock_model_manager.default_model = "claude"
+        self.mock_model_manager.is_streaming_supported.return_value = True
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.output = io.StringIO()
+        self.processor = HeadlessProcessor(self.mock_model_manager, output=self.output)
+
+    def test_streams_tokens_to_output(self):
+        self.mock_model_manager.invoke_model_stream.return_value = iter(["# Review", "\n\nLooks ", "good"])
+
+        result = self.processor.code_review("def f(): pass")
+
+        self.assertEqual(result, "# Review\n\nLooks good")
+        self.assertEqual(self.output.getvalue(), "# Review\n\nLooks good\n")
+        prompt = self.mock_model_manager.invoke_model_stream.call_args[0][0]
+        self.assertIn("def f(): pass", prompt)
+
+    def test_writes_blocking_response_when_streaming_unsupported(self):
+        self.mock_model_manager.is_streaming_supported.return_value = False
+        self.mock_model_manager.invoke_model.return_value = "Summary"
+
+        result = self.processor.summarize_text("long text")
+
+        self.assertEqual(result, "Summary")
+        self.assertEqual(self.output.getvalue(), "Summary\n")
+        self.mock_model_manager.invoke_model_stream.assert_not_called()
+
+    def test_reuses_similar_answer_only_in_return_mode(self):
+        self.mock_model_manager.find_similar_answer.return_value = ("Cached review", 0.97)
+        self.mock_model_manager.semantic_cache_mode = "return"
+
+        result = self.processor.code_review("def f(): pass")
+
+        self.assertEqual(result, "Cached review")
+        self.assertEqual(self.output.getvalue(), "Cached review\n")
+        self.mock_model_manager.invoke_model_stream.assert_not_called()
+
+    def test_ignores_similar_answer_in_offer_mode(self):
+        self.mock_model_manager.find_similar_answer.return_value = ("Cached review", 0.97)
+        self.mock_model_manager.semantic_cache_mode = "offer"
+        self.mock_model_manager.invoke_model_stream.return_value = iter(["Fresh"])
+
+        result = self.processor.code_review("def f(): pass")
+
+        self.assertEqual(result, "Fresh")
+        self.mock_model_manager.remember_answer.assert_called_once_with("code_review", "def f(): pass", "Fresh")
+
+    def test_null_echoes_input(self):
+        self.assertEqual(self.processor.null("as is"), "as is")
+        self.assertEqual(self.output.getvalue(), "as is")
+        self.mock_model_manager.invoke_model.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
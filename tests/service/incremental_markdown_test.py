@@ -0,0 +1,119 @@
+import unittest
+from io import StringIO
+from unittest.mock import patch
+from rich.console import Console
+from rich.markdown import Markdown
+from service import incremental_markdown
+from service.incremental_markdown import IncrementalMarkdownRenderer, MarkdownTailView
+
+
+SAMPLE_MARKDOWN = """# Title
+
+Some paragraph text
+continues here.
+
+- item one
+- item two
+
+- item three
+  continued
+
+## Sub
+
+```python
+def f():
+
+    return 1
+```
+
+1. first
+2. second
+
+Final paragraph"""
+
+
+def render_to_text(renderable, width=60):
+    console = Console(file=StringIO(), width=width, color_system=None)
+    console.print(renderable)
+    return console.file.getvalue()
+
+
+class TestIncrementalMarkdownRenderer(unittest.TestCase):
+    def feed_in_chunks(self, text, size=3):
+        renderer = IncrementalMarkdownRenderer()
+        for i in range(0, len(text), size):
+            renderer.feed(text[i:i + size])
+        return renderer
+
+    def test_text_accumulates_chunks(self):
+        renderer = self.feed_in_chunks(SAMPLE_MARKDOWN)
+        self.assertEqual(renderer.text, SAMPLE_MARKDOWN)
+
+    def test_completed_blocks(self):
+        renderer = self.feed_in_chunks(SAMPLE_MARKDOWN)
+        self.assertEqual(renderer.completed_blocks, [
+            "# Title",
+            "Some paragraph text\ncontinues here.",
+            "- item one\n- item two\n\n- item three\n  continued",
+            "## Sub",
+            "```python\ndef f():\n\n    return 1\n```",
+        ])
+        self.assertEqual(renderer.open_block, "1. first\n2. second\n\nFinal paragraph")
+
+    def test_close_completes_open_block(self):
+        renderer = self.feed_in_chunks(SAMPLE_MARKDOWN)
+        renderer.close()
+        self.assertEqual(renderer.completed_blocks[-2:], ["1. first\n2. second", "Final paragraph"])
+        self.assertEqual(renderer.open_block, "")
+
+    def test_unterminated_fence_stays_open(self):
+        renderer = self.feed_in_chunks("Intro\n\n```\ncode\n\nmore code\n")
+        self.assertEqual(renderer.completed_blocks, ["Intro"])
+        self.assertEqual(renderer.open_block, "```\ncode\n\nmore code")
+
+    def test_matches_full_markdown_render(self):
+        renderer = self.feed_in_chunks(SAMPLE_MARKDOWN)
+        self.assertEqual(render_to_text(renderer), render_to_text(Markdown(SAMPLE_MARKDOWN)))
+        renderer.close()
+        self.assertEqual(render_to_text(renderer), render_to_text(Markdown(SAMPLE_MARKDOWN)))
+
+    def test_completed_blocks_parsed_once(self):
+        renderer = IncrementalMarkdownRenderer()
+        renderer.feed("First paragraph\n\nSecond paragraph\n\nThi")
+        with patch('service.incremental_markdown.Markdown', wraps=Markdown) as mock_markdown:
+            renderer.feed("rd")
+            render_to_text(renderer)
+            render_to_text(renderer)
+        # Only the open trailing block is re-parsed on each frame
+        self.assertEqual([c.args[0] for c in mock_markdown.call_args_list], ["Third", "Third"])
+
+
+class TestMarkdownTailView(unittest.TestCase):
+    def test_renders_only_visible_tail(self):
+        renderer = IncrementalMarkdownRenderer()
+        for i in range(200):
+            renderer.feed(f"Paragraph {i}\n\n")
+        console = Console(file=StringIO(), width=40, height=5, color_system=None)
+
+        with patch('service.incremental_markdown._render_markdown_lines',
+                   wraps=incremental_markdown._render_markdown_lines) as mock_render:
+            console.print(MarkdownTailView(renderer))
+
+        # The open block plus two completed blocks fill five lines; nothing
+        # further up is laid out
+        self.assertEqual(mock_render.call_count, 3)
+        output = console.file.getvalue().splitlines()
+        self.assertEqual(len(output), 5)
+        self.assertIn("earlier output above", output[0])
+        self.assertEqual(output[-1].strip(), "Paragraph 199")
+
+    def test_short_response_not_truncated(self):
+        renderer = IncrementalMarkdownRenderer()
+        renderer.feed("One\n\nTwo")
+        console = Console(file=StringIO(), width=40, height=10, color_system=None)
+        console.print(MarkdownTailView(renderer))
+        self.assertEqual([line.strip() for line in console.file.getvalue().splitlines()], ["One", "", "Two"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+import unittest
+from unittest.mock import patch, Mock
+from models.token_budget import BudgetCheck, estimate_tokens
+from service.live_markdown_processor import LiveMarkdownProcessor
+from service.map_reduce_summarizer import REDUCE_SYSTEM
+
+
+class TestLiveMarkdownProcessor(unittest.TestCase):
+    def setUp(self):
+        self.mock_model_manager = Mock()
+        self.mock_model_manager.default_model = "claude"
+        self.mock_model_manager.is_streaming_supported.return_value = True
+        self.mock_model_manager.preflight.return_value = BudgetCheck("claude", 10, 100, context_window=1000)
+        self.mock_model_manager.budget_policy = "chunk"
+        self.processor = LiveMarkdownProcessor(self.mock_model_manager)
+
+        live_patcher = patch('service.live_markdown_processor.Live')
+        self.mock_live = live_patcher.start().return_value.__enter__.return_value
+        self.addCleanup(live_patcher.stop)
+        rprint_patcher = patch('service.live_markdown_processor.rprint')
+        rprint_patcher.start()
+        self.addCleanup(rprint_patcher.stop)
+
+    def test_stream_returns_full_text(self):
+        self.mock_model_manager.invoke_model_stream.return_value = iter(["# Hi", "\n\nthere", " friend"])
+
+        result = self.processor._stream_with_live_markdown("prompt", "Title")
+
+        self.assertEqual(result, "# Hi\n\nthere friend")
+        self.mock_model_manager.invoke_model_stream.assert_called_once_with("prompt", command=None)
+        self.mock_model_manager.invoke_model.assert_not_called()
+        final_panel = self.mock_live.update.call_args[0][0]
+        self.assertIn("Complete", final_panel.title)
+
+    def test_interrupted_stream_is_resumed(self):
+        def chunks():
+            yield "The answer "
+            raise ConnectionError("stream dropped")
+
+        self.mock_model_manager.invoke_model_stream.return_value = chunks()
+        self.mock_model_manager.resume_model_stream.return_value = iter(["is ", "42."])
+
+        result = self.processor._stream_with_live_markdown("prompt", "Title", command="response")
+
+        self.assertEqual(result, "The answer is 42.")
+        self.mock_model_manager.resume_model_stream.assert_called_once_with(
+            "prompt", "The answer ", command="response", model_name=None
+        )
+        self.mock_model_manager.invoke_model.assert_not_called()
+
+    def test_stream_error_falls_back_when_resume_unsupported(self):
+        def chunks():
+            yield "partial"
+            raise ConnectionError("stream dropped")
+
+        self.mock_model_manager.invoke_model_stream.return_value = chunks()
+        self.mock_model_manager.resume_model_stream.return_value = None
+        self.mock_model_manager.invoke_model.return_value = "full response"
+
+        with patch.object(self.processor, '_display_final_markdown') as mock_display:
+            result = self.processor._stream_with_live_markdown("prompt", "Title")
+
+        self.assertEqual(result, "full response")
+        mock_display.assert_called_once_with("full response")
+
+    def test_streaming_not_supported(self):
+        self.mock_model_manager.is_streaming_supported.return_value = False
+        self.mock_model_manager.invoke_model.return_value = "blocking response"
+
+        with patch.object(self.processor, '_display_final_markdown') as mock_display:
+            result = self.processor._stream_with_live_markdown("prompt", "Title")
+
+        self.assertEqual(result, "blocking response")
+        self.mock_model_manager.invoke_model_stream.assert_not_called()
+        mock_display.assert_called_once_with("blocking response")
+
+    def test_offers_similar_answer_and_reuses_it(self):
+        self.mock_model_manager.find_similar_answer.return_value = ("cached answer", 0.95)
+        self.mock_model_manager.semantic_cache_mode = "offer"
+        self.processor.console = Mock()
+        self.processor.console.input.return_value = ""
+
+        with patch.object(self.processor, '_display_final_markdown') as mock_display:
+            result = self.processor.list_typos("teh text")
+
+        self.assertEqual(result, "cached answer")
+        self.mock_model_manager.find_similar_answer.assert_called_once_with("list_typos", "teh text")
+        self.mock_model_manager.invoke_model_stream.assert_not_called()
+        mock_display.assert_called_once_with("cached answer")
+
+    def test_declined_similar_answer_streams_and_remembers(self):
+        self.mock_model_manager.find_similar_answer.return_value = ("cached answer", 0.95)
+        self.mock_model_manager.semantic_cache_mode = "offer"
+        self.mock_model_manager.invoke_model_stream.return_value = iter(["fresh"])
+        self.processor.console = Mock()
+        self.processor.console.input.return_value = "n"
+
+        result = self.processor.list_typos("teh text")
+
+        self.assertEqual(result, "fresh")
+        self.mock_model_manager.remember_answer.assert_called_once_with("list_typos", "teh text", "fresh")
+
+    def test_racing_block_races_the_request(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.mock_model_manager.race_model_stream.return_value = iter(["fast"])
+
+        with self.processor.racing():
+            result = self.processor.code_review("code")
+
+        self.assertEqual(result, "fast")
+        self.mock_model_manager.race_model_stream.assert_called_once()
+        self.mock_model_manager.invoke_model_stream.assert_not_called()
+        self.assertFalse(self.processor._racing)
+
+    def test_race_commands_are_always_raced(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.mock_model_manager.race_model_stream.return_value = iter(["fast"])
+        self.processor.race_commands = {"list_typos"}
+
+        self.processor.list_typos("text")
+        self.processor.reword("text")
+
+        self.assertEqual(self.mock_model_manager.race_model_stream.call_count, 1)
+        self.mock_model_manager.invoke_model_stream.assert_called_once()
+
+    def test_raced_request_is_budgeted_for_the_smallest_window(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.mock_model_manager.race_model_stream.return_value = iter(["fast"])
+        self.mock_model_manager.race_budget_model.return_value = "openai"
+        self.processor.race_commands = {"reword"}
+
+        self.processor.reword("text")
+
+        self.assertEqual(self.mock_model_manager.preflight.call_args[1]["model_name"], "openai")
+
+    def test_router_selects_model_and_max_tokens(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.mock_model_manager.invoke_model_stream.return_value = iter(["ok"])
+        self.processor.router = Mock()
+        self.processor.router.route.return_value = {"model_name": "openai", "max_tokens": 512}
+
+        self.processor.list_typos("teh text")
+
+        self.mock_model_manager.is_streaming_supported.assert_called_with("openai")
+        self.mock_model_manager.invoke_model_stream.assert_called_once_with(
+            "teh text", command="list_typos", model_name="openai", max_tokens=512,
+            system=LiveMarkdownProcessor.COMMAND_PROMPTS["list_typos"][1],
+        )
+
+    def test_code_commands_get_indexed_code_as_context(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.mock_model_manager.invoke_model_stream.return_value = iter(["ok"])
+        self.processor.code_index = Mock(max_tokens=3000)
+        self.processor.code_index.retrieve.return_value = ["chunk"]
+        self.processor.code_index.format_context.return_value = "related code"
+
+        self.processor.code_review("def f(): pass")
+        self.processor.reword("some text")
+
+        # The context window leaves 1000 - 100 - 10 tokens for it
+        self.processor.code_index.retrieve.assert_called_once_with("def f(): pass", max_tokens=890, family="claude")
+        first, second = self.mock_model_manager.invoke_model_stream.call_args_list
+        self.assertEqual(first[1]["context"], "related code")
+        self.assertNotIn("context", second[1])
+
+    def test_code_context_uses_configured_budget_without_context_window(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.mock_model_manager.invoke_model_stream.return_value = iter(["ok"])
+        self.mock_model_manager.preflight.return_value = BudgetCheck("claude", 10, 100)
+        self.processor.code_index = Mock(max_tokens=3000)
+        self.processor.code_index.retrieve.return_value = []
+
+        self.processor.code_review("def f(): pass")
+
+        self.processor.code_index.retrieve.assert_called_once_with("def f(): pass", max_tokens=3000, family="claude")
+
+    def budget_by_length(self, context_window=400):
+        def preflight(prompt, system=None, context=None, messages=None, **kwargs):
+            text = "\n\n".join(part for part in (system, context, prompt) if part)
+            return BudgetCheck("claude", estimate_tokens(text, "claude"), 100, context_window=context_window)
+
+        self.mock_model_manager.preflight.side_effect = preflight
+
+    def test_oversized_input_is_processed_in_chunks(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.budget_by_length()
+        self.mock_model_manager.invoke_model_stream.side_effect = lambda *args, **kwargs: iter(["part"])
+        text = "A paragraph of text. " * 40 + "\n\n" + "Another paragraph. " * 40
+
+        result = self.processor.summarize_text(text)
+
+        calls = self.mock_model_manager.invoke_model_stream.call_args_list
+        self.assertGreater(len(calls), 1)
+        self.assertEqual(result, "\n\n".join(["part"] * len(calls)))
+        for call in calls:
+            self.assertTrue(call[1]["system"].startswith("Summarize"))
+            self.assertIn(call[0][0], text)
+        self.mock_model_manager.remember_answer.assert_called_once_with("summarize", text, result)
+
+    def test_chunks_leave_room_for_the_code_context(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.budget_by_length(context_window=1200)
+        self.mock_model_manager.invoke_model_stream.side_effect = lambda *args, **kwargs: iter(["part"])
+        self.processor.code_index = Mock(max_tokens=3000)
+        self.processor.code_index.retrieve.return_value = [{"text": "context"}]
+        self.processor.code_index.format_context.return_value = "indexed code " * 150
+        text = "def f():\n    return 1\n\n" * 120
+
+        self.processor.code_review(text)
+
+        calls = self.mock_model_manager.invoke_model_stream.call_args_list
+        self.assertGreater(len(calls), 1)
+        for call in calls:
+            self.assertTrue(self.mock_model_manager.preflight(call[0][0], **call[1]).fits)
+
+    def test_oversized_input_is_rejected_under_reject_policy(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.mock_model_manager.preflight.return_value = BudgetCheck("claude", 5000, 100, context_window=400)
+        self.mock_model_manager.budget_policy = "reject"
+
+        self.assertIsNone(self.processor.summarize_text("text"))
+        self.mock_model_manager.invoke_model_stream.assert_not_called()
+
+    def test_large_document_is_map_reduced(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.mock_model_manager.invoke_model_stream.return_value = iter(["combined"])
+        self.processor.summarizer = Mock()
+        self.processor.summarizer.should_map_reduce.return_value = True
+        self.processor.summarizer.summarize_parts.return_value = ["one", "two"]
+        self.processor.summarizer.reduce_prompt.return_value = "reduce prompt"
+
+        result = self.processor.summarize_text("huge document")
+
+        self.assertEqual(result, "combined")
+        self.mock_model_manager.invoke_model_stream.assert_called_once_with(
+            "reduce prompt", command="summarize", system=REDUCE_SYSTEM
+        )
+        self.mock_model_manager.remember_answer.assert_called_once_with("summarize", "huge document", "combined")
+
+    def test_oversized_reduce_prompt_is_rejected(self):
+        self.mock_model_manager.find_similar_answer.return_value = None
+        self.mock_model_manager.preflight.return_value = BudgetCheck("claude", 5000, 100, context_window=400)
+        self.processor.summarizer = Mock()
+        self.processor.summarizer.should_map_reduce.return_value = True
+        self.processor.summarizer.summarize_parts.return_value = ["one", "two"]
+        self.processor.summarizer.reduce_prompt.return_value = "reduce prompt"
+
+        with patch.object(self.processor, '_show_error') as show_error:
+            self.assertIsNone(self.processor.summarize_text("huge document"))
+
+        self.assertEqual(show_error.call_args[0][0].check.input_tokens, 5000)
+        self.mock_model_manager.preflight.assert_called_once_with("reduce prompt", system=REDUCE_SYSTEM)
+        self.mock_model_manager.invoke_model_stream.assert_not_called()
+        self.mock_model_manager.remember_answer.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
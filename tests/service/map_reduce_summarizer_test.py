@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock
+from models.bedrock_models import ClaudeInvoker
+from models.model_manager import INVOKE_ERROR
+from models.token_budget import BudgetCheck
+from service.map_reduce_summarizer import MapReduceSummarizer, build_summarizer
+
+
+class TestMapReduceSummarizer(unittest.TestCase):
+    def setUp(self):
+        self.model_manager = Mock()
+        self.model_manager.default_model = "claude"
+        self.model_manager.preflight.return_value = BudgetCheck("claude", 0, 100, context_window=100000)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        async def ainvoke(prompt, **kwargs):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return "summary of " + prompt.split(":")[0]
+
+        self.model_manager.ainvoke = AsyncMock(side_effect=ainvoke)
+        self.summarizer = MapReduceSummarizer(
+            self.model_manager, chunk_tokens=150, max_parallel=3, min_input_tokens=150
+        )
+        self.document = "\n\n".join(f"# Section {i}\n\n" + "Some words here. " * 20 for i in range(10))
+
+    def test_small_text_is_not_map_reduced(self):
+        self.assertFalse(self.summarizer.should_map_reduce("short text"))
+        self.assertTrue(self.summarizer.should_map_reduce(self.document))
+
+    def test_parts_are_summarized_concurrently_in_order(self):
+        progress = []
+
+        summaries = self.summarizer.summarize_parts(self.document, on_progress=lambda done, total: progress.append(done))
+
+        self.assertEqual(len(summaries), 10)
+        self.assertEqual(summaries[0], "summary of Part 1 of 10")
+        self.assertEqual(summaries[-1], "summary of Part 10 of 10")
+        self.assertEqual(self.max_in_flight, 3)
+        self.assertEqual(progress, list(range(1, 11)))
+
+    def test_failed_part_is_noted(self):
+        calls = []
+
+        async def ainvoke(prompt, **kwargs):
+            calls.append(prompt)
+            if len(calls) == 2:
+                raise RuntimeError("throttled")
+            return "ok"
+
+        self.model_manager.ainvoke = AsyncMock(side_effect=ainvoke)
+
+        summaries = self.summarizer.summarize_parts(self.document)
+
+        self.assertIn("could not be summarized: throttled", summaries[1])
+        self.assertEqual(summaries[0], "ok")
+
+    def test_error_string_counts_as_failed_part(self):
+        replies = iter(["ok", INVOKE_ERROR, ClaudeInvoker.NO_RESPONSE] + ["ok"] * 7)
+        self.model_manager.ainvoke = AsyncMock(side_effect=lambda prompt, **kwargs: next(replies))
+
+        summaries = self.summarizer.summarize_parts(self.document)
+
+        self.assertEqual(summaries[0], "ok")
+        self.assertEqual(summaries[1], f"[Part 2 could not be summarized: {INVOKE_ERROR}]")
+        self.assertIn("could not be summarized", summaries[2])
+
+    def test_long_summaries_are_summarized_again(self):
+        self.model_manager.ainvoke = AsyncMock(return_value="Long summary. " * 30)
+
+        self.summarizer.summarize_parts(self.document)
+
+        self.assertGreater(self.model_manager.ainvoke.call_count, 10)
+
+    def test_reduce_prompt_numbers_the_parts(self):
+        prompt = self.summarizer.reduce_prompt(["first", "second"])
+        self.assertIn("## Part 1\n\nfirst", prompt)
+        self.assertIn("## Part 2\n\nsecond", prompt)
+
+    def test_summarize_invokes_the_reduce_pass(self):
+        self.model_manager.invoke_model.return_value = "final"
+
+        self.assertEqual(self.summarizer.summarize(self.document), "final")
+        self.assertIn("## Part 10", self.model_manager.invoke_model.call_args[0][0])
+
+    def test_build_summarizer(self):
+        self.assertIsNone(build_summarizer({"map_reduce": {"enabled": False}}, self.model_manager))
+        summarizer = build_summarizer({"map_reduce": {"max_parallel": 2}}, self.model_manager)
+        self.assertEqual(summarizer.max_parallel, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+import unittest
+from service.session_store import SessionStore
+
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "sessions.sqlite3")
+        self.store = SessionStore(self.path)
+        self.addCleanup(self.store.close)
+
+    def test_exchanges_round_trip_in_order(self):
+        self.store.append("abc123", "first question", "first answer", "response")
+        self.store.append("abc123", "second question", "second answer " * 100)
+        self.store.flush()
+
+        exchanges = self.store.exchanges("abc123")
+        self.assertEqual([e["user"] for e in exchanges], ["first question", "second question"])
+        self.assertEqual(exchanges[1]["assistant"], "second answer " * 100)
+        self.assertEqual(exchanges[0]["command"], "response")
+
+    def test_sessions_newest_first(self):
+        self.store.append("older", "  an old\nquestion  ", "answer")
+        self.store.flush()
+        time.sleep(0.01)
+        self.store.append("newer", "a new question", "answer")
+        self.store.append("newer", "another", "answer")
+        self.store.flush()
+
+        sessions = self.store.sessions()
+        self.assertEqual([s["id"] for s in sessions], ["newer", "older"])
+        self.assertEqual(sessions[0]["exchanges"], 2)
+        self.assertEqual(sessions[0]["title"], "a new question")
+
+    def test_resolve_prefix(self):
+        self.store.append("abc123", "q", "a")
+        self.store.append("abd456", "q", "a")
+        self.store.flush()
+
+        self.assertEqual(self.store.resolve("abc"), "abc123")
+        self.assertEqual(self.store.resolve("abc123"), "abc123")
+        self.assertIsNone(self.store.resolve("ab"))
+        self.assertIsNone(self.store.resolve("zzz"))
+
+    def test_search_matches_user_text_and_responses(self):
+        self.store.append("one", "How do I configure boto3 retries?", "Use botocore Config.")
+        self.store.append("two", "Explain asyncio", "An event loop runs coroutines with retries.")
+        self.store.flush()
+
+        self.assertEqual([r["session_id"] for r in self.store.search("retries")], ["two", "one"])
+        self.assertEqual([r["session_id"] for r in self.store.search("boto3 retries")], ["one"])
+        self.assertEqual(self.store.search("missing"), [])
+        self.assertEqual(self.store.search('"*'), [])
+
+    def test_listeners_and_lookups_by_id(self):
+        saved = []
+        self.store.listeners.append(saved.append)
+        for i in range(3):
+            self.store.append("abc123", f"question {i}", f"answer {i}")
+        self.store.flush()
+
+        self.assertEqual([e["user"] for e in saved], ["question 0", "question 1", "question 2"])
+        self.assertEqual(self.store.exchanges_since(saved[0]["id"]), saved[1:])
+        self.assertEqual(self.store.exchanges_by_id([saved[2]["id"], saved[0]["id"]]), [saved[0], saved[2]])
+        self.assertEqual(self.store.exchanges_by_id([]), [])
+
+    def test_history_survives_reopening(self):
+        self.store.append("abc123", "question", "answer")
+        self.store.close()
+
+        store = SessionStore(self.path)
+        self.addCleanup(store.close)
+        self.assertEqual(store.exchanges("abc123")[0]["assistant"], "answer")
+        self.assertEqual(len(store.search("question")), 1)
+
+    def test_search_and_listing_use_indexes_with_many_exchanges(self):
+        for i in range(20000):
+            self.store.append(f"s{i // 50}", f"question {i} about topic{i % 1000}", f"answer {i}")
+        self.store.flush()
+
+        results = self.store.search("topic42")
+        sessions = self.store.sessions()
+        plan = " ".join(str(row) for row in self.store._connection.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM sessions ORDER BY updated_at DESC LIMIT 20"
+        ))
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results[0]["user"], "question 19042 about topic42")
+        self.assertEqual(len(sessions), 20)
+        self.assertEqual(sessions[0]["id"], "s399")
+        self.assertIn("sessions_updated_at", plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from models.token_budget import estimate_tokens
+from service.text_chunker import split_text
+
+
+class TestTextChunker(unittest.TestCase):
+    def test_small_text_is_one_chunk(self):
+        self.assertEqual(split_text("hello world", 100), ["hello world"])
+        self.assertEqual(split_text("  \n", 100), [])
+
+    def test_chunks_fit_and_keep_sections_together(self):
+        section = "# Title\n\n" + "A sentence here. " * 30 + "\n\n"
+        text = section * 6
+
+        chunks = split_text(text, 300)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), 300)
+            self.assertTrue(chunk.startswith("# Title"))
+
+    def test_long_line_is_cut_at_spaces(self):
+        chunks = split_text("word " * 5000, 500)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), 500)
+            self.assertEqual(set(chunk.split()), {"word"})
+        self.assertEqual(sum(chunk.count("word") for chunk in chunks), 5000)
+
+    def test_text_without_spaces_is_cut_anyway(self):
+        chunks = split_text("x" * 10000, 500)
+        self.assertEqual("".join(chunks), "x" * 10000)
+        self.assertTrue(all(estimate_tokens(chunk) <= 500 for chunk in chunks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,6 +23,14 @@ class TestTextProcessor(unittest.TestCase):
         self.assertIn(input_text, call_args)
         self.assertIn("summarize", call_args.lower())
 
+    def test_summarize_large_text_uses_map_reduce(self):
+        self.text_processor.summarizer = Mock()
+        self.text_processor.summarizer.should_map_reduce.return_value = True
+        self.text_processor.summarizer.summarize.return_value = "Combined summary"
+
+        self.assertEqual(self.text_processor.summarize_text("huge"), "Combined summary")
+        self.mock_model_manager.invoke_model.assert_not_called()
+
     def test_critical_response(self):
         input_text = "This is a test text."
         expected_response = "Critical analysis"
@@ -0,0 +1,45 @@
+import threading
+import unittest
+from service.utils.stream_reader import StreamReader
+
+
+class TestStreamReader(unittest.TestCase):
+    def test_drains_all_chunks(self):
+        reader = StreamReader(iter(["a", "b", "c"])).start()
+        reader.wait_for_finish(timeout=1)
+        self.assertTrue(reader.done)
+        self.assertEqual(reader.take(), ["a", "b", "c"])
+        self.assertEqual(reader.take(), [])
+        self.assertIsNone(reader.error)
+
+    def test_take_returns_only_new_chunks(self):
+        release = threading.Event()
+
+        def chunks():
+            yield "first"
+            release.wait(timeout=1)
+            yield "second"
+
+        reader = StreamReader(chunks()).start()
+        self.assertTrue(reader.wait_for_data(timeout=1))
+        self.assertEqual(reader.take(), ["first"])
+        self.assertFalse(reader.done)
+        release.set()
+        reader.wait_for_finish(timeout=1)
+        self.assertEqual(reader.take(), ["second"])
+
+    def test_captures_errors(self):
+        def chunks():
+            yield "partial"
+            raise ConnectionError("stream dropped")
+
+        reader = StreamReader(chunks()).start()
+        reader.join(timeout=1)
+        self.assertTrue(reader.done)
+        self.assertTrue(reader.wait_for_data(timeout=0))
+        self.assertEqual(reader.take(), ["partial"])
+        self.assertIsInstance(reader.error, ConnectionError)
+
+
+if __name__ == '__main__':
+    unittest.main()